@@ -0,0 +1,144 @@
+"""
+Measures the memory allocated by the retry machinery with tracemalloc: the size of the attempts kept alive and the
+peak of the transient allocations of a call which succeeds at the first try. Gates regressions against a baseline.
+
+    python -m benchmarks.bench_allocations                    # prints the results, Python 3.9+ for reset_peak
+    python -m benchmarks.bench_allocations --json out.json    # writes them as JSON too
+    python -m benchmarks.bench_allocations --check            # exits with 1 if a scenario regressed vs the baseline
+    python -m benchmarks.bench_allocations --save-baseline    # stores the results as the new baseline
+
+The allocations hardly vary from run to run but do across Python versions: the scenarios are checked only against
+a baseline taken with the same implementation and minor version.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import tracemalloc
+
+from toughpy.attempt import Attempt
+from toughpy.retry import Retry
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), 'allocations_baseline.json')
+DEFAULT_THRESHOLD = 0.1  # a scenario regresses when it allocates more than 10% over the baseline
+ATTEMPTS = 10000
+CALLS = 10000
+
+
+def _succeed(x):
+    return x
+
+
+def _fail():
+    raise ValueError()
+
+
+def retained_bytes_per_attempt(fn, *args):
+    attempts = []
+    before = tracemalloc.get_traced_memory()[0]
+    for _ in range(ATTEMPTS):
+        attempts.append(Attempt.try_first(fn, *args))
+    retained = tracemalloc.get_traced_memory()[0] - before
+    return float(retained) / ATTEMPTS
+
+
+def peak_bytes_per_call(policy):
+    total = 0
+    for _ in range(CALLS):
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        policy.execute(_succeed, 1)
+        total += tracemalloc.get_traced_memory()[1] - before
+    return float(total) / CALLS
+
+
+def run():
+    policy = Retry(backoff=0)
+    policy.execute(_succeed, 1)  # warm up the metrics of the command
+
+    gc.disable()
+    tracemalloc.start()
+    try:
+        results = {
+            'retained_per_successful_attempt': retained_bytes_per_attempt(_succeed, 1),
+            'retained_per_failed_attempt': retained_bytes_per_attempt(_fail),
+            'peak_per_first_try_success': peak_bytes_per_call(policy)
+        }
+    finally:
+        tracemalloc.stop()
+        gc.enable()
+
+    return {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'scenarios': {name: {'bytes': round(size, 1)} for name, size in results.items()}
+    }
+
+
+def _same_python(results, baseline):
+    return (results['implementation'] == baseline.get('implementation') and
+            results['python'].split('.')[:2] == baseline.get('python', '').split('.')[:2])
+
+
+def find_regressions(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """Returns the names and the bytes, now and in the baseline, of the scenarios which regressed."""
+    regressions = []
+    for name, result in results['scenarios'].items():
+        base = baseline['scenarios'].get(name)
+        if base is not None and result['bytes'] > base['bytes'] * (1 + threshold):
+            regressions.append((name, result['bytes'], base['bytes']))
+
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Measures the memory allocated by the retry machinery.')
+    parser.add_argument('--json', metavar='PATH', help='writes the results to PATH')
+    parser.add_argument('--baseline', metavar='PATH', default=DEFAULT_BASELINE)
+    parser.add_argument('--check', action='store_true', help='fails if a scenario regressed vs the baseline')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD)
+    parser.add_argument('--save-baseline', action='store_true', help='stores the results as the baseline')
+    args = parser.parse_args(argv)
+
+    results = run()
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    print('%-40s %12s %12s %8s' % ('scenario', 'bytes', 'baseline', 'change'))
+    for name, result in results['scenarios'].items():
+        base = baseline['scenarios'].get(name) if baseline is not None else None
+        if base is None:
+            print('%-40s %12.1f' % (name, result['bytes']))
+        else:
+            change = (result['bytes'] / base['bytes'] - 1) * 100 if base['bytes'] else 0.0
+            print('%-40s %12.1f %12.1f %+7.1f%%' % (name, result['bytes'], base['bytes'], change))
+
+    for path in filter(None, [args.json, args.baseline if args.save_baseline else None]):
+        with open(path, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write('\n')
+
+    if args.check:
+        if baseline is None:
+            print('No baseline at %s' % args.baseline)
+            return 1
+        if not _same_python(results, baseline):
+            print('Not checked: the baseline was taken with %s %s' % (baseline.get('implementation'),
+                                                                      baseline.get('python')))
+            return 0
+
+        regressions = find_regressions(results, baseline, args.threshold)
+        for name, size, base_size in regressions:
+            print('REGRESSION %s: %.1f bytes, %.1f in the baseline' % (name, size, base_size))
+
+        return 1 if regressions else 0
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
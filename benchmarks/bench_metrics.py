@@ -0,0 +1,49 @@
+"""
+Measures the throughput of RetryMetrics increments under a growing number of threads.
+
+    python -m benchmarks.bench_metrics
+"""
+import threading
+import time
+
+from toughpy.metrics import RetryMetrics
+from toughpy.attempt import Attempt
+
+INCREMENTS_PER_THREAD = 200000
+THREAD_COUNTS = [1, 2, 4, 8, 16, 32, 64]
+
+
+# noinspection PyProtectedMember
+def measure(thread_count):
+    rm = RetryMetrics('bench')
+    attempt = Attempt(1)
+    barrier = threading.Barrier(thread_count + 1)
+
+    def worker():
+        barrier.wait()
+        for _ in range(INCREMENTS_PER_THREAD):
+            rm._increment_successful_calls(attempt)
+
+    threads = [threading.Thread(target=worker) for _ in range(thread_count)]
+    for t in threads:
+        t.start()
+
+    barrier.wait()
+    started = time.perf_counter()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    total = thread_count * INCREMENTS_PER_THREAD
+    assert rm.snapshot().total_calls == total, 'lost increments'
+    return total / elapsed
+
+
+def main():
+    print('%8s %16s' % ('threads', 'increments/s'))
+    for thread_count in THREAD_COUNTS:
+        print('%8d %16.0f' % (thread_count, measure(thread_count)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,225 @@
+"""
+Measures the overhead of Retry against a raw call of the same function, and gates regressions against a baseline.
+
+    python -m benchmarks.bench_retry                    # prints the results
+    python -m benchmarks.bench_retry --json out.json    # writes them as JSON too
+    python -m benchmarks.bench_retry --check            # exits with 1 if a scenario regressed vs the baseline
+    python -m benchmarks.bench_retry --save-baseline    # stores the results as the new baseline
+
+Nothing sleeps: the backoff delays are spent by a virtual sleeper which ignores them. Every scenario is reported in
+nanoseconds per call and as a ratio to a raw call of the same function. It is compared with the baseline in units
+of a fixed pure Python workload measured in the same run, which is less noisy than a raw call and keeps the numbers
+comparable across runs and machines to a degree. The multi-threaded scenarios are checked only against a baseline
+taken with the same number of CPUs.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import threading
+import time
+
+from toughpy import backoffs, metrics, command
+from toughpy.retry import Retry
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+DEFAULT_THRESHOLD = 0.3  # a scenario regresses when it grows by more than 30% in units of the calibration workload
+# the overhead over a raw call of a first-try success with the metrics, at most this many times the one without
+DEFAULT_MAX_METRICS_OVERHEAD = 4.0  # loose, as the two are measured apart: catches the gross regressions
+DEFAULT_CALLS = 20000
+REPEATS = 5
+THREAD_COUNTS = [1, 2, 4, 8, 16, 32, 64]
+FAILURES = 2
+BACKOFF_TYPES = [backoffs.FixedBackoff, backoffs.FixedListBackoff, backoffs.RandomBackoff,
+                 backoffs.LinearBackoff, backoffs.ExponentialBackoff, backoffs.FibonacciBackoff]
+
+
+def virtual_sleep(delay):
+    pass
+
+
+def succeed(x):
+    return x
+
+
+class Flaky:
+    """Fails `failures` times, by raising or by returning None, then succeeds once, over and over."""
+
+    def __init__(self, failures, raise_error=True):
+        self.failures = failures
+        self.raise_error = raise_error
+        self._calls = threading.local()
+
+    def __call__(self, x):
+        calls = getattr(self._calls, 'value', 0)
+        if calls < self.failures:
+            self._calls.value = calls + 1
+            if self.raise_error:
+                raise ConnectionError()
+            return None
+
+        self._calls.value = 0
+        return x
+
+
+def _decorate(name, fn, **kwargs):
+    kwargs.setdefault('backoff', 0)
+    return Retry(sleep=virtual_sleep, **kwargs)(command('bench.' + name)(fn))
+
+
+def _scenarios():
+    """Yields the name, the call to measure and whether the metrics are on for every single-threaded scenario."""
+    yield 'raw_call', lambda: succeed(1), True
+
+    policy = Retry(backoff=0, sleep=virtual_sleep)
+    yield 'execute_first_try_success', lambda: policy.execute(succeed, 1), True
+
+    for metrics_on in (True, False):
+        suffix = '' if metrics_on else '_metrics_off'
+
+        decorated = _decorate('first_try_success', succeed)
+        yield 'decorator_first_try_success' + suffix, lambda d=decorated: d(1), metrics_on
+
+        decorated = _decorate('failures_then_success', Flaky(FAILURES), max_attempts=FAILURES + 1)
+        yield 'decorator_%d_failures_then_success%s' % (FAILURES, suffix), lambda d=decorated: d(1), metrics_on
+
+        decorated = _decorate('bad_results_then_success', Flaky(FAILURES, raise_error=False),
+                              on_result=None, max_attempts=FAILURES + 1)
+        yield 'decorator_%d_bad_results_then_success%s' % (FAILURES, suffix), lambda d=decorated: d(1), metrics_on
+
+    for backoff_type in BACKOFF_TYPES:
+        decorated = _decorate(backoff_type.__name__, Flaky(FAILURES),
+                              backoff=backoff_type.create_default(), max_attempts=FAILURES + 1)
+        yield 'backoff_' + backoff_type.__name__, lambda d=decorated: d(1), True
+
+
+def _calibration_workload():
+    total = 0
+    for i in range(100):
+        total += i * i
+    return total
+
+
+def _measure(call, calls):
+    best = float('inf')
+    for _ in range(REPEATS):
+        started = time.perf_counter()
+        for _ in range(calls):
+            call()
+        best = min(best, time.perf_counter() - started)
+
+    return best * 1e9 / calls
+
+
+def _measure_threads(thread_count, calls):
+    decorated = _decorate('threads', succeed)
+    barrier = threading.Barrier(thread_count + 1)
+
+    def worker():
+        barrier.wait()
+        for _ in range(calls):
+            decorated(1)
+
+    threads = [threading.Thread(target=worker) for _ in range(thread_count)]
+    for t in threads:
+        t.start()
+
+    barrier.wait()
+    started = time.perf_counter()
+    for t in threads:
+        t.join()
+
+    return (time.perf_counter() - started) * 1e9 / (thread_count * calls)
+
+
+def run(calls=DEFAULT_CALLS):
+    results = {}
+    try:
+        for name, call, metrics_on in _scenarios():
+            metrics.retry_metrics.enabled = metrics_on
+            results[name] = _measure(call, calls)
+    finally:
+        metrics.retry_metrics.enabled = True
+
+    for thread_count in THREAD_COUNTS:
+        results['threads_%d' % thread_count] = _measure_threads(thread_count, max(1, calls // thread_count))
+
+    raw = results['raw_call']
+    unit = _measure(_calibration_workload, max(1, calls // 10))
+    return {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'cpu_count': os.cpu_count(),
+        'calibration_ns': round(unit, 1),
+        'scenarios': {name: {'ns_per_call': round(ns, 1), 'ratio': round(ns / raw, 2), 'units': round(ns / unit, 3)}
+                      for name, ns in results.items()}
+    }
+
+
+def find_regressions(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """Returns the names and the calibration units, now and in the baseline, of the scenarios which regressed."""
+    same_cpus = results['cpu_count'] == baseline.get('cpu_count')
+    regressions = []
+    for name, result in results['scenarios'].items():
+        base = baseline['scenarios'].get(name)
+        if base is None or (name.startswith('threads_') and not same_cpus):
+            continue
+
+        if result['units'] > base['units'] * (1 + threshold):
+            regressions.append((name, result['units'], base['units']))
+
+    return regressions
+
+
+def metrics_overhead(results):
+    """The overhead over a raw call of a first-try success with the metrics on, in units of the one without them."""
+    scenarios = results['scenarios']
+    raw = scenarios['raw_call']['ns_per_call']
+    with_metrics = scenarios['decorator_first_try_success']['ns_per_call'] - raw
+    without_metrics = scenarios['decorator_first_try_success_metrics_off']['ns_per_call'] - raw
+    return with_metrics / without_metrics
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Measures the overhead of Retry against a raw call.')
+    parser.add_argument('--calls', type=int, default=DEFAULT_CALLS, help='calls per measurement')
+    parser.add_argument('--json', metavar='PATH', help='writes the results to PATH')
+    parser.add_argument('--baseline', metavar='PATH', default=DEFAULT_BASELINE)
+    parser.add_argument('--check', action='store_true', help='fails if a scenario regressed vs the baseline')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD)
+    parser.add_argument('--max-metrics-overhead', type=float, default=DEFAULT_MAX_METRICS_OVERHEAD,
+                        help='fails if the metrics multiply the overhead of a first-try success by more')
+    parser.add_argument('--save-baseline', action='store_true', help='stores the results as the baseline')
+    args = parser.parse_args(argv)
+
+    results = run(args.calls)
+
+    print('%-50s %12s %8s' % ('scenario', 'ns/call', 'ratio'))
+    for name, result in results['scenarios'].items():
+        print('%-50s %12.1f %8.2f' % (name, result['ns_per_call'], result['ratio']))
+
+    for path in filter(None, [args.json, args.baseline if args.save_baseline else None]):
+        with open(path, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write('\n')
+
+    if args.check:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+        regressions = find_regressions(results, baseline, args.threshold)
+        for name, units, base_units in regressions:
+            print('REGRESSION %s: %.3f calibration units, %.3f in the baseline' % (name, units, base_units))
+
+        overhead = metrics_overhead(results)
+        if overhead > args.max_metrics_overhead:
+            print('REGRESSION metrics: %.2f times the overhead of a first-try success without them' % overhead)
+
+        return 1 if regressions or overhead > args.max_metrics_overhead else 0
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
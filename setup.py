@@ -8,6 +8,7 @@ setup(
     description='A fault tolerance library designed for Python.',
     license='Apache',
     packages=['toughpy'],
+    python_requires='>=3.7',
     extras_require={
         'dev': [
             'pytest>=3'
@@ -21,9 +22,6 @@ setup(
         'Operating System :: OS Independent',
         'Programming Language :: Python',
         'Programming Language :: Python :: 3',
-        'Programming Language :: Python :: 3.4',
-        'Programming Language :: Python :: 3.5',
-        'Programming Language :: Python :: 3.6',
         'Programming Language :: Python :: 3.7'
     ],
     setup_requires=['pytest-runner'],
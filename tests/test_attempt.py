@@ -1,3 +1,4 @@
+import asyncio
 import pytest
 
 from toughpy.attempt import *
@@ -36,3 +37,82 @@ def test_try_next():
 
     attempt_3 = attempt_2.try_next(lambda: 1)
     assert 3 == attempt_3.attempt_number
+
+
+def test_async_attempts():
+    async def multiply(x, y):
+        return x * y
+
+    async def divide_by_zero():
+        return 1 / 0
+
+    success = asyncio.run(Attempt.try_first_async(multiply, 3, 5))
+    assert isinstance(success, Success)
+    assert 1 == success.attempt_number
+    assert 15 == success.get()
+
+    failure = asyncio.run(success.try_next_async(divide_by_zero))
+    assert isinstance(failure, Failure)
+    assert 2 == failure.attempt_number
+    assert isinstance(failure.get_error(), ZeroDivisionError)
+
+
+def test_async_attempt_propagates_cancellation():
+    async def cancelled():
+        raise asyncio.CancelledError()
+
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(Attempt.try_first_async(cancelled))
+
+
+def _failure_with_locals():
+    def fail():
+        payload = bytearray(1024)  # noqa: F841, pinned by the frame of the traceback
+        raise ValueError('boom')
+
+    return Attempt.try_first(fail)
+
+
+def test_full_traceback_is_kept():
+    attempt = _failure_with_locals()
+    attempt.compact_traceback(TRACEBACK_FULL)
+
+    assert attempt.get_error().__traceback__ is not None
+    assert 'in fail' in repr(attempt)
+
+
+def test_summary_traceback_releases_frames():
+    attempt = _failure_with_locals()
+    attempt.compact_traceback(TRACEBACK_SUMMARY)
+
+    assert attempt.get_error().__traceback__ is None
+    rendered = repr(attempt)
+    assert rendered.startswith('ValueError: boom')
+    assert 'in fail' in rendered
+    assert "raise ValueError('boom')" in rendered  # the source line is looked up while rendering
+
+    with pytest.raises(ValueError):
+        attempt.get()
+
+
+def test_no_traceback():
+    attempt = _failure_with_locals()
+    attempt.compact_traceback(TRACEBACK_NONE)
+
+    assert attempt.get_error().__traceback__ is None
+    assert 'ValueError: boom\n' == repr(attempt)
+
+
+def test_rendered_traceback_is_cached():
+    attempt = _failure_with_locals()
+
+    assert attempt.format_traceback() is attempt.format_traceback()
+
+
+def test_attempts_have_no_instance_dict():
+    success = Attempt.try_first(lambda: 1)
+    failure = success.try_next(lambda: 1 / 0)
+
+    assert not hasattr(success, '__dict__')
+    assert not hasattr(failure, '__dict__')
+    assert 2 == failure.attempt_number
@@ -1,3 +1,4 @@
+import pytest
 import toughpy.backoffs as backoffs
 from toughpy import Attempt
 
@@ -78,6 +79,9 @@ def test_fibonacci_backoff():
     assert backoff.get_delay(attempt=Attempt(5)) == 8
     assert backoff.get_delay(attempt=Attempt(6)) == 13
 
+    assert isinstance(backoff, backoffs.FixedListBackoff)
+    assert backoff.delays == [1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144, 233, 377, 610, 987, 1597, 2584]
+
 
 def test_create_backoff():
     backoff = backoffs.create_backoff(given=None)
@@ -115,3 +119,353 @@ def test_create_backoff():
     backoff = backoffs.create_backoff(given=custom_delay)
     assert isinstance(backoff, backoffs._CallableBackoff)
     assert backoff.get_delay(attempt=Attempt(10)) == 10
+
+
+def _brute_force_wait(backoff, max_attempts):
+    total = 0
+    for n in range(1, max_attempts):
+        delay = backoff._upper_delay_of(n)
+        total += delay if backoff.max_delay is None else min(delay, backoff.max_delay)
+    return total if backoff.total_budget is None else min(total, backoff.total_budget)
+
+
+def test_worst_case_wait_in_closed_form():
+    candidates = [
+        backoffs.FixedBackoff(0.5, max_delay=0.3),
+        backoffs.FixedListBackoff([1, 2, 5], max_delay=4),
+        backoffs.RandomBackoff(1, 3, max_delay=2),
+        backoffs.LinearBackoff(0.5, 0.75, max_delay=4.2),
+        backoffs.LinearBackoff(0.5, 0.75, randomizer=(0, 1)),
+        backoffs.ExponentialBackoff(0.1, base=3, max_delay=30),
+        backoffs.ExponentialBackoff(0.1, base=1.5, randomizer=(0, 0.5), max_delay=7),
+        backoffs.ExponentialBackoff(0.1, base=2),
+        backoffs.FibonacciBackoff(0.5, 1, n_max=6),
+        backoffs.FibonacciBackoff(0.5, 1, max_delay=10, total_budget=30),
+    ]
+
+    for backoff in candidates:
+        for max_attempts in range(1, 30):
+            expected = _brute_force_wait(backoff, max_attempts)
+            assert abs(backoff.worst_case_wait(max_attempts) - expected) <= 1e-9 * max(1, expected), \
+                (backoff, max_attempts)
+
+
+def test_exponential_backoff_does_not_overflow():
+    backoff = backoffs.ExponentialBackoff(initial_delay=1, base=10)
+    assert backoff.get_delay(attempt=Attempt(100)) == backoffs.MAX_FINITE_DELAY
+    assert backoff.get_delay(attempt=Attempt(10000)) == backoffs.MAX_FINITE_DELAY
+
+    backoff = backoffs.ExponentialBackoff(initial_delay=1, base=10, max_delay=60)
+    assert backoff.get_delay(attempt=Attempt(10000)) == 60
+    assert backoff.worst_case_wait(10000) == 1 + 10 + 9997 * 60
+
+
+def test_fibonacci_backoff_is_built_lazily():
+    backoff = backoffs.FibonacciBackoff(1, 2)
+    assert backoff.schedule(3) == [1, 2]
+    assert 2 == len(backoff._fibs)
+
+    backoff = backoffs.FibonacciBackoff(1, 2, max_delay=6)
+    assert backoff.schedule(10) == [1, 2, 3, 5, 6, 6, 6, 6, 6]
+    assert 5 == len(backoff._fibs)
+
+
+@pytest.mark.parametrize('initial_delay, increase, max_delay', [
+    (1, 1, None), (1, 1, 4), (5, 1, 4), (1, 0, 4), (5, 0, 4), (1, -1, None), (1, -1, 4), (10, -1, 4), (10, -3, 4)])
+def test_linear_backoff_worst_case_wait(initial_delay, increase, max_delay):
+    backoff = backoffs.LinearBackoff(initial_delay=initial_delay, increase=increase, max_delay=max_delay)
+
+    for count in range(12):
+        assert backoff.worst_case_wait(count + 1) == sum(backoff.delay_at(n) for n in range(1, count + 1))
+
+
+def test_schedule_within_the_total_budget():
+    backoff = backoffs.LinearBackoff(initial_delay=1, increase=1, total_budget=7)
+
+    assert backoff.schedule(10) == [1, 2, 3, 1]
+    assert list(backoff.iter_delays()) == [1, 2, 3, 1]
+    assert backoff.get_delay(attempt=Attempt(5)) is None
+    assert backoff.worst_case_wait(10) == 7
+
+
+class _LegacyBackoff(backoffs.Backoff):
+    """A backoff written before `delay_at`, overriding nothing but `get_delay`."""
+
+    @staticmethod
+    def create_default():
+        return _LegacyBackoff()
+
+    def get_delay(self, attempt):
+        return attempt.attempt_number * 0.5
+
+
+def test_legacy_backoff():
+    backoff = _LegacyBackoff()
+
+    assert backoff.delay_at(3) == 1.5
+    assert backoff.schedule(4) == [0.5, 1, 1.5]
+    assert next(backoff.iter_delays()) == 0.5
+    assert backoff.next_delay(Attempt(2), 0.5) == 1
+    assert backoff.worst_case_wait(4) == 3
+
+    with pytest.raises(NotImplementedError):
+        backoffs.Backoff().delay_at(1)
+
+
+class _DoubledExponentialBackoff(backoffs.ExponentialBackoff):
+    def get_delay(self, attempt):
+        return super().get_delay(attempt) * 2
+
+
+class _ConstantRandomBackoff(backoffs.RandomBackoff):
+    def get_delay(self, attempt=None):
+        return 7
+
+
+@pytest.mark.parametrize('backoff, expected', [
+    (_DoubledExponentialBackoff(initial_delay=1, base=2), [2, 4, 8]),
+    (_ConstantRandomBackoff(1, 2), [7, 7, 7])])
+def test_get_delay_overridden_in_a_subclass(backoff, expected):
+    from toughpy import Retry
+
+    delays = []
+    with pytest.raises(ConnectionError):
+        Retry(backoff=backoff, max_attempts=4, sleep=delays.append).execute(_raise_connection_error)
+
+    assert delays == expected
+    assert backoff.schedule(4) == expected
+    assert backoffs.FullJitter(backoff, key='client').delay_at(3) <= expected[2]
+
+
+def _raise_connection_error():
+    raise ConnectionError()
+
+
+def test_full_jitter():
+    backoff = backoffs.FullJitter(backoffs.ExponentialBackoff(initial_delay=1, base=2))
+
+    for x in range(1, 10):
+        for _ in range(10):
+            assert 0 <= backoff.get_delay(attempt=Attempt(x)) <= 2 ** (x - 1)
+
+
+def test_equal_jitter():
+    backoff = backoffs.EqualJitter(backoffs.LinearBackoff(initial_delay=1, increase=1), max_delay=4)
+
+    for x in range(1, 10):
+        for _ in range(10):
+            assert min(x, 4) / 2.0 <= backoff.get_delay(attempt=Attempt(x)) <= 4
+
+
+def test_decorrelated_jitter():
+    backoff = backoffs.DecorrelatedJitter(backoffs.FixedBackoff(1), max_delay=20)
+
+    previous_delay = None
+    for x in range(1, 20):
+        delay = backoff.next_delay(Attempt(x), previous_delay)
+        assert 1 <= delay <= min(20, 3 * (previous_delay or 1))
+        previous_delay = delay
+
+    assert backoff.worst_case_wait(4) == 1 + 3 + 9
+
+
+@pytest.mark.parametrize('wrapper', [backoffs.FullJitter, backoffs.EqualJitter, backoffs.DecorrelatedJitter,
+                                     backoffs.AdaptiveBackoff])
+def test_wrapping_a_legacy_backoff(wrapper):
+    from toughpy import Retry
+
+    delays = []
+    attempts = []
+
+    def fail():
+        attempts.append(1)
+        raise ConnectionError()
+
+    with pytest.raises(ConnectionError):
+        Retry(backoff=wrapper(_LegacyBackoff()), max_attempts=5, sleep=delays.append).execute(fail)
+
+    assert len(attempts) == 5
+    assert len(delays) == 4
+    assert all(delay is not None for delay in delays)
+
+
+def test_keyed_jitter_is_deterministic():
+    exponential = backoffs.ExponentialBackoff(initial_delay=1, base=2)
+    backoff = backoffs.FullJitter(exponential, key='client-1')
+
+    assert backoff.deterministic
+    assert backoff.schedule(8) == backoffs.FullJitter(exponential, key='client-1').schedule(8)
+    assert backoff.schedule(8) != backoffs.FullJitter(exponential, key='client-2').schedule(8)
+    assert not backoffs.FullJitter(exponential).deterministic
+
+
+def test_thread_randoms():
+    import threading
+
+    randoms = [backoffs._thread_random()]
+    thread = threading.Thread(target=lambda: randoms.append(backoffs._thread_random()))
+    thread.start()
+    thread.join()
+
+    assert randoms[0] is backoffs._thread_random()
+    assert randoms[0] is not randoms[1]
+
+
+def test_adaptive_backoff_with_recorded_outcomes():
+    now = [0]
+    backoff = backoffs.AdaptiveBackoff(backoffs.FixedBackoff(1), increase=2, decrease=0.5, max_multiplier=8,
+                                       smoothing=1, interval=1, clock=lambda: now[0])
+    assert backoff.get_delay(attempt=Attempt(1)) == 1
+
+    for delay in [2, 4, 8, 8]:  # failing
+        for _ in range(10):
+            backoff.record_failure()
+        now[0] += 1
+        assert backoff.get_delay(attempt=Attempt(1)) == delay
+        assert backoff.get_delay(attempt=Attempt(2)) == delay  # once per interval
+
+    backoff.record_success()
+    now[0] += 4  # recovering, for 4 intervals at once
+    assert backoff.get_delay(attempt=Attempt(1)) == 6
+    assert backoff.failure_rate == 0
+    assert backoff.worst_case_wait(3) == 16
+
+
+def test_adaptive_backoff_records_from_threads():
+    import threading
+
+    backoff = backoffs.AdaptiveBackoff(backoffs.FixedBackoff(1))
+
+    def record():
+        for _ in range(5000):
+            backoff.record_success()
+            backoff.record_failure()
+
+    threads = [threading.Thread(target=record) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert backoff._counts() == (80000, 40000)
+
+
+def test_adaptive_backoff_from_metrics():
+    from toughpy import metrics, command, retry
+
+    metrics.retry_metrics.clear()
+    now = [0]
+    delays = []
+
+    @retry(on_error=ValueError, max_attempts=3, backoff=backoffs.AdaptiveBackoff(
+        backoffs.FixedBackoff(0.25), command='adaptive_command', max_multiplier=4, interval=1, clock=lambda: now[0]),
+        sleep=delays.append)
+    @command('adaptive_command')
+    def fail():
+        raise ValueError()
+
+    for _ in range(4):
+        now[0] += 1
+        try:
+            fail()
+        except ValueError:
+            pass
+
+    # the outcomes of a call are counted once it completes, and the failure rate is smoothed
+    assert delays == [0.25, 0.25, 0.25, 0.25, 0.5, 0.5, 1, 1]
+    metrics.retry_metrics.clear()
+
+
+@pytest.mark.parametrize('wrapper', [lambda backoff: backoff, backoffs.FullJitter, backoffs.HintedBackoff])
+def test_adaptive_backoff_from_the_outcomes_reported_by_retry(wrapper):
+    from toughpy import Retry
+
+    now = [0]
+    backoff = backoffs.AdaptiveBackoff(backoffs.FixedBackoff(1), max_multiplier=8, smoothing=1, interval=1,
+                                       clock=lambda: now[0])
+    policy = Retry(on_result=None, max_attempts=3, backoff=wrapper(backoff), sleep=lambda delay: None)
+
+    for _ in range(3):
+        now[0] += 1
+        policy.execute(lambda: None)  # every attempt has a result to retry
+
+    assert backoff._counts() == (9, 9)
+    assert backoff.multiplier == 8
+
+    for _ in range(3):
+        now[0] += 1
+        policy.execute(lambda: 1)
+
+    assert backoff._counts() == (12, 9)
+
+
+def test_adaptive_backoff_with_the_metrics_disabled():
+    from toughpy import metrics, Retry
+
+    now = [0]
+    backoff = backoffs.AdaptiveBackoff(backoffs.FixedBackoff(1), command='adaptive_command', smoothing=1,
+                                       interval=1, clock=lambda: now[0])
+    metrics.retry_metrics.enabled = False
+    try:
+        for _ in range(2):
+            now[0] += 1
+            with pytest.raises(ConnectionError):
+                Retry(max_attempts=2, backoff=backoff, sleep=lambda delay: None).execute(_raise_connection_error)
+
+        assert backoff._counts() == (4, 4)
+        assert backoff.multiplier == 4
+    finally:
+        metrics.retry_metrics.enabled = True
+
+
+class _Response:
+    def __init__(self, status, headers):
+        self.status = status
+        self.headers = headers
+
+
+class _HttpError(Exception):
+    def __init__(self, response):
+        self.response = response
+
+
+def test_hinted_backoff():
+    from toughpy import Success, Failure, RateLimitExceededError
+
+    def failure(error):
+        return Failure((type(error), error, None), 1)
+
+    backoff = backoffs.HintedBackoff(backoffs.FixedBackoff(1), max_delay=30, clock=lambda: 1445412480.0)
+
+    assert backoff.get_delay(failure(RateLimitExceededError('limiter', 2.5))) == 2.5
+    assert backoff.get_delay(failure(_HttpError(_Response(503, {'Retry-After': '7'})))) == 7
+    assert backoff.get_delay(Success(_Response(429, {'retry-after': b'120'}), 1)) == 30
+    # 21 Oct 2015 07:28:00 GMT
+    assert backoff.get_delay(Success(_Response(503, {'Retry-After': 'Wed, 21 Oct 2015 07:28:10 GMT'}), 1)) == 10
+    assert backoff.get_delay(Success(_Response(503, {'Retry-After': 'Wed, 21 Oct 2015 07:27:00 GMT'}), 1)) == 0
+
+    # falls back to the wrapped backoff
+    assert backoff.get_delay(Success(_Response(503, {'Retry-After': 'soon'}), 1)) == 1
+    assert backoff.get_delay(Success(_Response(503, {}), 1)) == 1
+    assert backoff.get_delay(failure(ValueError())) == 1
+
+    backoff = backoffs.HintedBackoff(extract=lambda attempt: attempt.get_error().args[0])
+    assert backoff.get_delay(failure(ValueError(0.25))) == 0.25
+    assert backoff.get_delay(failure(ValueError(None))) == 0.5
+
+
+def test_hinted_backoff_in_retry():
+    from toughpy import retry, RateLimitExceededError
+
+    delays = []
+    hints = iter([0.2, 8, 0.1, 1])
+
+    @retry(on_error=RateLimitExceededError, max_attempts=4, sleep=delays.append,
+           backoff=backoffs.HintedBackoff(backoffs.FixedBackoff(1), max_delay=5))
+    def throttled():
+        raise RateLimitExceededError('upstream', next(hints))
+
+    with pytest.raises(RateLimitExceededError):
+        throttled()
+
+    assert delays == [0.2, 5, 0.1]
@@ -0,0 +1,88 @@
+import pytest
+
+from toughpy import metrics, command
+from toughpy.budget import RetryBudget
+from toughpy.retry import Retry
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestRetryBudget:
+    @pytest.fixture(autouse=True)
+    def around_each_test(self):
+        self.clock = FakeClock()
+        metrics.retry_metrics.clear()
+        yield
+
+    def test_percent_of_first_attempts(self):
+        budget = RetryBudget(percent_can_retry=20, min_retries_per_second=0, clock=self.clock)
+        for _ in range(10):
+            budget.deposit('cmd')
+
+        assert budget.available_retries('cmd') == 2
+        assert budget.try_withdraw('cmd') is True
+        assert budget.try_withdraw('cmd') is True
+        assert budget.try_withdraw('cmd') is False
+
+    def test_minimum_retries_per_second(self):
+        budget = RetryBudget(percent_can_retry=0, ttl=10, min_retries_per_second=1, clock=self.clock)
+
+        for _ in range(10):
+            assert budget.try_withdraw('cmd') is True
+        assert budget.try_withdraw('cmd') is False
+
+    def test_tokens_expire(self):
+        budget = RetryBudget(percent_can_retry=100, ttl=10, min_retries_per_second=0, clock=self.clock)
+        budget.deposit('cmd')
+
+        self.clock.now += 10
+        assert budget.try_withdraw('cmd') is False
+
+    def test_withdrawals_expire(self):
+        budget = RetryBudget(percent_can_retry=0, ttl=10, min_retries_per_second=0.1, clock=self.clock)
+        assert budget.try_withdraw('cmd') is True
+        assert budget.try_withdraw('cmd') is False
+
+        self.clock.now += 10
+        assert budget.try_withdraw('cmd') is True
+
+    def test_separate_buckets_per_command(self):
+        budget = RetryBudget(percent_can_retry=100, min_retries_per_second=0, clock=self.clock)
+        budget.deposit('a')
+
+        assert budget.try_withdraw('b') is False
+        assert budget.try_withdraw('a') is True
+
+    def test_invalid_values(self):
+        with pytest.raises(ValueError):
+            RetryBudget(percent_can_retry=-1)
+
+        with pytest.raises(ValueError):
+            RetryBudget(ttl=0)
+
+        with pytest.raises(ValueError):
+            RetryBudget(min_retries_per_second=-1)
+
+    def test_retry_stops_when_budget_is_exhausted(self):
+        invocations = []
+        budget = RetryBudget(percent_can_retry=50, min_retries_per_second=0, clock=self.clock)
+
+        @Retry(on_result=None, max_attempts=3, backoff=0, retry_budget=budget)
+        @command('budgeted_command')
+        def return_none():
+            invocations.append(1)
+
+        for _ in range(4):
+            return_none()
+
+        # 4 first attempts deposit tokens for 2 retries in total
+        assert len(invocations) == 4 + 2
+        rm = metrics.retry_metrics['budgeted_command']
+        assert rm.total_retry_attempts == 2
+        assert rm.retries_denied_by_budget == 4
@@ -0,0 +1,144 @@
+import asyncio
+import threading
+import pytest
+
+from toughpy import metrics
+from toughpy.bulkhead import Bulkhead, BulkheadFullError
+from toughpy.retry import Retry
+
+
+class TestBulkhead:
+    @pytest.fixture(autouse=True)
+    def around_each_test(self):
+        metrics.bulkhead_metrics.clear()
+        yield
+
+    @staticmethod
+    def blocking_call(bulkhead, entered, leave):
+        @bulkhead
+        def call():
+            entered.release()
+            leave.wait()
+
+        thread = threading.Thread(target=call)
+        thread.start()
+        entered.acquire()
+        return thread
+
+    def test_rejecting_when_full(self):
+        bulkhead = Bulkhead(name='test_bulkhead', max_concurrent_calls=2)
+        entered, leave = threading.Semaphore(0), threading.Event()
+        threads = [self.blocking_call(bulkhead, entered, leave) for _ in range(2)]
+
+        assert bulkhead.in_flight_calls == 2
+        with pytest.raises(BulkheadFullError):
+            bulkhead.execute(lambda: 1)
+
+        leave.set()
+        for t in threads:
+            t.join()
+
+        assert bulkhead.in_flight_calls == 0
+        assert bulkhead.execute(lambda: 1) == 1
+
+        snapshot = metrics.bulkhead_metrics['test_bulkhead'].snapshot()
+        assert snapshot.permitted_calls == 3
+        assert snapshot.rejected_calls == 1
+        assert snapshot.in_flight_calls == 0
+
+    def test_pickling_rejections(self):
+        import pickle
+
+        bulkhead = Bulkhead(name='test_bulkhead', max_concurrent_calls=1)
+        entered, leave = threading.Semaphore(0), threading.Event()
+        thread = self.blocking_call(bulkhead, entered, leave)
+        with pytest.raises(BulkheadFullError) as raised:
+            bulkhead.execute(lambda: 1)
+        leave.set()
+        thread.join()
+
+        error = pickle.loads(pickle.dumps(raised.value))
+        assert str(error) == str(raised.value)
+        assert error.args == raised.value.args
+
+    def test_waiting_in_queue(self):
+        bulkhead = Bulkhead(name='test_bulkhead', max_concurrent_calls=1, max_queued_calls=1, max_wait_duration=5)
+        entered, leave = threading.Semaphore(0), threading.Event()
+        thread = self.blocking_call(bulkhead, entered, leave)
+
+        threading.Timer(0.1, leave.set).start()
+        assert bulkhead.execute(lambda: 'queued') == 'queued'
+        thread.join()
+
+        bm = metrics.bulkhead_metrics['test_bulkhead']
+        assert bm.wait_time.percentile(100) >= 90000000  # waited ~100ms
+        assert bm.queued_calls == 0
+
+    def test_timing_out_in_queue(self):
+        bulkhead = Bulkhead(max_concurrent_calls=1, max_queued_calls=1, max_wait_duration=0.05)
+        entered, leave = threading.Semaphore(0), threading.Event()
+        thread = self.blocking_call(bulkhead, entered, leave)
+
+        with pytest.raises(BulkheadFullError):
+            bulkhead.execute(lambda: 1)
+
+        assert bulkhead.queued_calls == 0
+        leave.set()
+        thread.join()
+
+    def test_asyncio_tasks(self):
+        bulkhead = Bulkhead(max_concurrent_calls=2, max_queued_calls=10)
+        concurrency = {'current': 0, 'max': 0}
+
+        @bulkhead
+        async def call():
+            concurrency['current'] += 1
+            concurrency['max'] = max(concurrency['max'], concurrency['current'])
+            await asyncio.sleep(0.01)
+            concurrency['current'] -= 1
+
+        async def run():
+            await asyncio.gather(*[call() for _ in range(10)])
+
+        asyncio.run(run())
+        assert concurrency['max'] == 2
+        assert bulkhead.in_flight_calls == 0
+
+    def test_cancelled_waiter_leaves_the_queue(self):
+        bulkhead = Bulkhead(max_concurrent_calls=1, max_queued_calls=1)
+
+        async def run():
+            await bulkhead.acquire_async()
+            waiting = asyncio.ensure_future(bulkhead.acquire_async())
+            await asyncio.sleep(0.01)
+            assert bulkhead.queued_calls == 1
+
+            waiting.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await waiting
+
+            assert bulkhead.queued_calls == 0
+            bulkhead.release()
+
+        asyncio.run(run())
+        assert bulkhead.in_flight_calls == 0
+
+    def test_composing_with_retry(self):
+        invocations = []
+        bulkhead = Bulkhead(max_concurrent_calls=1)
+
+        @Retry(on_result=None, max_attempts=3, backoff=0)
+        @bulkhead
+        def call():
+            invocations.append(bulkhead.in_flight_calls)
+
+        call()
+        assert invocations == [1, 1, 1]
+        assert bulkhead.in_flight_calls == 0
+
+    def test_invalid_values(self):
+        with pytest.raises(ValueError):
+            Bulkhead(max_concurrent_calls=0)
+
+        with pytest.raises(ValueError):
+            Bulkhead(max_queued_calls=-1)
@@ -0,0 +1,224 @@
+import asyncio
+import pytest
+
+from toughpy import metrics
+from toughpy.circuitbreaker import *
+from toughpy.retry import Retry
+from tests.testutil import silence
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class BaseCircuitBreakerTest:
+    invocations = 0
+
+    @pytest.fixture(autouse=True)
+    def around_each_test(self):
+        self.invocations = 0
+        self.clock = FakeClock()
+        metrics.circuit_breaker_metrics.clear()
+        yield
+
+    def fail_with(self, error_type):
+        def _do():
+            self.invocations += 1
+            raise error_type()
+
+        return _do
+
+    def return_(self, value):
+        def _do():
+            self.invocations += 1
+            return value
+
+        return _do
+
+    def breaker(self, **kwargs):
+        kwargs.setdefault('name', 'test_breaker')
+        kwargs.setdefault('clock', self.clock)
+        return CircuitBreaker(**kwargs)
+
+
+class TestStateTransitions(BaseCircuitBreakerTest):
+    def test_opening_on_failure_rate(self):
+        cb = self.breaker(window_size=10, minimum_calls=4, failure_rate_threshold=50)
+
+        for _ in range(2):
+            cb.execute(self.return_(1))
+        with silence():
+            cb.execute(self.fail_with(ConnectionError))
+        assert cb.state == CLOSED
+
+        with silence():
+            cb.execute(self.fail_with(ConnectionError))
+        assert cb.state == OPEN
+
+    def test_failing_fast_when_open(self):
+        cb = self.breaker(window_size=2, minimum_calls=2, wait_in_open_state=30)
+        for _ in range(2):
+            with silence():
+                cb.execute(self.fail_with(ConnectionError))
+
+        with pytest.raises(CallNotPermittedError) as e:
+            cb.execute(self.return_(1))
+
+        assert e.value.remaining == 30
+        assert 2 == self.invocations
+        assert metrics.circuit_breaker_metrics['test_breaker'].not_permitted_calls == 1
+
+    def test_half_open_closing(self):
+        cb = self.breaker(window_size=2, minimum_calls=2, wait_in_open_state=30,
+                          permitted_calls_in_half_open_state=2)
+        for _ in range(2):
+            with silence():
+                cb.execute(self.fail_with(ConnectionError))
+
+        self.clock.now += 30
+        assert cb.state == HALF_OPEN
+
+        cb.execute(self.return_(1))
+        cb.execute(self.return_(1))
+        assert cb.state == CLOSED
+
+    def test_half_open_reopening(self):
+        cb = self.breaker(window_size=2, minimum_calls=2, wait_in_open_state=30,
+                          permitted_calls_in_half_open_state=2)
+        for _ in range(2):
+            with silence():
+                cb.execute(self.fail_with(ConnectionError))
+
+        self.clock.now += 30
+        with silence():
+            cb.execute(self.fail_with(ConnectionError))
+        cb.execute(self.return_(1))
+
+        assert cb.state == OPEN
+
+    def test_limiting_calls_in_half_open(self):
+        cb = self.breaker(window_size=1, minimum_calls=1, wait_in_open_state=1, permitted_calls_in_half_open_state=1)
+        with silence():
+            cb.execute(self.fail_with(ConnectionError))
+
+        self.clock.now += 1
+        cb.acquire_permission()
+        with pytest.raises(CallNotPermittedError):
+            cb.acquire_permission()
+
+        cb.release_permission()
+        cb.acquire_permission()
+
+    def test_state_change_handler(self):
+        transitions = []
+        cb = self.breaker(window_size=1, minimum_calls=1)\
+            .on_state_change(lambda breaker, old, new: transitions.append((old, new)))
+
+        with silence():
+            cb.execute(self.fail_with(ConnectionError))
+        cb.reset()
+
+        assert transitions == [(CLOSED, OPEN), (OPEN, CLOSED)]
+
+
+class TestFailureClassification(BaseCircuitBreakerTest):
+    def test_ignored_errors_are_successes(self):
+        cb = self.breaker(on_error=ConnectionError, window_size=2, minimum_calls=2)
+        for _ in range(5):
+            with silence():
+                cb.execute(self.fail_with(KeyError))
+
+        assert cb.state == CLOSED
+        assert cb.failure_rate == 0
+
+    def test_bad_results_are_failures(self):
+        cb = self.breaker(on_result=None, window_size=2, minimum_calls=2)
+        cb.execute(self.return_(None))
+        cb.execute(self.return_(None))
+
+        assert cb.state == OPEN
+
+
+class TestSlidingWindows(BaseCircuitBreakerTest):
+    def test_count_based_window_forgets_old_outcomes(self):
+        cb = self.breaker(window_size=4, minimum_calls=4, failure_rate_threshold=75)
+        for _ in range(2):
+            with silence():
+                cb.execute(self.fail_with(ConnectionError))
+        for _ in range(6):
+            cb.execute(self.return_(1))
+
+        assert cb.failure_rate == 0
+
+    def test_time_based_window(self):
+        cb = self.breaker(window_type=TIME_BASED, window_size=10, minimum_calls=2)
+        with silence():
+            cb.execute(self.fail_with(ConnectionError))
+
+        self.clock.now += 10
+        with silence():
+            cb.execute(self.fail_with(ConnectionError))
+        assert cb.state == CLOSED  # the first failure has expired
+
+        cb.execute(self.return_(1))
+        assert cb.failure_rate == 50
+        assert cb.state == OPEN
+
+    def test_invalid_window(self):
+        with pytest.raises(ValueError):
+            CircuitBreaker(window_type='SESSION_BASED')
+
+        with pytest.raises(ValueError):
+            CircuitBreaker(window_size=0)
+
+    def test_invalid_call_counts(self):
+        with pytest.raises(ValueError):
+            CircuitBreaker(minimum_calls=0)
+
+        with pytest.raises(ValueError):
+            CircuitBreaker(permitted_calls_in_half_open_state=0)
+
+    def test_pickling_rejections(self):
+        import pickle
+
+        cb = self.breaker(window_size=1, minimum_calls=1)
+        with pytest.raises(ConnectionError):
+            cb.execute(self.fail_with(ConnectionError))
+        with pytest.raises(CallNotPermittedError) as raised:
+            cb.execute(self.return_(1))
+
+        error = pickle.loads(pickle.dumps(raised.value))
+        assert str(error) == str(raised.value)
+        assert error.remaining == raised.value.remaining
+        assert error.args == raised.value.args
+
+
+class TestComposition(BaseCircuitBreakerTest):
+    def test_rejections_are_not_retried(self):
+        cb = self.breaker(window_size=1, minimum_calls=1)
+        protected = Retry(max_attempts=5, backoff=0)(cb(self.fail_with(ConnectionError)))
+
+        with pytest.raises(CallNotPermittedError):
+            protected()
+
+        assert 1 == self.invocations
+
+    def test_decorating_coroutine_functions(self):
+        cb = self.breaker(window_size=1, minimum_calls=1)
+
+        @cb
+        async def failing():
+            self.invocations += 1
+            raise ConnectionError()
+
+        with pytest.raises(ConnectionError):
+            asyncio.run(failing())
+
+        with pytest.raises(CallNotPermittedError):
+            asyncio.run(failing())
+
+        assert 1 == self.invocations
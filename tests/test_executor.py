@@ -0,0 +1,129 @@
+import threading
+import time
+import pytest
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+
+from toughpy import metrics, command
+from toughpy.executor import RetryExecutor
+from toughpy.retry import Retry, RetryError
+from toughpy.timeout import AttemptTimeoutError
+
+
+class Flaky:
+    def __init__(self, failures):
+        self.failures = failures
+        self.calls = 0
+        self.threads = set()
+        self._lock = threading.Lock()
+
+    def __call__(self, value):
+        with self._lock:
+            self.calls += 1
+            self.threads.add(threading.current_thread().name)
+            failing = self.calls <= self.failures
+        if failing:
+            raise ConnectionError()
+        return value
+
+
+def test_retrying_on_the_pool():
+    flaky = Flaky(failures=2)
+    with RetryExecutor(Retry(backoff=0.01)) as executor:
+        assert 'ok' == executor.submit(flaky, 'ok').result(timeout=2)
+
+    assert 3 == flaky.calls
+
+
+def test_raising_the_last_error():
+    with RetryExecutor(Retry(backoff=0, wrap_error=True, max_attempts=2)) as executor:
+        future = executor.submit(Flaky(failures=5), 'ok')
+        with pytest.raises(RetryError):
+            future.result(timeout=2)
+
+
+def test_waiting_retries_do_not_occupy_the_workers():
+    pool = ThreadPoolExecutor(max_workers=1)
+    executor = RetryExecutor(Retry(backoff=0.5, max_attempts=2), executor=pool)
+    try:
+        waiting = executor.submit(Flaky(failures=1), 'later')
+        time.sleep(0.05)  # the first attempt failed and the retry is waiting
+
+        started = time.monotonic()
+        assert 'now' == executor.submit(lambda: 'now').result(timeout=2)
+        assert time.monotonic() - started < 0.2
+        assert 'later' == waiting.result(timeout=2)
+    finally:
+        executor.shutdown()
+        pool.shutdown()
+
+
+def test_cancelling_a_waiting_retry():
+    flaky = Flaky(failures=1)
+    with RetryExecutor(Retry(backoff=0.2)) as executor:
+        future = executor.submit(flaky, 'ok')
+        time.sleep(0.05)
+        assert future.cancel()
+        with pytest.raises(CancelledError):
+            future.result()
+        time.sleep(0.3)
+
+    assert 1 == flaky.calls
+
+
+def test_timing_out_attempts():
+    calls = []
+
+    def slow_at_first():
+        calls.append(1)
+        if len(calls) == 1:
+            time.sleep(0.3)
+        return len(calls)
+
+    with RetryExecutor(Retry(backoff=0, attempt_timeout=0.05), max_workers=2) as executor:
+        assert 2 == executor.submit(slow_at_first).result(timeout=2)
+
+    with RetryExecutor(Retry(backoff=0, attempt_timeout=0.05, max_attempts=1)) as executor:
+        with pytest.raises(AttemptTimeoutError):
+            executor.submit(time.sleep, 0.2).result(timeout=2)
+
+
+def test_propagating_the_context():
+    from toughpy.deadline import deadline_scope, remaining_time
+
+    with RetryExecutor(Retry(backoff=0)) as executor:
+        with deadline_scope(10):
+            assert 5 < executor.submit(remaining_time).result(timeout=2) <= 10
+        assert executor.submit(remaining_time).result(timeout=2) is None
+
+    with RetryExecutor(Retry(backoff=0, max_duration=1)) as executor:
+        with deadline_scope(10):
+            assert 0 < executor.submit(remaining_time).result(timeout=2) <= 1
+
+
+def test_metrics():
+    metrics.retry_metrics.clear()
+    flaky = command('executor_command')(Flaky(failures=1))
+
+    with RetryExecutor(Retry(backoff=0.01)) as executor:
+        executor.submit(flaky, 1).result(timeout=2)
+
+    rm = metrics.retry_metrics['executor_command']
+    assert 1 == rm.successful_calls_with_retry
+    assert 1 == rm.total_retry_attempts
+    assert 1 == rm.backoff_time.count()
+
+
+def test_rejecting_after_shutdown():
+    executor = RetryExecutor(Retry())
+    executor.shutdown()
+
+    with pytest.raises(RuntimeError):
+        executor.submit(lambda: 1)
+
+
+def test_on_a_process_pool():
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(max_workers=1) as pool:
+        with RetryExecutor(Retry(backoff=0), executor=pool) as executor:
+            assert 1024 == executor.submit(pow, 2, 10).result(timeout=10)
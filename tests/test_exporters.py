@@ -0,0 +1,134 @@
+import socket
+from toughpy import metrics, command, OpenMetricsExporter, StatsdExporter, render_openmetrics
+from toughpy.retry import retry
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def around_each_test():
+    metrics.retry_metrics.clear()
+    metrics.bulkhead_metrics.clear()
+    yield
+
+
+@pytest.fixture
+def udp_server():
+    server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    server.bind(('127.0.0.1', 0))
+    server.settimeout(2)
+    yield server
+    server.close()
+
+
+def _receive_all(server):
+    lines = []
+    server.settimeout(0.2)
+    try:
+        while True:
+            lines.extend(server.recv(65536).decode('utf-8').split('\n'))
+    except socket.timeout:
+        return lines
+
+
+def _call(name, failures):
+    attempts = []
+
+    @retry(max_attempts=failures + 1, backoff=0)
+    @command(name)
+    def flaky():
+        attempts.append(1)
+        if len(attempts) <= failures:
+            raise ConnectionError()
+        return 'ok'
+
+    return flaky()
+
+
+def test_render_openmetrics():
+    _call('exporters.flaky', 2)
+    _call('exporters."quoted"', 0)
+    metrics.bulkhead_metrics['exporters.bulkhead']._set_gauges(3, 1)
+
+    text = render_openmetrics()
+    lines = text.splitlines()
+    assert lines[-1] == '# EOF'
+    assert '# TYPE toughpy_retry_successful_calls_with_retry counter' in lines
+    assert 'toughpy_retry_successful_calls_with_retry_total{command="exporters.flaky"} 1' in lines
+    assert 'toughpy_retry_retry_attempts_total{command="exporters.flaky"} 2' in lines
+    assert 'toughpy_retry_successful_calls_without_retry_total{command="exporters.\\"quoted\\""} 1' in lines
+    assert '# TYPE toughpy_retry_attempt_latency_seconds gauge' in lines
+    assert not any('_total_total' in line or line.startswith('toughpy_retry_total_') for line in lines)
+    assert not any('_count{' in line for line in lines)  # the count of a window would go down
+    assert any(line.startswith('toughpy_retry_call_latency_seconds{command="exporters.flaky",quantile="0.99"} ')
+               for line in lines)
+    assert 'toughpy_bulkhead_in_flight_calls{command="exporters.bulkhead"} 3' in lines
+
+    # every family is declared once, before its samples
+    types = [line for line in lines if line.startswith('# TYPE')]
+    assert len(types) == len(set(types))
+
+
+def test_openmetrics_is_cached():
+    now = [0]
+    exporter = OpenMetricsExporter(quantiles=None, cache_ttl=1, clock=lambda: now[0])
+    _call('exporters.cached', 0)
+    first = exporter.render()
+    assert 'summary' not in first
+
+    _call('exporters.cached', 0)
+    assert exporter.render() is first
+
+    now[0] = 1
+    assert 'toughpy_retry_successful_calls_without_retry_total{command="exporters.cached"} 2' in exporter.render()
+
+
+def test_statsd_sends_deltas(udp_server):
+    exporter = StatsdExporter(port=udp_server.getsockname()[1], quantiles=None)
+    try:
+        _call('exporters.statsd', 1)
+        assert exporter.flush() == 1
+        lines = _receive_all(udp_server)
+        assert 'toughpy.retry.exporters.statsd.successful_calls_with_retry:1|c' in lines
+        assert 'toughpy.retry.exporters.statsd.total_retry_attempts:1|c' in lines
+        assert not any(':0|c' in line for line in lines)
+
+        _call('exporters.statsd', 0)
+        exporter.flush()
+        assert _receive_all(udp_server) == ['toughpy.retry.exporters.statsd.successful_calls_without_retry:1|c']
+
+        assert exporter.flush() == 0
+    finally:
+        exporter.stop()
+
+
+def test_statsd_batches_packets(udp_server):
+    exporter = StatsdExporter(port=udp_server.getsockname()[1], max_packet_size=200)
+    try:
+        for i in range(20):
+            _call('exporters.batch %d' % i, 0)
+        packets = exporter.flush()
+        assert packets > 1
+
+        datagrams = []
+        udp_server.settimeout(0.2)
+        try:
+            while True:
+                datagrams.append(udp_server.recv(65536))
+        except socket.timeout:
+            pass
+
+        assert len(datagrams) == packets
+        assert all(len(d) <= 200 for d in datagrams)
+        lines = b'\n'.join(datagrams).decode('utf-8').split('\n')
+        assert 'toughpy.retry.exporters.batch_7.successful_calls_without_retry:1|c' in lines
+        assert any(line.startswith('toughpy.retry.exporters.batch_7.call_latency.p99:') and line.endswith('|g')
+                   for line in lines)
+    finally:
+        exporter.stop()
+
+
+def test_statsd_background_thread(udp_server):
+    _call('exporters.background', 0)
+    with StatsdExporter(port=udp_server.getsockname()[1], interval=0.05, quantiles=None):
+        udp_server.settimeout(2)
+        assert b'exporters.background.successful_calls_without_retry:1|c' in udp_server.recv(65536)
@@ -0,0 +1,169 @@
+import asyncio
+import threading
+import time
+import pytest
+
+from toughpy import metrics, command
+from toughpy.hedge import Hedge
+from tests.testutil import Timer
+
+
+class TestHedge:
+    @pytest.fixture(autouse=True)
+    def around_each_test(self):
+        metrics.hedge_metrics.clear()
+        self.lock = threading.Lock()
+        self.invocations = 0
+        yield
+
+    def next_invocation(self):
+        with self.lock:
+            self.invocations += 1
+            return self.invocations
+
+    @staticmethod
+    def warmed_up(hedge, command_name, calls=20):
+        # hedges are limited to a percent of the calls
+        for _ in range(calls):
+            hedge._budget.deposit(command_name)
+        return hedge
+
+    def test_hedge_wins_over_a_slow_attempt(self):
+        hedge = self.warmed_up(Hedge(hedge_delay=0.05, max_hedge_percent=100), 'hedged')
+
+        @hedge
+        @command('hedged')
+        def slow_first():
+            n = self.next_invocation()
+            if n == 1:
+                time.sleep(1)
+            return n
+
+        with Timer() as timer:
+            assert slow_first() == 2
+
+        assert timer.elapsed < 0.5
+        hm = metrics.hedge_metrics['hedged']
+        assert hm.hedges == 1
+        assert hm.hedge_wins == 1
+
+    def test_no_hedge_for_fast_attempts(self):
+        hedge = self.warmed_up(Hedge(hedge_delay=1, max_hedge_percent=100), 'fast')
+
+        @hedge
+        @command('fast')
+        def fast():
+            return self.next_invocation()
+
+        assert fast() == 1
+        assert metrics.hedge_metrics['fast'].hedges == 0
+
+    def test_retryable_failures_start_the_next_hedge(self):
+        hedge = self.warmed_up(Hedge(on_error=ConnectionError, max_hedges=2, hedge_delay=10,
+                                     max_hedge_percent=100), 'failing')
+
+        @hedge
+        @command('failing')
+        def failing_twice():
+            n = self.next_invocation()
+            if n < 3:
+                raise ConnectionError()
+            return n
+
+        assert failing_twice() == 3
+
+    def test_raising_the_last_error(self):
+        hedge = self.warmed_up(Hedge(max_hedges=1, hedge_delay=10, max_hedge_percent=100), 'always_failing')
+
+        @hedge
+        @command('always_failing')
+        def always_failing():
+            self.next_invocation()
+            raise ConnectionError()
+
+        with pytest.raises(ConnectionError):
+            always_failing()
+        assert self.invocations == 2
+
+    def test_non_retryable_errors_are_final(self):
+        hedge = self.warmed_up(Hedge(on_error=ConnectionError, hedge_delay=10, max_hedge_percent=100), 'final')
+
+        @hedge
+        @command('final')
+        def key_error():
+            self.next_invocation()
+            raise KeyError()
+
+        with pytest.raises(KeyError):
+            key_error()
+        assert self.invocations == 1
+
+    def test_limiting_the_extra_load(self):
+        hedge = Hedge(hedge_delay=0.001, max_hedge_percent=10, clock=lambda: 0.0)  # no token expires
+        decided = threading.Event()
+        may_hedge = hedge._may_hedge
+
+        def deciding(*args):
+            try:
+                return may_hedge(*args)
+            finally:
+                decided.set()
+
+        hedge._may_hedge = deciding
+
+        @hedge
+        @command('limited')
+        def pending_until_decided():
+            decided.wait()  # still pending when the hedge delay passes, whatever the scheduling
+
+        for _ in range(30):
+            decided.clear()
+            pending_until_decided()
+
+        hm = metrics.hedge_metrics['limited']
+        assert hm.hedges + hm.hedges_denied == 30
+        assert hm.hedges == 3  # every 10th call has saved up enough for a hedge
+        assert hm.hedges_denied == 27
+
+    def test_adaptive_delay(self):
+        hedge = Hedge(hedge_percentile=50)
+
+        @hedge
+        @command('adaptive')
+        def fast():
+            return 1
+
+        for _ in range(150):
+            fast()
+
+        hedge._adaptive_delays.clear()  # the delay is refreshed once a second
+        delay = hedge._delay_of(metrics.hedge_metrics['adaptive'])
+        assert 0 < delay < 0.01
+
+    def test_asyncio(self):
+        cancelled = []
+        hedge = self.warmed_up(Hedge(hedge_delay=0.02, max_hedge_percent=100), 'async_hedged')
+
+        @hedge
+        @command('async_hedged')
+        async def slow_first():
+            n = self.next_invocation()
+            if n == 1:
+                try:
+                    await asyncio.sleep(1)
+                except asyncio.CancelledError:
+                    cancelled.append(n)
+                    raise
+            return n
+
+        async def run():
+            result = await slow_first()
+            await asyncio.sleep(0)
+            return result
+
+        assert asyncio.run(run()) == 2
+        assert cancelled == [1]
+
+    def test_invalid_values(self):
+        with pytest.raises(ValueError):
+            Hedge(max_hedges=-1)
@@ -0,0 +1,127 @@
+import pytest
+
+from toughpy.histogram import Histogram, RollingHistogram
+from toughpy.duration import Duration, seconds
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, secs):
+        self.now += int(secs * 1000000000)
+
+
+class TestHistogram:
+    def test_small_values_are_exact(self):
+        histogram = Histogram(precision_bits=3)
+        for value in range(1, 16):
+            histogram.record(value)
+
+        assert histogram.count == 15
+        assert histogram.percentile(50) == 8
+        assert histogram.percentile(100) == 15
+        assert histogram.count_at_least(3) == 13
+
+    def test_relative_error_is_bounded(self):
+        histogram = Histogram(precision_bits=3)
+        for value in [1000, 123456, 98765432, 2 ** 35 + 17]:
+            histogram.clear()
+            histogram.record(value)
+            assert value <= histogram.percentile(100) <= value * (1 + 1.0 / 8)
+
+    def test_fixed_memory(self):
+        histogram = Histogram(max_value_bits=20, precision_bits=3)
+        buckets = histogram.bucket_count
+        histogram.record(0)
+        histogram.record(-5)
+        histogram.record(2 ** 40)
+
+        assert histogram.bucket_count == buckets
+        assert histogram.count == 3
+        assert histogram.percentile(0) == 0
+        assert histogram.percentile(100) == 2 ** 20 - 1
+
+    def test_percentiles(self):
+        histogram = Histogram()
+        for value in range(1, 1001):
+            histogram.record(value * 1000)
+
+        assert histogram.percentile(0) <= 1000 * 1.125
+        assert 500000 <= histogram.percentile(50) <= 500000 * 1.125
+        assert 990000 <= histogram.percentile(99) <= 990000 * 1.125
+        assert histogram.percentile(100) >= 1000000
+
+        with pytest.raises(ValueError):
+            histogram.percentile(101)
+
+    def test_empty(self):
+        assert Histogram().percentile(99) == 0
+
+    def test_add(self):
+        a, b = Histogram(), Histogram()
+        a.record(1)
+        b.record(100)
+        b.record(100)
+        a.add(b)
+
+        assert a.count == 3
+        with pytest.raises(ValueError):
+            a.add(Histogram(max_value_bits=10))
+
+
+class TestRollingHistogram:
+    def test_values_expire(self):
+        clock = FakeClock()
+        histogram = RollingHistogram(slices=3, slice_duration=1, clock=clock)
+
+        histogram.record(10)
+        clock.advance(1)
+        histogram.record(15)
+        assert histogram.count() == 2
+
+        clock.advance(2)
+        assert histogram.count() == 1
+        assert histogram.percentile(100) == 15
+
+        clock.advance(1)
+        assert histogram.count() == 0
+
+    def test_windowed_queries(self):
+        clock = FakeClock()
+        histogram = RollingHistogram(slices=6, slice_duration=Duration(10, seconds), clock=clock)
+
+        histogram.record(1000)
+        clock.advance(30)
+        histogram.record(5)
+
+        assert histogram.count() == 2
+        assert histogram.count(window=Duration(10, seconds)) == 1
+        assert histogram.percentile(100, window=5) == 5
+        assert histogram.window == 60
+
+    def test_recycled_slices_are_cleared(self):
+        clock = FakeClock()
+        histogram = RollingHistogram(slices=2, slice_duration=1, clock=clock)
+
+        histogram.record(1)
+        clock.advance(2)  # same slot, next lap
+        histogram.record(2)
+
+        assert histogram.count() == 1
+        assert histogram.percentile(0) == 2
+
+    def test_recording_at_a_given_time(self):
+        clock = FakeClock()
+        histogram = RollingHistogram(slices=3, slice_duration=1, clock=clock)
+
+        histogram.record_at(0, 10)
+        histogram.record_at(1000000000, 20)  # the next slice
+        histogram.record_at(0, 30)  # late, into the older slice
+        clock.advance(1)
+
+        assert histogram.count() == 3
+        assert histogram.count(window=1) == 1
@@ -1,3 +1,4 @@
+import threading
 from toughpy import metrics, command
 from toughpy.retry import retry
 import pytest
@@ -77,3 +78,248 @@ class TestRetryMetrics:
         assert rm.failed_calls_with_retry == 10
         assert rm.total_calls == 10
         assert rm.total_retry_attempts == 40
+
+
+class TestConcurrentMetrics:
+    threads = 16
+    calls_per_thread = 2000
+
+    @pytest.fixture(autouse=True)
+    def around_each_test(self):
+        metrics.retry_metrics.clear()
+        yield
+
+    def test_no_lost_increments(self):
+        @retry(on_result=None, max_attempts=2, backoff=0)
+        @command('concurrent_command')
+        def return_none():
+            return None
+
+        def worker():
+            for _ in range(self.calls_per_thread):
+                return_none()
+
+        threads = [threading.Thread(target=worker) for _ in range(self.threads)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        snapshot = metrics.retry_metrics['concurrent_command'].snapshot()
+        assert snapshot.total_calls == self.threads * self.calls_per_thread
+        assert snapshot.successful_calls_with_retry == self.threads * self.calls_per_thread
+        assert snapshot.total_retry_attempts == self.threads * self.calls_per_thread
+
+    def test_shards_of_terminated_threads_are_retired(self):
+        counters = metrics.ShardedCounters(2)
+
+        def increment():
+            counters.shard()[0] += 1
+
+        for _ in range(200):
+            thread = threading.Thread(target=increment)
+            thread.start()
+            thread.join()
+
+        assert len(counters._shards) <= 1  # retired when the next thread comes, without summing
+        assert counters.sum() == [200, 0]
+        assert counters._shards == []
+
+    def test_single_entry_per_command(self):
+        barrier = threading.Barrier(self.threads)
+        created = []
+
+        def worker():
+            barrier.wait()
+            created.append(metrics.retry_metrics['racy_command'])
+
+        threads = [threading.Thread(target=worker) for _ in range(self.threads)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        assert len(set(id(m) for m in created)) == 1
+
+    def test_registry_snapshot(self):
+        metrics.retry_metrics['a']._increment_retry_attempts()
+        metrics.retry_metrics['b']
+
+        snapshot = metrics.retry_metrics.snapshot()
+        assert set(snapshot.keys()) == {'a', 'b'}
+        assert snapshot['a'].total_retry_attempts == 1
+        assert snapshot['b'].total_calls == 0
+
+    def test_disabled_registry(self):
+        @retry(backoff=0)
+        @command('disabled_command')
+        def succeed():
+            return 1
+
+        metrics.retry_metrics.enabled = False
+        try:
+            succeed()
+            assert metrics.retry_metrics.snapshot() == {}
+        finally:
+            metrics.retry_metrics.enabled = True
+
+        succeed()
+        assert metrics.retry_metrics['disabled_command'].total_calls == 1
+
+
+class TestRetryHistograms:
+    @pytest.fixture(autouse=True)
+    def around_each_test(self):
+        metrics.retry_metrics.clear()
+        yield
+
+    def test_recorded_from_execute(self):
+        attempts = []
+
+        @retry(on_result=None, max_attempts=3, backoff=0.01)
+        @command('histogram_command')
+        def succeed_at_third():
+            attempts.append(1)
+            return 'ok' if len(attempts) % 3 == 0 else None
+
+        for _ in range(5):
+            succeed_at_third()
+
+        rm = metrics.retry_metrics['histogram_command']
+        assert rm.attempts_per_call.count() == 5
+        assert rm.attempts_per_call.snapshot().count_at_least(3) == 5
+        assert rm.attempt_latency.count() == 15
+        assert rm.backoff_time.count() == 10
+        assert rm.backoff_time.percentile(50) >= 10000000  # at least 10ms
+        assert rm.call_latency.percentile(99) >= 20000000  # two backoffs
+
+    def test_recorded_on_first_try_success(self):
+        @retry(on_result=None, backoff=0)
+        @command('histogram_command')
+        def succeed():
+            return 'ok'
+
+        for _ in range(10):
+            succeed()
+
+        rm = metrics.retry_metrics['histogram_command']
+        assert rm.call_latency.count() == 10
+        assert rm.attempts_per_call.percentile(100) == 1
+
+
+def test_ratios_without_calls():
+    snapshot = metrics.RetryMetrics('no_calls').snapshot()
+    assert snapshot.retry_attempts_per_call == 0.0
+    assert snapshot.ratio_of_successful_calls_without_retry == 0.0
+    assert snapshot.ratio_of_failed_calls_with_retry == 0.0
+
+
+class TestSharedMetrics:
+    @pytest.fixture
+    def registry(self, tmp_path):
+        registry = metrics.MetricsRegistry(metrics.RetryMetrics)
+        registry.share(str(tmp_path / 'metrics'), max_commands=4, max_lanes=8)
+        yield registry
+
+    def test_counts_of_other_processes(self, registry):
+        import os
+
+        registry['shared_command']._increment_retry_attempts()
+        pid = os.fork()
+        if pid == 0:
+            try:
+                child_metrics = registry['shared_command']
+                for _ in range(5):
+                    child_metrics._increment_retry_attempts()
+                registry['child_command']._increment_retry_attempts()
+            finally:
+                os._exit(0)
+
+        os.waitpid(pid, 0)
+        registry['shared_command']._increment_retry_attempts()
+
+        snapshot = registry.snapshot()
+        assert snapshot['shared_command'].total_retry_attempts == 7
+        assert snapshot['child_command'].total_retry_attempts == 1
+
+    def test_processes_opening_the_file(self, registry, tmp_path):
+        import multiprocessing
+
+        process = multiprocessing.get_context('spawn').Process(target=_count_in_shared_file,
+                                                              args=(str(tmp_path / 'metrics'),))
+        process.start()
+        process.join()
+        assert process.exitcode == 0
+
+        registry['shared_command']._increment_retry_attempts()
+        assert registry['shared_command'].total_retry_attempts == 11
+
+        # the lane of the terminated process is reused
+        lanes = [registry._MetricsRegistry__shared._claim_lane() for _ in range(8)]
+        assert lanes.count(None) == 1
+
+    def test_counts_of_terminated_threads_are_kept(self, registry):
+        def count():
+            registry['shared_command']._increment_retry_attempts()
+
+        for _ in range(20):  # more threads than lanes
+            thread = threading.Thread(target=count)
+            thread.start()
+            thread.join()
+
+        assert registry['shared_command'].total_retry_attempts == 20
+
+    def test_counts_of_threads_without_a_lane(self, registry):
+        counted = threading.Barrier(13)
+        release = threading.Event()
+
+        def count():
+            registry['shared_command']._increment_retry_attempts()
+            counted.wait()
+            release.wait()
+
+        threads = [threading.Thread(target=count) for _ in range(12)]  # more threads alive than lanes
+        for thread in threads:
+            thread.start()
+        counted.wait()
+        try:
+            assert registry['shared_command'].total_retry_attempts == 12
+        finally:
+            release.set()
+            for thread in threads:
+                thread.join()
+
+    def test_layout_must_match(self, registry, tmp_path):
+        with pytest.raises(ValueError):
+            metrics.MetricsRegistry(metrics.RetryMetrics).share(str(tmp_path / 'metrics'), max_commands=8)
+
+    def test_full_file(self, registry):
+        for i in range(6):
+            registry['command_%d' % i]._increment_retry_attempts()
+
+        assert len(registry._MetricsRegistry__shared.names()) == 4
+        assert registry['command_5'].total_retry_attempts == 1
+
+    def test_retry(self, tmp_path):
+        metrics.retry_metrics.share(str(tmp_path / 'metrics'))
+        try:
+            @retry(on_error=ValueError, max_attempts=3, backoff=0)
+            @command('shared_retry')
+            def fail():
+                raise ValueError()
+
+            with pytest.raises(ValueError):
+                fail()
+
+            assert metrics.retry_metrics['shared_retry'].failed_calls_with_retry == 1
+            metrics.retry_metrics.clear()
+            assert metrics.retry_metrics['shared_retry'].failed_calls_with_retry == 0
+        finally:
+            metrics.retry_metrics.unshare()
+
+
+def _count_in_shared_file(path):
+    registry = metrics.MetricsRegistry(metrics.RetryMetrics)
+    registry.share(path, max_commands=4, max_lanes=8)
+    for _ in range(10):
+        registry['shared_command']._increment_retry_attempts()
@@ -58,3 +58,125 @@ def test_create_result_predicate():
     assert predicates.__NEVER == create_result_predicate(UNDEFINED)
     assert isinstance(create_result_predicate(lambda: False), predicates._CustomPredicate)
     assert predicates._EqualTo(5) == create_result_predicate(5)
+
+
+def test_combinators():
+    import errno
+    import ssl
+
+    predicate = predicates.is_instance_of(ConnectionError) \
+        | (predicates.is_instance_of(OSError) & predicates.has_attribute('errno', errno.ECONNRESET)) \
+        & ~predicates.is_instance_of(ssl.SSLError)
+
+    assert predicate(ConnectionRefusedError()) is True
+    assert predicate(OSError(errno.ECONNRESET, 'reset')) is True
+    assert predicate(OSError(errno.ENOENT, 'missing')) is False
+    assert predicate(ssl.SSLError(errno.ECONNRESET, 'reset')) is False
+    assert predicate(ValueError()) is False
+
+    compiled = predicate.compile()
+    assert compiled is predicate.compile()
+    for error in [ConnectionRefusedError(), OSError(errno.ECONNRESET, 'r'), OSError(errno.ENOENT, 'm'), KeyError()]:
+        assert compiled(error) == predicate.test(error)
+
+
+def test_combinators_with_hints():
+    predicate = ValueError | predicates.message_matches('timed? ?out', flags=2)
+    assert predicate(ValueError()) is True
+    assert predicate(RuntimeError('Timed out after 3s')) is True
+    assert predicate(RuntimeError('refused')) is False
+
+    predicate = predicates.has_attribute('status') & (lambda e: e.status >= 500)
+    error = RuntimeError()
+    assert predicate(error) is False
+    error.status = 503
+    assert predicate(error) is True
+    error.status = 404
+    assert predicate(error) is False
+
+    with pytest.raises(TypeError):
+        predicates.is_instance_of(ValueError) | 10
+
+
+def test_combinations_are_flattened():
+    a, b, c = (predicates._CustomPredicate(lambda e: False) for _ in range(3))
+    assert len((a | b | c).predicates) == 3
+    assert len((a & (b & c)).predicates) == 3
+    assert ~~a is a
+
+    merged = predicates.is_instance_of(KeyError) | ValueError | [TypeError, IndexError]
+    assert merged == predicates._Any([predicates._IsInstanceOf((KeyError, ValueError, TypeError, IndexError))])
+
+
+def test_type_decisions_are_cached():
+    checked = []
+
+    class Checked(type):
+        def __instancecheck__(cls, instance):
+            checked.append(instance)
+            return isinstance(instance, ValueError)
+
+    class CheckedError(Exception, metaclass=Checked):
+        pass
+
+    predicate = predicates.is_instance_of(CheckedError) & ~predicates.is_instance_of(KeyError)
+    for _ in range(10):
+        assert predicate(ValueError()) is True
+        assert predicate(KeyError()) is False
+    assert len(checked) == 2
+
+    cached = predicates._cached_by_type(lambda arg: True)
+    for i in range(predicates.TYPE_CACHE_SIZE + 10):
+        assert cached(type('Type%d' % i, (), {})())
+
+
+def test_has_status():
+    class Response:
+        def __init__(self, **kwargs):
+            self.__dict__.update(kwargs)
+
+    predicate = predicates.has_status(429, range(502, 505))
+    assert predicate(Response(status_code=503)) is True
+    assert predicate(Response(status=429)) is True
+    assert predicate(Response(response=Response(status_code=504))) is True
+    assert predicate(Response(status_code=500)) is False
+    assert predicate(Response()) is False
+    assert predicate(None) is False
+
+    assert predicates.has_status().codes == predicates.RETRYABLE_STATUS_CODES
+
+
+def test_has_status_with_an_unhashable_status():
+    from toughpy.retry import Retry
+
+    class Status:
+        def __eq__(self, other):
+            return False
+
+    class Pod:
+        status = Status()
+
+    predicate = predicates.has_status()
+    assert predicate(Pod()) is False
+    assert predicate.compile()(Pod()) is False
+    assert isinstance(Retry(on_result=predicate).execute(lambda: Pod()), Pod)
+
+
+def test_has_errno():
+    import errno
+
+    predicate = predicates.has_errno()
+    assert predicate(OSError(errno.ECONNRESET, 'reset')) is True
+    assert predicate(OSError(errno.ENOENT, 'missing')) is False
+    assert predicate(ValueError()) is False
+
+    try:
+        try:
+            raise ConnectionRefusedError(errno.ECONNREFUSED, 'refused')
+        except OSError as e:
+            raise RuntimeError('wrapped') from e
+    except RuntimeError as e:
+        assert predicate(e) is True
+
+    predicate = predicates.has_code(lambda e: getattr(e, 'code', None), 1, range(10, 12))
+    assert predicate.codes == frozenset([1, 10, 11])
@@ -0,0 +1,152 @@
+import asyncio
+import pytest
+
+from toughpy.duration import Duration, milliseconds, seconds
+from toughpy.ratelimit import RateLimiter, KeyedRateLimiter, RateLimitExceededError
+from tests.testutil import assert_close_to, Timer
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestRateLimiter:
+    def test_spacing_permits(self):
+        clock = FakeClock()
+        limiter = RateLimiter(10, period=Duration(1, seconds), clock=clock)
+
+        assert limiter.try_acquire() is True
+        assert limiter.try_acquire() is False
+
+        clock.now += 0.1
+        assert limiter.try_acquire() is True
+        assert limiter.try_acquire() is False
+
+    def test_bursts(self):
+        clock = FakeClock()
+        limiter = RateLimiter(10, period=1, burst=5, clock=clock)
+
+        assert all(limiter.try_acquire() for _ in range(5))
+        assert limiter.try_acquire() is False
+
+        clock.now += 0.2
+        assert limiter.try_acquire(permits=2) is True
+        assert limiter.try_acquire() is False
+
+        with pytest.raises(ValueError):
+            limiter.try_acquire(permits=6)
+
+    def test_idle_time_does_not_accumulate_beyond_burst(self):
+        clock = FakeClock()
+        limiter = RateLimiter(10, period=1, burst=2, clock=clock)
+
+        clock.now += 60
+        assert limiter.try_acquire() is True
+        assert limiter.try_acquire() is True
+        assert limiter.try_acquire() is False
+
+    def test_blocking_acquire(self):
+        limiter = RateLimiter(1, period=Duration(100, milliseconds))
+        with Timer() as timer:
+            for _ in range(3):
+                limiter.acquire()
+
+        assert_close_to(timer.elapsed, expected=0.2, delta=0.05)
+
+    def test_acquire_timeout(self):
+        clock = FakeClock()
+        limiter = RateLimiter(1, period=10, name='quota', clock=clock)
+        limiter.acquire()
+
+        with pytest.raises(RateLimitExceededError) as e:
+            limiter.acquire(timeout=Duration(5, seconds))
+
+        assert e.value.retry_after == 10
+        assert 'quota' in str(e.value)
+
+    def test_decorator(self):
+        limiter = RateLimiter(1, period=60, max_wait_duration=0)
+
+        @limiter
+        def call():
+            return 'ok'
+
+        assert call() == 'ok'
+        with pytest.raises(RateLimitExceededError):
+            call()
+
+    def test_execute(self):
+        limiter = RateLimiter(1, period=60, max_wait_duration=0)
+
+        assert limiter.execute(lambda x: x * 2, 21) == 42
+        with pytest.raises(RateLimitExceededError):
+            limiter.execute(lambda: 1)
+
+    def test_pickling_rejections(self):
+        import pickle
+
+        limiter = RateLimiter(1, period=60, max_wait_duration=0, name='limiter')
+        limiter.execute(lambda: 1)
+        with pytest.raises(RateLimitExceededError) as raised:
+            limiter.execute(lambda: 1)
+
+        error = pickle.loads(pickle.dumps(raised.value))
+        assert str(error) == str(raised.value)
+        assert error.retry_after == raised.value.retry_after
+        assert error.args == raised.value.args
+
+    def test_asyncio(self):
+        limiter = RateLimiter(1, period=0.05)
+
+        @limiter
+        async def call():
+            return asyncio.get_running_loop().time()
+
+        async def run():
+            return await asyncio.gather(*[call() for _ in range(3)])
+
+        times = sorted(asyncio.run(run()))
+        assert_close_to(times[-1] - times[0], expected=0.1, delta=0.04)
+
+    def test_invalid_values(self):
+        with pytest.raises(ValueError):
+            RateLimiter(0)
+
+        with pytest.raises(ValueError):
+            RateLimiter(1, period=0)
+
+        with pytest.raises(ValueError):
+            RateLimiter(1, burst=0)
+
+
+class TestKeyedRateLimiter:
+    def test_separate_limits_per_key(self):
+        clock = FakeClock()
+        limiter = KeyedRateLimiter(1, period=1, clock=clock)
+
+        assert limiter.try_acquire('a') is True
+        assert limiter.try_acquire('a') is False
+        assert limiter.try_acquire('b') is True
+
+    def test_bounded_memory(self):
+        clock = FakeClock()
+        limiter = KeyedRateLimiter(1, period=1, max_keys=3, clock=clock)
+
+        for key in range(10):
+            limiter.try_acquire(key)
+
+        assert len(limiter) == 3
+        assert limiter.try_acquire(9) is False  # recently used keys are kept
+        assert limiter.try_acquire(0) is True  # evicted keys start afresh
+
+    def test_acquire(self):
+        clock = FakeClock()
+        limiter = KeyedRateLimiter(1, period=1, clock=clock)
+        limiter.acquire('a')
+
+        with pytest.raises(RateLimitExceededError):
+            limiter.acquire('a', timeout=0.5)
@@ -1,8 +1,15 @@
 from toughpy.retry import *
+import asyncio
 import random as rnd
+import traceback
 import pytest
 from tests.testutil import assert_close_to, timeit
 from toughpy.utils import UNDEFINED
+from toughpy import metrics, command
+from toughpy.deadline import remaining_time, deadline_scope
+from toughpy.duration import Duration, milliseconds
+from toughpy.timeout import AttemptTimeoutError
+import time
 
 ERROR_TYPES = [TimeoutError, ConnectionError, OSError, ValueError, KeyError, BaseException, Exception]
 DEFAULT_BACKOFF = 0.5
@@ -42,6 +49,15 @@ class BaseRetryTest:
 
         return _do
 
+    def fail_async_with(self, error_type, times):
+        async def _do():
+            self.invocations += 1
+            if self.invocations <= times:
+                raise error_type()
+            return self.invocations
+
+        return _do
+
 
 class TestRetryOnError(BaseRetryTest):
 
@@ -75,6 +91,21 @@ class TestRetryOnError(BaseRetryTest):
 
         assert DEFAULT_MAX_ATTEMPTS == self.invocations
 
+    def test_errno_table(self):
+        import errno
+        from toughpy.predicates import has_errno
+
+        refused = self.fail_with(lambda: OSError(errno.ECONNREFUSED, 'Connection refused'))
+        with pytest.raises(OSError):
+            retry(refused, on_error=has_errno(errno.ECONNREFUSED, errno.ETIMEDOUT), backoff=0).__call__()
+        assert DEFAULT_MAX_ATTEMPTS == self.invocations
+
+        self.invocations = 0
+        missing = self.fail_with(lambda: OSError(errno.ENOENT, 'No such file'))
+        with pytest.raises(OSError):
+            retry(missing, on_error=has_errno(errno.ECONNREFUSED, errno.ETIMEDOUT), backoff=0).__call__()
+        assert 1 == self.invocations
+
 
 class TestRetryOnResult(BaseRetryTest):
     def test_never_retry_by_default(self):
@@ -93,6 +124,20 @@ class TestRetryOnResult(BaseRetryTest):
         retry(self.return_(-1), on_result=is_negative, backoff=0).__call__()
         assert DEFAULT_MAX_ATTEMPTS == self.invocations
 
+    def test_status_table(self):
+        from toughpy.predicates import has_status
+
+        class Response:
+            def __init__(self, status_code):
+                self.status_code = status_code
+
+        retry(self.return_(Response(503)), on_result=has_status(), backoff=0).__call__()
+        assert DEFAULT_MAX_ATTEMPTS == self.invocations
+
+        self.invocations = 0
+        retry(self.return_(Response(404)), on_result=has_status(), backoff=0).__call__()
+        assert 1 == self.invocations
+
 
 class TestMaxAttempts(BaseRetryTest):
     def test_invalid_values(self):
@@ -186,3 +231,439 @@ class TestAfterEachAttemptHook(BaseRetryTest):
 
     def _handler(self, attempt):
         self._handler_counter += 1
+
+
+class TestAsyncRetry(BaseRetryTest):
+    def test_decorating_a_coroutine_function(self):
+        decorated = retry(self.fail_async_with(TimeoutError, times=2), backoff=0)
+
+        assert asyncio.iscoroutinefunction(decorated)
+        assert 3 == asyncio.run(decorated())
+        assert 3 == self.invocations
+
+    def test_raising_the_last_error(self):
+        decorated = Retry(max_attempts=4, backoff=0)(self.fail_async_with(ConnectionError, times=10))
+
+        with pytest.raises(ConnectionError):
+            asyncio.run(decorated())
+
+        assert 4 == self.invocations
+
+    def test_not_blocking_the_event_loop(self):
+        @retry(on_result=None, backoff=0.1)
+        async def always_none():
+            self.invocations += 1
+
+        async def run_concurrently():
+            started = asyncio.get_running_loop().time()
+            await asyncio.gather(*[always_none() for _ in range(20)])
+            return asyncio.get_running_loop().time() - started
+
+        assert_close_to(asyncio.run(run_concurrently()), expected=0.2)
+        assert 20 * DEFAULT_MAX_ATTEMPTS == self.invocations
+
+    def test_result_predicate(self):
+        async def return_none():
+            self.invocations += 1
+
+        asyncio.run(Retry(on_result=None, backoff=0).execute_async(return_none))
+        assert DEFAULT_MAX_ATTEMPTS == self.invocations
+
+    def test_executing_a_coroutine_function_synchronously(self):
+        with pytest.raises(TypeError):
+            Retry(backoff=0).execute(self.fail_async_with(ConnectionError, times=10))
+
+        assert 0 == self.invocations
+
+    def test_executing_a_sync_function_asynchronously(self):
+        with pytest.raises(TypeError):
+            asyncio.run(Retry(on_result=None, backoff=0).execute_async(self.return_(None)))
+
+        assert 1 == self.invocations
+
+    def test_timing_out_the_first_attempt(self):
+        async def slow():
+            self.invocations += 1
+            await asyncio.sleep(1 if self.invocations == 1 else 0)
+            return self.invocations
+
+        assert 2 == asyncio.run(Retry(backoff=0, attempt_timeout=0.05).execute_async(slow))
+
+
+class TestMaxDuration(BaseRetryTest):
+    def test_failing_fast_when_backoff_exceeds_the_deadline(self):
+        elapsed_time = timeit(retry(self.fail_(), max_attempts=10, backoff=0.3,
+                                    max_duration=Duration(500, milliseconds)))
+
+        assert_close_to(elapsed_time, expected=0.3, delta=0.05)
+        assert 2 == self.invocations
+
+    def test_counting_aborted_retries(self):
+        metrics.retry_metrics.clear()
+
+        @retry(on_result=None, backoff=1, max_duration=0.5)
+        @command('deadline_command')
+        def return_none():
+            self.invocations += 1
+
+        return_none()
+
+        assert 1 == self.invocations
+        assert 1 == metrics.retry_metrics['deadline_command'].retries_aborted_by_deadline
+
+    def test_exposing_the_remaining_time(self):
+        remaining = []
+
+        @retry(on_result=None, backoff=0.1, max_duration=1)
+        def return_none():
+            remaining.append(remaining_time())
+
+        return_none()
+
+        assert remaining_time() is None
+        assert_close_to(remaining[0], expected=1.0, delta=0.05)
+        assert_close_to(remaining[1], expected=0.9, delta=0.05)
+        assert_close_to(remaining[2], expected=0.8, delta=0.05)
+
+    def test_respecting_an_enclosing_deadline(self):
+        with deadline_scope(0.25):
+            elapsed_time = timeit(retry(self.fail_(), max_attempts=10, backoff=0.1))
+
+        assert_close_to(elapsed_time, expected=0.2, delta=0.05)
+        assert 3 == self.invocations
+
+    def test_asyncio(self):
+        remaining = []
+
+        @retry(on_result=None, max_attempts=10, backoff=0.1, max_duration=0.25)
+        async def return_none():
+            remaining.append(remaining_time())
+
+        asyncio.run(return_none())
+        assert 3 == len(remaining)
+
+
+class TestAttemptTimeout(BaseRetryTest):
+    def test_timed_out_attempts_are_retried(self):
+        metrics.retry_metrics.clear()
+
+        @retry(on_error=TimeoutError, attempt_timeout=Duration(50, milliseconds), backoff=0)
+        @command('slow_command')
+        def slow_at_first():
+            self.invocations += 1
+            if self.invocations < 3:
+                time.sleep(0.2)
+            return self.invocations
+
+        assert 3 == slow_at_first()
+
+        rm = metrics.retry_metrics['slow_command']
+        assert rm.timed_out_attempts == 2
+        assert rm.abandoned_attempts == 2
+        assert rm.successful_calls_with_retry == 1
+
+    def test_raising_the_timeout(self):
+        with pytest.raises(AttemptTimeoutError):
+            retry(lambda: time.sleep(0.2), attempt_timeout=0.01, max_attempts=2, backoff=0).__call__()
+
+    def test_shortened_by_the_deadline(self):
+        elapsed_time = timeit(retry(lambda: time.sleep(1), attempt_timeout=0.5, max_duration=0.1, backoff=0))
+        assert_close_to(elapsed_time, expected=0.1, delta=0.05)
+
+    def test_asyncio(self):
+        @retry(attempt_timeout=0.02, backoff=0)
+        async def slow_at_first():
+            self.invocations += 1
+            if self.invocations < 3:
+                await asyncio.sleep(1)
+            return self.invocations
+
+        assert 3 == asyncio.run(slow_at_first())
+
+
+class TestTracebackCapture(BaseRetryTest):
+    def test_summary_in_retry_error(self):
+        with pytest.raises(RetryError) as e:
+            retry(self.fail_with(ValueError), wrap_error=True, backoff=0, capture_traceback='summary').__call__()
+
+        last_attempt = e.value.last_attempt
+        assert last_attempt.get_error().__traceback__ is None
+        assert 'in _do' in repr(last_attempt)
+
+    def test_attempts_passed_to_the_handler(self):
+        attempts = []
+        with pytest.raises(ValueError):
+            Retry(max_attempts=3, backoff=0, capture_traceback='none')\
+                .after_each_attempt(attempts.append)\
+                .execute(self.fail_with(ValueError))
+
+        assert 3 == len(attempts)
+        # the last error gets a new traceback when it is raised again
+        assert all(a.get_error().__traceback__ is None for a in attempts[:-1])
+        assert '' == attempts[0].format_traceback()
+
+    def test_error_raised_to_the_caller_keeps_its_traceback(self):
+        attempts = []
+        with pytest.raises(ValueError) as e:
+            Retry(max_attempts=3, backoff=0, capture_traceback='summary')\
+                .after_each_attempt(attempts.append)\
+                .execute(self.fail_with(ValueError))
+
+        assert e.value is attempts[-1].get_error()
+        assert '_do' in [frame.name for frame in traceback.extract_tb(e.value.__traceback__)]
+        assert attempts[0].get_error().__traceback__ is None
+        assert 'in _do' in attempts[0].format_traceback()
+
+    def test_full_by_default(self):
+        with pytest.raises(RetryError) as e:
+            retry(self.fail_with(ValueError), wrap_error=True, backoff=0).__call__()
+
+        assert e.value.last_attempt.get_error().__traceback__ is not None
+
+    def test_invalid_policy(self):
+        with pytest.raises(ValueError):
+            Retry(capture_traceback='everything')
+
+
+class TestCommandResolution(BaseRetryTest):
+    def test_metrics_are_looked_up_again_after_clear(self):
+        @retry(backoff=0)
+        @command('resolved_command')
+        def succeed():
+            return 1
+
+        succeed()
+        old = metrics.retry_metrics['resolved_command']
+        metrics.retry_metrics.clear()
+        succeed()
+        new = metrics.retry_metrics['resolved_command']
+
+        assert new is not old
+        assert 1 == old.total_calls
+        assert 1 == new.total_calls
+
+    def test_execute_caches_the_command_of_a_function(self):
+        from toughpy.retry import _command_of
+
+        def succeed():
+            return 1
+
+        assert _command_of(succeed) is _command_of(succeed)
+        assert 1 == Retry(backoff=0).execute(succeed)
+
+    def test_the_cached_commands_do_not_keep_the_methods_alive(self):
+        import gc
+        import weakref
+        from toughpy.retry import _command_of
+
+        class Client:
+            def __eq__(self, other):
+                return False  # unhashable
+
+            def get(self):
+                return 1
+
+        client = Client()
+        assert _command_of(client.get) is _command_of(client.get)
+        assert 1 == Retry(backoff=0).execute(client.get)
+        assert _command_of(client.get).name.endswith('Client.get')
+
+        instance = weakref.ref(client)
+        del client
+        gc.collect()
+        assert instance() is None
+
+
+class TestSleep(BaseRetryTest):
+    def test_spending_the_delays_in_a_custom_sleep(self):
+        delays = []
+        elapsed_time = timeit(retry(self.fail_(), backoff=[1, 2], sleep=delays.append))
+
+        assert [1, 2] == delays
+        assert elapsed_time < 0.5
+
+    def test_ending_retries_when_the_backoff_budget_is_spent(self):
+        from toughpy.backoffs import FixedBackoff
+
+        delays = []
+        policy = Retry(max_attempts=10, backoff=FixedBackoff(2, total_budget=5), sleep=delays.append)
+        with pytest.raises(BaseException):
+            policy.execute(self.fail_())
+
+        assert [2, 2, 1] == delays
+        assert 4 == self.invocations
+        assert 5 == policy.worst_case_wait
+
+    def test_passing_the_previous_delay_to_the_backoff(self):
+        from toughpy.backoffs import DecorrelatedJitter
+
+        delays = []
+        policy = Retry(max_attempts=6, backoff=DecorrelatedJitter(1, max_delay=100), sleep=delays.append)
+        with pytest.raises(BaseException):
+            policy.execute(self.fail_())
+
+        assert 5 == len(delays)
+        for previous, delay in zip([1] + delays, delays):
+            assert 1 <= delay <= 3 * previous
+
+
+class TestBatch(BaseRetryTest):
+    def test_resending_only_the_failed_items(self):
+        batches = []
+        failures = {'b': 2, 'c': 1}
+
+        def bulk_put(batch):
+            batches.append(list(batch))
+            outcomes = []
+            for item in batch:
+                if failures.get(item, 0) > 0:
+                    failures[item] -= 1
+                    outcomes.append(ConnectionError(item))
+                else:
+                    outcomes.append(item.upper())
+            return outcomes
+
+        results = Retry(max_attempts=3, backoff=0).execute_batch(bulk_put, ['a', 'b', 'c'])
+
+        assert ['A', 'B', 'C'] == results
+        assert [['a', 'b', 'c'], ['b', 'c'], ['b']] == batches
+
+    def test_outcomes_keyed_by_item(self):
+        def bulk_index(batch):
+            return {doc['id']: None if doc['id'] == 2 and self.invocations == 0 else 'ok' for doc in batch}
+
+        def counting(batch):
+            outcomes = bulk_index(batch)
+            self.invocations += 1
+            return outcomes
+
+        docs = [{'id': 1}, {'id': 2}]
+        results = Retry(on_result=None, backoff=0).execute_batch(counting, docs, key=lambda doc: doc['id'])
+
+        assert ['ok', 'ok'] == results
+        assert 2 == self.invocations
+
+    def test_raising_the_failed_items(self):
+        def bulk_put(batch):
+            self.invocations += 1
+            return [ValueError(item) if item % 2 else item for item in batch]
+
+        with pytest.raises(BatchRetryError) as e:
+            Retry(max_attempts=2, backoff=0).execute_batch(bulk_put, range(4))
+
+        assert 2 == self.invocations
+        assert [1, 3] == [int(str(a.get_error())) for a in e.value.failed_attempts]
+        assert [1, 2, 1, 2] == [a.attempt_number for a in e.value.attempts]
+
+    def test_retrying_the_whole_batch_when_it_raises(self):
+        def bulk_put(batch):
+            self.invocations += 1
+            if self.invocations == 1:
+                raise ConnectionError()
+            return list(batch)
+
+        assert [1, 2] == Retry(backoff=0).execute_batch(bulk_put, [1, 2])
+        assert 2 == self.invocations
+
+    def test_empty_batch(self):
+        def bulk_put(batch):
+            self.invocations += 1
+            return list(batch)
+
+        assert [] == Retry(backoff=0).execute_batch(bulk_put, [])
+        assert [] == Retry(backoff=0).execute_batch(bulk_put, iter([]))
+        assert 0 == self.invocations
+
+    def test_metrics_count_the_calls_of_the_batch_function(self):
+        metrics.retry_metrics.clear()
+
+        @command('batch_command')
+        def bulk_put(batch):
+            self.invocations += 1
+            return [ValueError() if self.invocations == 1 and item == 1 else item for item in batch]
+
+        Retry(backoff=0).execute_batch(bulk_put, [1, 2, 3])
+
+        rm = metrics.retry_metrics['batch_command']
+        assert 1 == rm.successful_calls_with_retry
+        assert 1 == rm.total_retry_attempts
+        assert 2 == rm.attempt_latency.count()
+
+
+class TestStream(BaseRetryTest):
+    def flaky_source(self, size, fail_at):
+        """Opens a stream of range(size) from the given offset, which fails once at each offset in `fail_at`."""
+        opened = []
+        fail_at = set(fail_at)
+
+        def open_from(offset):
+            opened.append(offset)
+            for i in range(offset, size):
+                if i in fail_at:
+                    fail_at.discard(i)
+                    raise ConnectionError(i)
+                yield i
+
+        return open_from, opened
+
+    def test_resuming_from_the_offset(self):
+        source, opened = self.flaky_source(6, fail_at=[2, 4])
+
+        assert list(range(6)) == list(retry_stream(source, backoff=0))
+        assert [0, 2, 4] == opened
+
+    def test_resuming_from_a_cursor(self):
+        rows = [{'id': i} for i in range(10, 15)]
+        opened = []
+
+        def scan(after_id):
+            opened.append(after_id)
+            for row in rows:
+                if after_id is not None and row['id'] <= after_id:
+                    continue
+                if row['id'] == 12 and len(opened) == 1:
+                    raise TimeoutError()
+                yield row
+
+        result = list(retry_stream(scan, resume_from=lambda row: row['id'], backoff=0))
+
+        assert rows == result
+        assert [None, 11] == opened
+
+    def test_limiting_the_failures_in_a_row(self):
+        def always_failing_after_one(offset):
+            if offset == 0:
+                yield 'first'
+            raise ConnectionError()
+
+        stream = retry_stream(always_failing_after_one, max_attempts=3, backoff=0)
+        assert 'first' == next(stream)
+        with pytest.raises(ConnectionError):
+            next(stream)
+
+    def test_per_item_metrics(self):
+        metrics.retry_metrics.clear()
+        source, _ = self.flaky_source(3, fail_at=[1])
+        command('stream_command')(source)
+
+        list(retry_stream(source, backoff=0))
+
+        rm = metrics.retry_metrics['stream_command']
+        assert 2 == rm.successful_calls_without_retry
+        assert 1 == rm.successful_calls_with_retry
+        assert 1 == rm.total_retry_attempts
+
+    def test_closing_the_source(self):
+        closed = []
+
+        def source(offset):
+            try:
+                yield from range(offset, 10)
+            finally:
+                closed.append(offset)
+
+        stream = Retry(backoff=0).stream(source)
+        assert 0 == next(stream)
+        stream.close()
+
+        assert [0] == closed
@@ -0,0 +1,125 @@
+import asyncio
+import threading
+import time
+import pytest
+
+from toughpy import timeout as tmo
+from toughpy.timeout import AttemptTimeoutError, call_with_timeout, call_with_timeout_async
+from toughpy.deadline import deadline_scope, remaining_time
+
+
+class TestCallWithTimeout:
+    def test_returning_the_result(self):
+        assert call_with_timeout(lambda x, y: x + y, (1,), {'y': 2}, 1) == 3
+
+    def test_raising_the_error_of_the_call(self):
+        def raise_timeout_error():
+            raise TimeoutError('of the call')
+
+        with pytest.raises(TimeoutError) as e:
+            call_with_timeout(raise_timeout_error, (), {}, 1)
+
+        assert not isinstance(e.value, AttemptTimeoutError)
+
+    def test_timing_out(self):
+        release = threading.Event()
+        with pytest.raises(AttemptTimeoutError) as e:
+            call_with_timeout(release.wait, (), {}, 0.05)
+
+        assert e.value.timeout == 0.05
+        release.set()
+
+    def test_pickling_the_timeout_error(self):
+        import pickle
+
+        error = pickle.loads(pickle.dumps(AttemptTimeoutError(0.05)))
+        assert isinstance(error, AttemptTimeoutError)
+        assert error.timeout == 0.05
+        assert str(error) == 'The attempt did not complete in 0.050s'
+
+    def test_propagating_the_context(self):
+        with deadline_scope(10):
+            remaining = call_with_timeout(remaining_time, (), {}, 1)
+
+        assert 9 < remaining <= 10
+
+    def test_bounded_number_of_threads(self):
+        tmo.configure_executor(max_workers=2)
+        try:
+            release = threading.Event()
+            for _ in range(5):
+                with pytest.raises(AttemptTimeoutError):
+                    call_with_timeout(release.wait, (), {}, 0.01)
+
+            assert tmo._get_executor()._workers == 2
+            release.set()
+        finally:
+            tmo.configure_executor()
+
+    def test_replaced_pools_stop_their_threads(self):
+        def attempt_threads():
+            return sum(1 for t in threading.enumerate() if t.name.startswith('toughpy-attempt-'))
+
+        def wait_for_attempt_threads(count):
+            deadline = time.monotonic() + 5
+            while attempt_threads() > count and time.monotonic() < deadline:
+                time.sleep(0.01)
+            return attempt_threads()
+
+        tmo.configure_executor(max_workers=2)
+        try:
+            call_with_timeout(lambda: 1, (), {}, 1)
+            threads = wait_for_attempt_threads(1)
+            for _ in range(10):
+                tmo.configure_executor(max_workers=2)
+                assert call_with_timeout(lambda: 1, (), {}, 1) == 1
+
+            assert wait_for_attempt_threads(threads) == threads
+        finally:
+            tmo.configure_executor()
+
+    def test_attempts_queued_in_a_replaced_pool_still_run(self):
+        tmo.configure_executor(max_workers=1)
+        try:
+            release = threading.Event()
+            executor = tmo._get_executor()
+            blocked, queued = executor.submit(release.wait), executor.submit(lambda: 'queued')
+            tmo.configure_executor()
+            late = executor.submit(lambda: 'late')
+            release.set()
+
+            assert blocked.result(1) is True
+            assert queued.result(1) == 'queued'
+            assert late.result(1) == 'late'
+        finally:
+            tmo.configure_executor()
+
+    def test_invalid_max_workers(self):
+        with pytest.raises(ValueError):
+            tmo.configure_executor(max_workers=0)
+
+
+class TestCallWithTimeoutAsync:
+    def test_returning_the_result(self):
+        async def add(x, y):
+            return x + y
+
+        assert asyncio.run(call_with_timeout_async(add, (1, 2), {}, 1)) == 3
+
+    def test_cancelling_on_timeout(self):
+        cancelled = []
+
+        async def hang():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+
+        async def run():
+            with pytest.raises(AttemptTimeoutError):
+                await call_with_timeout_async(hang, (), {}, 0.01)
+            await asyncio.sleep(0)
+
+        asyncio.run(run())
+        assert cancelled == [True]
@@ -2,4 +2,14 @@ from toughpy.retry import *
 from toughpy.backoffs import *
 from toughpy.duration import *
 from toughpy.attempt import *
+from toughpy.circuitbreaker import *
+from toughpy.budget import *
+from toughpy.bulkhead import *
+from toughpy.ratelimit import *
+from toughpy.deadline import *
+from toughpy.timeout import *
+from toughpy.hedge import *
+from toughpy.executor import *
+from toughpy.exporters import *
+from toughpy.predicates import *
 from toughpy.utils import command, UNDEFINED
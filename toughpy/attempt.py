@@ -1,20 +1,28 @@
 from abc import abstractmethod
+import asyncio
 import sys
 import six
 import traceback
 
+TRACEBACK_FULL = 'full'
+TRACEBACK_SUMMARY = 'summary'
+TRACEBACK_NONE = 'none'
+TRACEBACK_POLICIES = (TRACEBACK_FULL, TRACEBACK_SUMMARY, TRACEBACK_NONE)
+
 
 class Attempt:
+    __slots__ = ('attempt_number',)
+
     @classmethod
     def try_first(cls, fn, *args, **kwargs):
-        return cls(0).try_next(fn, *args, **kwargs)
+        return _try(1, fn, args, kwargs)
 
-    def __init__(self, attempt_number):
-        self._attempt_number = attempt_number
+    @classmethod
+    async def try_first_async(cls, fn, *args, **kwargs):
+        return await _try_async(1, fn, args, kwargs)
 
-    @property
-    def attempt_number(self):
-        return self._attempt_number
+    def __init__(self, attempt_number):
+        self.attempt_number = attempt_number
 
     @abstractmethod
     def is_success(self):
@@ -32,16 +40,33 @@ class Attempt:
         pass
 
     def try_next(self, fn, *args, **kwargs):
-        next_attempt_number = self.attempt_number + 1
-        try:
-            return Success(fn(*args, **kwargs), next_attempt_number)
-        except BaseException:
-            return Failure(sys.exc_info(), next_attempt_number)
+        return _try(self.attempt_number + 1, fn, args, kwargs)
+
+    async def try_next_async(self, fn, *args, **kwargs):
+        return await _try_async(self.attempt_number + 1, fn, args, kwargs)
+
+
+def _try(attempt_number, fn, args, kwargs):
+    try:
+        return Success(fn(*args, **kwargs), attempt_number)
+    except BaseException:
+        return Failure(sys.exc_info(), attempt_number)
+
+
+async def _try_async(attempt_number, fn, args, kwargs):
+    try:
+        return Success(await fn(*args, **kwargs), attempt_number)
+    except asyncio.CancelledError:
+        raise  # cancellation of the running task is never an attempt outcome
+    except BaseException:
+        return Failure(sys.exc_info(), attempt_number)
 
 
 class Success(Attempt):
+    __slots__ = ('_value',)
+
     def __init__(self, value, attempt_number=1):
-        super().__init__(attempt_number)
+        self.attempt_number = attempt_number
         self._value = value
 
     def is_success(self):
@@ -58,11 +83,15 @@ class Success(Attempt):
 
 
 class Failure(Attempt):
+    __slots__ = ('_error_type', '_error', '_traceback', '_stack', '_formatted_traceback')
+
     def __init__(self, exc_info, attempt_number=1):
-        super().__init__(attempt_number)
+        self.attempt_number = attempt_number
         self._error_type = exc_info[0]
         self._error = exc_info[1]
         self._traceback = exc_info[2]
+        self._stack = None
+        self._formatted_traceback = None
 
     def is_success(self):
         return False
@@ -73,14 +102,54 @@ class Failure(Attempt):
     def get_error(self):
         return self._error
 
+    def compact_traceback(self, policy):
+        """
+        Releases the frames, and so their locals, pinned by the traceback of the error unless the policy is
+        TRACEBACK_FULL. With TRACEBACK_SUMMARY only the file names, line numbers and function names are kept in a
+        StackSummary whose source lines are read lazily; with TRACEBACK_NONE nothing is kept. The tracebacks of the
+        causes of the error are dropped as well, and `get` raises the error without its original traceback.
+        """
+        if policy == TRACEBACK_FULL or self._traceback is None:
+            return
+
+        if policy == TRACEBACK_SUMMARY:
+            self._stack = traceback.StackSummary.extract(traceback.walk_tb(self._traceback), lookup_lines=False)
+
+        self._traceback = None
+        self._formatted_traceback = None
+        _drop_tracebacks(self._error)
+
+    def format_traceback(self):
+        """Renders the traceback once, on the first call, and returns the cached text afterwards."""
+        if self._formatted_traceback is None:
+            if self._traceback is not None:
+                self._formatted_traceback = ''.join(traceback.format_tb(self._traceback))
+            elif self._stack is not None:
+                self._formatted_traceback = ''.join(self._stack.format())
+            else:
+                self._formatted_traceback = ''
+
+        return self._formatted_traceback
+
     def __repr__(self) -> str:
         return '{0}: {1}\n{2}'.format(self._error_type.__name__,
                                       str(self.get_error()),
-                                      "".join(traceback.format_tb(self._traceback)))
+                                      self.format_traceback())
+
+
+def _drop_tracebacks(error):
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        error.__traceback__ = None
+        error = error.__cause__ or error.__context__
 
 
 __all__ = [
     'Attempt',
     'Success',
-    'Failure'
+    'Failure',
+    'TRACEBACK_FULL',
+    'TRACEBACK_SUMMARY',
+    'TRACEBACK_NONE'
 ]
@@ -1,5 +1,15 @@
+import datetime
+import email.utils
+import hashlib
+import math
+import os
 import random as r
+import threading
+import time
 from abc import abstractmethod
+import toughpy.metrics as metrics
+from toughpy.attempt import Attempt
+from toughpy.duration import Duration
 from toughpy.utils import *
 
 _msg_invalid_backoff = '''A value of `%s` is not a valid backoff. It should be on of the followings:
@@ -10,57 +20,197 @@ _msg_invalid_backoff = '''A value of `%s` is not a valid backoff. It should be o
  - A callable which takes an attempt_number and returns a number which is the delay in seconds.
 '''
 
+MAX_FINITE_DELAY = float(2 ** 31)  # about 68 years, which time.sleep accepts on every platform
+
 
 class Backoff:
+    """
+    The delays between the attempts of a call. Every backoff accepts two optional limits: `max_delay` caps each
+    delay and `total_budget` caps the sum of the delays of a call. Once the budget is spent, `get_delay` returns
+    None, which ends the retries. For a randomized backoff, the budget assumes the previous delays were as long as
+    possible.
+    """
+    max_delay = None
+    total_budget = None
+    deterministic = False  # whether the delays depend on nothing but the attempt number, so can be precomputed
+    # a function Retry calls after every attempt with whether it failed, i.e. raised or has a result to retry, for
+    # the backoffs adapting to the outcomes (see AdaptiveBackoff), None for the others
+    on_outcome = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # a `get_delay` overridden below the `_delay_of` of the class, i.e. in a backoff written before `delay_at` or
+        # in a subclass of a built-in backoff, gives the delays: `delay_at`, and so the wrapping backoffs, use it too
+        getter = next(c for c in cls.__mro__ if 'get_delay' in vars(c))
+        delay_of = next(c for c in cls.__mro__ if '_delay_of' in vars(c))
+        if getter is not Backoff and not issubclass(delay_of, getter):
+            cls.delay_at = Backoff._delay_from_get_delay
 
     @staticmethod
     @abstractmethod
     def create_default(): pass
 
-    @abstractmethod
     def get_delay(self, attempt):
         """
         Calculates the delay between the given attempt and the next.
         Args:
             attempt (toughpy.Attempt): The previous execution attempt.
         Returns:
-            float: The delay in seconds
+            float: The delay in seconds, or None if the `total_budget` is spent
+        """
+        return self._delay_at(attempt.attempt_number)
+
+    def next_delay(self, attempt, previous_delay):
         """
-        pass
+        Like `get_delay`, given the delay before the attempt as well (None after the first attempt) for the
+        backoffs depending on it, e.g. DecorrelatedJitter. Retry calls this one.
+        """
+        return self.get_delay(attempt)
+
+    def delay_at(self, attempt_number):
+        """The delay after the attempt with the given number (starting from 1), see `get_delay`."""
+        delay = self._delay_of(attempt_number)
+        if delay is None:
+            return None
+
+        return self._limited(delay, attempt_number)
+
+    _delay_at = delay_at  # the delay computed by the class, whatever the `get_delay` of its subclasses
+
+    def _delay_from_get_delay(self, attempt_number):
+        delay = self.get_delay(Attempt(attempt_number))
+        if delay is None:
+            return None
+
+        return self._limited(delay, attempt_number)
+
+    def _limited(self, delay, attempt_number):
+        delay = self._capped(delay)
+        total_budget = self.total_budget
+        if total_budget is not None:
+            remaining = total_budget - self._sum_of_upper_delays(attempt_number - 1)
+            if remaining <= 0:
+                return None
+            if delay > remaining:
+                delay = remaining
+
+        return delay
+
+    def schedule(self, max_attempts):
+        """
+        Returns the list of the delays between `max_attempts` attempts, i.e. `max_attempts - 1` delays, or fewer if
+        the `total_budget` runs out. The delays of a randomized backoff are a single sample.
+        """
+        delays = []
+        for attempt_number in range(1, max_attempts):
+            delay = self.delay_at(attempt_number)
+            if delay is None:
+                break
+            delays.append(delay)
+
+        return delays
+
+    def iter_delays(self):
+        """Yields the delays one by one, endlessly unless the `total_budget` runs out."""
+        attempt_number = 1
+        while True:
+            delay = self.delay_at(attempt_number)
+            if delay is None:
+                return
+            yield delay
+            attempt_number += 1
+
+    def worst_case_wait(self, max_attempts):
+        """The longest time, in seconds, a call with `max_attempts` attempts can spend in its delays."""
+        total = self._sum_of_upper_delays(max_attempts - 1)
+        if self.total_budget is not None and total > self.total_budget:
+            total = self.total_budget
+
+        return total
+
+    def _delay_of(self, attempt_number):
+        """
+        The delay after the given attempt, before applying the limits. The backoffs written before `delay_at` only
+        override `get_delay`, which gives their delays then.
+        """
+        if type(self).get_delay is Backoff.get_delay:
+            raise NotImplementedError('%s should override `_delay_of`' % type(self).__name__)
+
+        return self.get_delay(Attempt(attempt_number))
+
+    def _upper_delay_of(self, attempt_number):
+        """The longest delay possible after the given attempt, before applying the limits."""
+        return self._delay_of(attempt_number)
+
+    def _sum_of_upper_delays(self, count):
+        """The sum of the first `count` upper delays after capping them. Subclasses compute it in closed form."""
+        return sum(self._capped(self._upper_delay_of(n)) for n in range(1, count + 1))
+
+    def _set_limits(self, max_delay, total_budget):
+        if max_delay is not None and max_delay < 0:
+            raise ValueError('`max_delay` should not be negative.')
+        if total_budget is not None and total_budget < 0:
+            raise ValueError('`total_budget` should not be negative.')
+
+        self.max_delay = max_delay
+        self.total_budget = total_budget
+
+    def _capped(self, delay):
+        max_delay = self.max_delay
+        if max_delay is not None and delay > max_delay:
+            return max_delay
+
+        return delay
 
 
 class FixedBackoff(Backoff):
+    deterministic = True
 
     @staticmethod
     def create_default():
         return FixedBackoff(0.5)
 
-    def __init__(self, delay):
+    def __init__(self, delay, max_delay=None, total_budget=None):
         self.delay = delay
+        self._set_limits(max_delay, total_budget)
 
-    def get_delay(self, attempt):
+    def _delay_of(self, attempt_number):
         return self.delay
 
+    def _sum_of_upper_delays(self, count):
+        return count * self._capped(self.delay)
+
 
 class FixedListBackoff(Backoff):
+    deterministic = True
 
     @staticmethod
     def create_default():
         return FixedListBackoff([0.5, 1, 1.5])
 
-    def __init__(self, delay_list):
+    def __init__(self, delay_list, max_delay=None, total_budget=None):
         self.delays = delay_list
+        self._set_limits(max_delay, total_budget)
+        self._sums = [0]
+        for delay in delay_list:
+            self._sums.append(self._sums[-1] + self._capped(delay))
 
-    def get_delay(self, attempt):
+    def _delay_of(self, attempt_number):
         size = len(self.delays)
-        attempt_no = attempt.attempt_number
-        if attempt_no - 1 < size:
-            idx = attempt_no - 1
+        if attempt_number - 1 < size:
+            idx = attempt_number - 1
         else:
             idx = size - 1
 
         return self.delays[idx]
 
+    def _sum_of_upper_delays(self, count):
+        size = len(self.delays)
+        if count <= size:
+            return self._sums[count]
+
+        return self._sums[size] + (count - size) * self._capped(self.delays[-1])
+
 
 class RandomBackoff(Backoff):
 
@@ -68,16 +218,22 @@ class RandomBackoff(Backoff):
     def create_default():
         return RandomBackoff(0.5, 3.0)
 
-    def __init__(self, min_seconds, max_seconds):
+    def __init__(self, min_seconds, max_seconds, max_delay=None, total_budget=None):
         self.min_seconds = min_seconds
         self.max_seconds = max_seconds
+        self._set_limits(max_delay, total_budget)
 
     def get_delay(self, attempt=None):
-        lower_bound = int(self.min_seconds * 1000)
-        upper_bound = int(self.max_seconds * 1000)
+        return self._delay_at(1 if attempt is None else attempt.attempt_number)
+
+    def _delay_of(self, attempt_number):
+        return _thread_random().uniform(self.min_seconds, self.max_seconds)
 
-        random_millis = r.randint(lower_bound, upper_bound)
-        return float(random_millis) / 1000
+    def _upper_delay_of(self, attempt_number):
+        return self.max_seconds
+
+    def _sum_of_upper_delays(self, count):
+        return count * self._capped(self.max_seconds)
 
 
 class LinearBackoff(Backoff):
@@ -86,44 +242,498 @@ class LinearBackoff(Backoff):
     def create_default():
         return LinearBackoff(initial_delay=0.5, increase=0.5)
 
-    def __init__(self, initial_delay, increase, randomizer=None):
+    def __init__(self, initial_delay, increase, randomizer=None, max_delay=None, total_budget=None):
         self.initial_delay = initial_delay
         self.increase = increase
         self.randomizer = _get_randomizer_func(randomizer)
-
-    def get_delay(self, attempt):
-        attempt_no = attempt.attempt_number
-        return self.initial_delay + self.increase * (attempt_no - 1) + self.randomizer()
+        self.deterministic = randomizer is None
+        self._randomizer_max = _get_randomizer_max(randomizer)
+        self._set_limits(max_delay, total_budget)
+
+    def _delay_of(self, attempt_number):
+        return self.initial_delay + self.increase * (attempt_number - 1) + self.randomizer()
+
+    def _upper_delay_of(self, attempt_number):
+        return self.initial_delay + self.increase * (attempt_number - 1) + self._randomizer_max
+
+    def _sum_of_upper_delays(self, count):
+        if count <= 0:
+            return 0
+        first = self.initial_delay + self._randomizer_max
+        step = self.increase
+        max_delay = self.max_delay
+        # the delays from the `start`th (from 0) to the `end`th, excluded, are below the cap and the others capped
+        start, end = 0, count
+        if max_delay is not None:
+            if step > 0:
+                end = 0 if first >= max_delay else min(count, int((max_delay - first) // step) + 1)
+            elif step < 0:
+                start = 0 if first <= max_delay else min(count, int((first - max_delay) // -step) + 1)
+            elif first > max_delay:
+                end = 0
+
+        count_below = end - start
+        return count_below * first + step * (end * (end - 1) - start * (start - 1)) / 2.0 + \
+            (count - count_below) * (max_delay or 0)
 
 
 class ExponentialBackoff(Backoff):
+    """
+    Delays of `initial_delay * base ** (n - 1)` seconds after the nth attempt. The delays are computed in floats and
+    never overflow: without a `max_delay`, they stop growing at MAX_FINITE_DELAY, which any sleep accepts; with one,
+    the power is not even computed once it would exceed the cap.
+    """
 
     @staticmethod
     def create_default():
         return ExponentialBackoff(initial_delay=0.5, base=2)
 
-    def __init__(self, initial_delay, base=2, randomizer=None):
+    def __init__(self, initial_delay, base=2, randomizer=None, max_delay=None, total_budget=None):
         self.initial_delay = initial_delay
         self.base = base
         self.randomizer = _get_randomizer_func(randomizer)
-
-    def get_delay(self, attempt):
-        attempt_no = attempt.attempt_number
-        return self.initial_delay * self.base ** (attempt_no - 1) + self.randomizer()
+        self.deterministic = randomizer is None
+        self._randomizer_max = _get_randomizer_max(randomizer)
+        self._set_limits(max_delay, total_budget)
+
+        # the exponent beyond which the delays are certainly capped
+        self._capped_exponent = None
+        if max_delay is not None and initial_delay > 0 and base > 1:
+            self._capped_exponent = math.log(max(max_delay, initial_delay) / initial_delay) / math.log(base)
+
+    def _power(self, exponent):
+        if self._capped_exponent is not None and exponent > self._capped_exponent + 1:
+            return self.max_delay
+
+        try:
+            return min(float(self.initial_delay) * self.base ** exponent, MAX_FINITE_DELAY)
+        except OverflowError:
+            return MAX_FINITE_DELAY
+
+    def _delay_of(self, attempt_number):
+        return self._power(attempt_number - 1) + self.randomizer()
+
+    def _upper_delay_of(self, attempt_number):
+        return self._power(attempt_number - 1) + self._randomizer_max
+
+    def _sum_of_upper_delays(self, count):
+        initial_delay = float(self.initial_delay)
+        base = self.base
+        extra = self._randomizer_max
+        max_delay = self.max_delay
+        if count <= 0:
+            return 0.0
+        if initial_delay <= 0 or base <= 1 or extra == float('inf'):
+            return super()._sum_of_upper_delays(count)
+
+        count_below = count
+        if max_delay is not None:
+            if initial_delay + extra >= max_delay:
+                return count * max_delay
+            # the number of delays below the cap, corrected for the rounding errors of the logarithms
+            count_below = min(count, int(math.log((max_delay - extra) / initial_delay) / math.log(base)) + 1)
+            while count_below > 0 and self._upper_delay_of(count_below) > max_delay:
+                count_below -= 1
+
+        try:
+            total = initial_delay * (base ** count_below - 1) / (base - 1) + count_below * extra
+        except OverflowError:
+            return float('inf')
+
+        return total + (count - count_below) * (max_delay or 0)
 
 
 class FibonacciBackoff(FixedListBackoff):
+    """
+    Delays following a Fibonacci sequence starting with `first` and `second`, which stops growing after `n_max`
+    attempts. The sequence is built lazily, as far as the attempts go, and no further than `max_delay`.
+    """
 
     @staticmethod
     def create_default():
         return FibonacciBackoff(first=0.5, second=1.0)
 
-    def __init__(self, first, second, n_max=16):
-        fibs = [first, second]
-        for i in range(2, n_max + 1):
+    def __init__(self, first, second, n_max=16, max_delay=None, total_budget=None):
+        self.n_max = n_max
+        self._set_limits(max_delay, total_budget)
+        self._fibs = [first, second]
+        self._sums = [0, self._capped(first), self._capped(first) + self._capped(second)]
+
+    @property
+    def delays(self):
+        """The whole sequence, as far as it grows."""
+        return self._grow(self.n_max + 1)
+
+    def _grow(self, size):
+        """Extends the sequence to `size` terms unless it has stopped growing. Racing threads only waste work."""
+        fibs = self._fibs
+        limit = min(size, self.n_max + 1)
+        if len(fibs) >= limit or (self.max_delay is not None and fibs[-1] >= self.max_delay):
+            return fibs
+
+        fibs, sums = list(fibs), list(self._sums)
+        while len(fibs) < limit and (self.max_delay is None or fibs[-1] < self.max_delay):
             fibs.append(fibs[-1] + fibs[-2])
+            sums.append(sums[-1] + self._capped(fibs[-1]))
+
+        self._sums = sums
+        self._fibs = fibs
+        return fibs
+
+    def _delay_of(self, attempt_number):
+        fibs = self._grow(attempt_number)
+        return fibs[min(attempt_number, len(fibs)) - 1]
+
+    def _sum_of_upper_delays(self, count):
+        fibs = self._grow(count)
+        sums = self._sums
+        if count < len(sums):
+            return sums[count]
+
+        return sums[len(fibs)] + (count - len(fibs)) * self._capped(fibs[-1])
+
+
+class _Jitter(Backoff):
+    """
+    Randomizes the delays of another backoff. The random numbers come from a generator per thread, or, given a `key`,
+    from a hash of the key and the attempt number, so that the delays are the same for the same key (e.g. a client
+    or a shard) and differ between keys.
+    """
+
+    def __init__(self, backoff, key=None, max_delay=None, total_budget=None):
+        self.backoff = create_backoff(backoff)
+        self.key = key
+        self._set_limits(max_delay, total_budget)
+
+    def _fraction(self, attempt_number):
+        """A number in [0, 1)."""
+        if self.key is None:
+            return _thread_random().random()
+
+        return _hash_fraction(self.key, attempt_number)
+
+    @property
+    def on_outcome(self):
+        return self.backoff.on_outcome
+
+    def _inner_upper_delay_of(self, attempt_number):
+        return self.backoff._capped(self.backoff._upper_delay_of(attempt_number))
+
+
+class FullJitter(_Jitter):
+    """Delays uniformly distributed between 0 and the delay of the wrapped backoff."""
+
+    def __init__(self, backoff, key=None, max_delay=None, total_budget=None):
+        super().__init__(backoff, key, max_delay, total_budget)
+        self.deterministic = key is not None and self.backoff.deterministic
+
+    @staticmethod
+    def create_default():
+        return FullJitter(ExponentialBackoff.create_default())
+
+    def _delay_of(self, attempt_number):
+        delay = self.backoff.delay_at(attempt_number)
+        if delay is None:
+            return None
+
+        return delay * self._fraction(attempt_number)
+
+    def _upper_delay_of(self, attempt_number):
+        return self._inner_upper_delay_of(attempt_number)
+
 
-        super().__init__(fibs)
+class EqualJitter(_Jitter):
+    """Delays uniformly distributed between the half of the delay of the wrapped backoff and the whole of it."""
+
+    def __init__(self, backoff, key=None, max_delay=None, total_budget=None):
+        super().__init__(backoff, key, max_delay, total_budget)
+        self.deterministic = key is not None and self.backoff.deterministic
+
+    @staticmethod
+    def create_default():
+        return EqualJitter(ExponentialBackoff.create_default())
+
+    def _delay_of(self, attempt_number):
+        delay = self.backoff.delay_at(attempt_number)
+        if delay is None:
+            return None
+
+        return delay / 2.0 * (1 + self._fraction(attempt_number))
+
+    def _upper_delay_of(self, attempt_number):
+        return self._inner_upper_delay_of(attempt_number)
+
+
+class DecorrelatedJitter(_Jitter):
+    """
+    Decorrelated jitter: each delay is uniformly distributed between the delay of the wrapped backoff and
+    `multiplier` times the previous delay of the call, so it grows randomly rather than in lockstep. Usually used
+    with a FixedBackoff and a `max_delay`. Without the previous delay, i.e. through `get_delay`, the delay of the
+    wrapped backoff for the previous attempt stands in for it.
+    """
+
+    def __init__(self, backoff, multiplier=3, key=None, max_delay=None, total_budget=None):
+        super().__init__(backoff, key, max_delay, total_budget)
+        self.multiplier = multiplier
+
+    @staticmethod
+    def create_default():
+        return DecorrelatedJitter(FixedBackoff(0.5), max_delay=30)
+
+    def next_delay(self, attempt, previous_delay):
+        attempt_number = attempt.attempt_number
+        delay = self._decorrelated(attempt_number, previous_delay)
+        if delay is None:
+            return None
+
+        return self._limited(delay, attempt_number)
+
+    def _delay_of(self, attempt_number):
+        previous_delay = self.backoff.delay_at(attempt_number - 1) if attempt_number > 1 else None
+        return self._decorrelated(attempt_number, previous_delay)
+
+    def _decorrelated(self, attempt_number, previous_delay):
+        base = self.backoff.delay_at(attempt_number)
+        if base is None:
+            return None
+
+        upper = base if previous_delay is None else max(base, previous_delay * self.multiplier)
+        return base + (upper - base) * self._fraction(attempt_number)
+
+    def _upper_delay_of(self, attempt_number):
+        upper = 0
+        for n in range(1, attempt_number + 1):
+            previous = self._capped(upper)
+            upper = max(self._inner_upper_delay_of(n), previous * self.multiplier)
+
+        return upper
+
+
+class AdaptiveBackoff(Backoff):
+    """
+    Scales the delays of another backoff by a multiplier tracking the health of the dependency, in the manner of
+    AIMD: while the failure rate of the attempts is above `failure_threshold`, the multiplier is multiplied by
+    `increase` every `interval` seconds, up to `max_multiplier`; otherwise it shrinks by `decrease` per interval,
+    down to 1. The retry pressure backs off quickly when the dependency struggles and comes back gradually.
+
+    The failure rate is a moving average, weighted by `smoothing`, of the rates of the intervals, counted from the
+    RetryMetrics of the `command`, or without one or while the metrics are disabled, from the outcomes of the
+    attempts Retry reports through `on_outcome`, along with those given to `record_success` and `record_failure`.
+    It is updated when a delay is needed: after a quiet period, the decreases of all of the intervals it spanned
+    are applied at once.
+    """
+
+    def __init__(self, backoff, command=None, increase=2.0, decrease=0.5, max_multiplier=16.0, failure_threshold=0.5,
+                 smoothing=0.5, interval=1.0, max_delay=None, total_budget=None, clock=time.monotonic):
+        if increase < 1:
+            raise ValueError('`increase` should be at least 1.')
+        if decrease < 0:
+            raise ValueError('`decrease` should not be negative.')
+        if not 0 < smoothing <= 1:
+            raise ValueError('`smoothing` should be in (0, 1].')
+
+        self.backoff = create_backoff(backoff)
+        self.command = command
+        self.increase = increase
+        self.decrease = decrease
+        self.max_multiplier = max_multiplier
+        self.failure_threshold = failure_threshold
+        self.smoothing = smoothing
+        self.interval = interval
+        self._set_limits(max_delay, total_budget)
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._multiplier = 1.0
+        self._failure_rate = 0.0
+        self._recorded = [0, 0]  # attempts and failed ones, the counts without the metrics of a command
+        self._last_counts = (0, 0)
+        self._last_update = clock()
+
+    @staticmethod
+    def create_default():
+        return AdaptiveBackoff(ExponentialBackoff.create_default())
+
+    @property
+    def multiplier(self):
+        return self._multiplier
+
+    @property
+    def failure_rate(self):
+        return self._failure_rate
+
+    def record_success(self):
+        with self._lock:  # `+=` on shared state would lose the increments of racing threads
+            self._recorded[0] += 1
+
+    def record_failure(self):
+        with self._lock:
+            recorded = self._recorded
+            recorded[0] += 1
+            recorded[1] += 1
+
+    def on_outcome(self, failed):
+        if failed:
+            self.record_failure()
+        else:
+            self.record_success()
+
+        inner = self.backoff.on_outcome
+        if inner is not None:
+            inner(failed)
+
+    def _counts(self):
+        """The total numbers of attempts and of failed ones so far. Called with the lock held."""
+        registry = metrics.retry_metrics
+        if self.command is None or not registry.enabled:
+            recorded = self._recorded
+            return recorded[0], recorded[1]
+
+        snapshot = registry[self.command].snapshot()
+        attempts = snapshot.total_calls + snapshot.total_retry_attempts
+        return attempts, attempts - snapshot.successful_calls_with_retry - snapshot.successful_calls_without_retry
+
+    def _update(self):
+        now = self._clock()
+        if now - self._last_update < self.interval:
+            return
+
+        with self._lock:
+            intervals = int((now - self._last_update) // self.interval)
+            if intervals < 1:  # updated by another thread meanwhile
+                return
+            self._last_update += intervals * self.interval
+
+            attempts, failures = self._counts()
+            last_attempts, last_failures = self._last_counts
+            if attempts < last_attempts:  # the metrics were cleared
+                last_attempts, last_failures = 0, 0
+            self._last_counts = (attempts, failures)
+            if attempts > last_attempts:
+                rate = float(failures - last_failures) / (attempts - last_attempts)
+                self._failure_rate += self.smoothing * (rate - self._failure_rate)
+
+            if self._failure_rate > self.failure_threshold:
+                self._multiplier = min(self.max_multiplier, self._multiplier * self.increase)
+            else:
+                self._multiplier = max(1.0, self._multiplier - self.decrease * intervals)
+
+    def _delay_of(self, attempt_number):
+        delay = self.backoff.delay_at(attempt_number)
+        if delay is None:
+            return None
+
+        self._update()
+        return delay * self._multiplier
+
+    def _upper_delay_of(self, attempt_number):
+        return self.backoff._capped(self.backoff._upper_delay_of(attempt_number)) * self.max_multiplier
+
+
+def retry_after_of(attempt):
+    """
+    The default extractor of HintedBackoff: the `retry_after` of the error (e.g. of a RateLimitExceededError), or
+    the `Retry-After` header of the error's `response` or `headers`, or of the result's `headers`, e.g. of an
+    HTTP response returned and retried by an `on_result` predicate. Returns None without any.
+    """
+    if attempt.is_failure():
+        error = attempt.get_error()
+        hint = getattr(error, 'retry_after', None)
+        if hint is not None:
+            return hint
+        source = getattr(error, 'response', None)
+        if source is None:  # not `or`: an HTTP response with an error status may be falsy
+            source = error
+    else:
+        source = attempt.get()
+
+    headers = getattr(source, 'headers', None)
+    if headers is None:
+        return None
+    try:
+        return headers.get('Retry-After') or headers.get('retry-after')
+    except AttributeError:  # not a mapping
+        return None
+
+
+def _seconds_of_hint(hint, clock):
+    """
+    The seconds to wait for a hint: a number of seconds, a Duration or timedelta, a datetime, or the value of a
+    Retry-After header, i.e. seconds or an HTTP-date. None if it cannot be read. A date in the past is 0.
+    """
+    if isinstance(hint, bytes):
+        hint = hint.decode('latin-1')
+    if isinstance(hint, str):
+        hint = hint.strip()
+        if hint.isdigit():
+            return float(hint)
+        try:
+            hint = email.utils.parsedate_to_datetime(hint)
+        except (TypeError, ValueError, IndexError):
+            return None
+        if hint is None:
+            return None
+
+    if isinstance(hint, datetime.datetime):
+        if hint.tzinfo is None:  # HTTP-dates are in GMT
+            hint = hint.replace(tzinfo=datetime.timezone.utc)
+        seconds = hint.timestamp() - clock()
+    elif isinstance(hint, datetime.timedelta):
+        seconds = hint.total_seconds()
+    elif isinstance(hint, Duration):
+        seconds = hint.to_seconds()
+    elif is_number(hint):
+        seconds = float(hint)
+    else:
+        return None
+
+    if seconds != seconds:  # NaN
+        return None
+    return seconds if seconds > 0 else 0.0
+
+
+class HintedBackoff(Backoff):
+    """
+    Waits as long as the server asks, e.g. with a `Retry-After` header or a throttling error carrying a delay, and
+    as long as the wrapped backoff says otherwise. The hint is taken from the attempt by `extract` (retry_after_of
+    by default, see it), and may be seconds, a Duration or timedelta, a datetime, or a Retry-After value in seconds
+    or as an HTTP-date, which is compared with `clock`, the wall clock. Every delay is capped by `max_delay`, so
+    that a server cannot park the calls for too long.
+
+    A hint ending the retries is not supported: an exhausted `total_budget` of the wrapped backoff ends them, but
+    only when it is consulted, i.e. without a hint.
+    """
+
+    def __init__(self, backoff=None, extract=retry_after_of, max_delay=None, clock=time.time):
+        self.backoff = create_backoff(backoff)
+        self.extract = extract
+        self._clock = clock
+        self._set_limits(max_delay, None)
+
+    @staticmethod
+    def create_default():
+        return HintedBackoff(ExponentialBackoff.create_default(), max_delay=60)
+
+    @property
+    def on_outcome(self):
+        return self.backoff.on_outcome
+
+    def get_delay(self, attempt):
+        return self.next_delay(attempt, None)
+
+    def next_delay(self, attempt, previous_delay):
+        delay = _seconds_of_hint(self.extract(attempt), self._clock)
+        if delay is None:
+            delay = self.backoff.next_delay(attempt, previous_delay)
+            if delay is None:
+                return None
+
+        return self._capped(delay)
+
+    def _delay_of(self, attempt_number):
+        return self.backoff.delay_at(attempt_number)
+
+    def _upper_delay_of(self, attempt_number):
+        return float('inf') if self.max_delay is None else self.max_delay
 
 
 class _CallableBackoff(Backoff):
@@ -138,6 +748,12 @@ class _CallableBackoff(Backoff):
     def get_delay(self, attempt):
         return self._func(attempt)
 
+    def _delay_of(self, attempt_number):
+        return self._func(Attempt(attempt_number))
+
+    def _upper_delay_of(self, attempt_number):
+        return float('inf')  # unknown
+
 
 def create_backoff(given):
     if isinstance(given, Backoff):
@@ -158,6 +774,32 @@ def create_backoff(given):
     return result
 
 
+_local = threading.local()
+
+
+def _thread_random():
+    """A random number generator of the calling thread, so that the threads do not contend for a shared one."""
+    try:
+        return _local.random
+    except AttributeError:
+        _local.random = r.Random()
+        return _local.random
+
+
+def _reset_thread_randoms():
+    global _local
+    _local = threading.local()  # a forked child must not repeat the numbers of its parent
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_thread_randoms)
+
+
+def _hash_fraction(key, attempt_number):
+    digest = hashlib.blake2b(('%r/%d' % (key, attempt_number)).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') / 18446744073709551616.0  # 2 ** 64
+
+
 def __fn_zero():
     return 0
 
@@ -173,6 +815,16 @@ def _get_randomizer_func(rnd):
     return fn
 
 
+def _get_randomizer_max(rnd):
+    """The largest value the randomizer can add, infinite if unknown."""
+    if callable(rnd):
+        return float('inf')
+    elif isinstance(rnd, tuple):
+        return rnd[1]
+    else:
+        return 0
+
+
 def _get_attempt_no(kwargs):
     return kwargs['attempt_no']
 
@@ -184,5 +836,12 @@ __all__ = [
     'LinearBackoff',
     'RandomBackoff',
     'ExponentialBackoff',
-    'FibonacciBackoff'
+    'FibonacciBackoff',
+    'FullJitter',
+    'EqualJitter',
+    'DecorrelatedJitter',
+    'AdaptiveBackoff',
+    'HintedBackoff',
+    'retry_after_of',
+    'MAX_FINITE_DELAY'
 ]
@@ -0,0 +1,121 @@
+import threading
+import time
+from toughpy.duration import seconds_of
+
+DEFAULT_PERCENT_CAN_RETRY = 20
+DEFAULT_TTL = 10  # seconds
+DEFAULT_MIN_RETRIES_PER_SECOND = 10
+
+_SLOTS = 10
+_RETRY_COST = 100  # a first attempt deposits `percent_can_retry` tokens, a retry withdraws 100
+
+
+class _TokenBucket:
+    """
+    Deposits and withdrawals of a single command in a ring of time slots covering the TTL. Tokens older than the
+    TTL expire together with the slot they were recorded in.
+    """
+
+    def __init__(self, ttl):
+        self._slot_duration = float(ttl) / _SLOTS
+        self._deposits = [0] * _SLOTS
+        self._withdrawals = [0] * _SLOTS
+        self._epoch = 0
+        self._balance = 0
+        self._lock = threading.Lock()
+
+    def _roll(self, now):
+        epoch = int(now / self._slot_duration)
+        if epoch <= self._epoch:
+            return
+
+        if epoch - self._epoch >= _SLOTS:
+            self._deposits = [0] * _SLOTS
+            self._withdrawals = [0] * _SLOTS
+            self._balance = 0
+        else:
+            for e in range(self._epoch + 1, epoch + 1):
+                idx = e % _SLOTS
+                self._balance -= self._deposits[idx] - self._withdrawals[idx]
+                self._deposits[idx] = 0
+                self._withdrawals[idx] = 0
+
+        self._epoch = epoch
+
+    def deposit(self, amount, now):
+        with self._lock:
+            self._roll(now)
+            self._deposits[self._epoch % _SLOTS] += amount
+            self._balance += amount
+
+    def try_withdraw(self, amount, reserve, now):
+        with self._lock:
+            self._roll(now)
+            if self._balance + reserve < amount:
+                return False
+
+            self._withdrawals[self._epoch % _SLOTS] += amount
+            self._balance -= amount
+            return True
+
+    def balance(self, now):
+        with self._lock:
+            self._roll(now)
+            return self._balance
+
+
+class RetryBudget:
+    """
+    Bounds the retries of every command to `percent_can_retry` percent of its first attempts over a sliding
+    window of `ttl` (a Duration or seconds), so that a failing dependency does not get `max_attempts` times its
+    usual traffic. Regardless of the traffic, at least `min_retries_per_second` retries are permitted, which keeps
+    the retries of rarely called commands working.
+
+    A budget keeps a separate bucket per command name, hence a single instance can be shared by several Retry
+    policies.
+    """
+
+    def __init__(self,
+                 percent_can_retry=DEFAULT_PERCENT_CAN_RETRY,
+                 ttl=DEFAULT_TTL,
+                 min_retries_per_second=DEFAULT_MIN_RETRIES_PER_SECOND,
+                 clock=time.monotonic):
+        ttl = seconds_of(ttl)
+        if not 0 <= percent_can_retry <= 1000:
+            raise ValueError('`percent_can_retry` should be between 0 and 1000.')
+        if ttl <= 0:
+            raise ValueError('`ttl` should be greater than 0.')
+        if min_retries_per_second < 0:
+            raise ValueError('`min_retries_per_second` should not be negative.')
+
+        self._deposit_amount = percent_can_retry
+        self._reserve = min_retries_per_second * ttl * _RETRY_COST
+        self._ttl = ttl
+        self._clock = clock
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def _bucket(self, command_name):
+        bucket = self._buckets.get(command_name)
+        if bucket is None:
+            with self._lock:
+                bucket = self._buckets.setdefault(command_name, _TokenBucket(self._ttl))
+
+        return bucket
+
+    def deposit(self, command_name):
+        """Records a first attempt of the given command."""
+        if self._deposit_amount:
+            self._bucket(command_name).deposit(self._deposit_amount, self._clock())
+
+    def try_withdraw(self, command_name):
+        """Returns True and records a retry if the budget of the given command permits one, otherwise False."""
+        return self._bucket(command_name).try_withdraw(_RETRY_COST, self._reserve, self._clock())
+
+    def available_retries(self, command_name):
+        return int((self._bucket(command_name).balance(self._clock()) + self._reserve) // _RETRY_COST)
+
+
+__all__ = [
+    'RetryBudget'
+]
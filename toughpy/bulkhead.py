@@ -0,0 +1,201 @@
+import asyncio
+import collections
+import threading
+import toughpy.metrics as metrics
+from toughpy.duration import seconds_of
+from toughpy.utils import get_command_name, monotonic_ns, decorate_with
+
+DEFAULT_MAX_CONCURRENT_CALLS = 25
+
+
+class _Waiter:
+    __slots__ = ('granted', 'event', 'future', 'loop')
+
+    def __init__(self, event=None, future=None, loop=None):
+        self.granted = False
+        self.event = event
+        self.future = future
+        self.loop = loop
+
+
+def _wake(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class Bulkhead:
+    """
+    Limits the number of concurrent calls to `max_concurrent_calls`. When all of the permits are in use, up to
+    `max_queued_calls` callers wait in a FIFO queue for at most `max_wait_duration` (a Duration or seconds, None
+    to wait as long as it takes) and the rest are rejected with BulkheadFullError.
+
+    The same permits are shared by threads and asyncio tasks: threads block on an event while tasks await a future,
+    so a waiting task never blocks its event loop.
+    """
+
+    def __init__(self,
+                 name=None,
+                 max_concurrent_calls=DEFAULT_MAX_CONCURRENT_CALLS,
+                 max_queued_calls=0,
+                 max_wait_duration=None):
+        if not isinstance(max_concurrent_calls, int) or max_concurrent_calls <= 0:
+            raise ValueError('`max_concurrent_calls` should be an integer greater than 0.')
+        if not isinstance(max_queued_calls, int) or max_queued_calls < 0:
+            raise ValueError('`max_queued_calls` should be a non-negative integer.')
+
+        self.name = name
+        self._max_concurrent_calls = max_concurrent_calls
+        self._max_queued_calls = max_queued_calls
+        self._max_wait_duration = seconds_of(max_wait_duration)
+        self._in_flight = 0
+        self._waiters = collections.deque()
+        self._lock = threading.Lock()
+
+    @property
+    def in_flight_calls(self):
+        return self._in_flight
+
+    @property
+    def queued_calls(self):
+        return len(self._waiters)
+
+    def __call__(self, fn):
+        return decorate_with(fn, self.execute, self.execute_async)
+
+    def execute(self, fn, *args, **kwargs):
+        bh_metrics = self._metrics_of(fn)
+        self.acquire(bh_metrics)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self.release(bh_metrics)
+
+    async def execute_async(self, fn, *args, **kwargs):
+        bh_metrics = self._metrics_of(fn)
+        await self.acquire_async(bh_metrics)
+        try:
+            return await fn(*args, **kwargs)
+        finally:
+            self.release(bh_metrics)
+
+    def _metrics_of(self, fn):
+        return metrics.bulkhead_metrics[self.name or get_command_name(fn)]
+
+    def _try_enter(self, bh_metrics, loop=None):
+        """
+        Takes a permit and returns None, or enqueues and returns a waiter which is woken by a thread event, or by
+        a future of the given loop. Raises BulkheadFullError if the queue is full too.
+        """
+        with self._lock:
+            if self._in_flight < self._max_concurrent_calls and not self._waiters:
+                self._in_flight += 1
+                self._update_gauges(bh_metrics)
+                return None
+
+            if len(self._waiters) >= self._max_queued_calls:
+                self._reject(bh_metrics)
+
+            if loop is None:
+                waiter = _Waiter(event=threading.Event())
+            else:
+                waiter = _Waiter(future=loop.create_future(), loop=loop)
+
+            self._waiters.append(waiter)
+            self._update_gauges(bh_metrics)
+            return waiter
+
+    def acquire(self, bh_metrics=None):
+        """Blocks until a permit is taken. Every successful acquire must be followed by a `release`."""
+        started = monotonic_ns()
+        waiter = self._try_enter(bh_metrics)
+        if waiter is not None:
+            waiter.event.wait(self._max_wait_duration)
+            self._await_grant(bh_metrics, waiter)
+
+        self._permitted(bh_metrics, started)
+
+    async def acquire_async(self, bh_metrics=None):
+        started = monotonic_ns()
+        waiter = self._try_enter(bh_metrics, asyncio.get_running_loop())
+        if waiter is None:
+            self._permitted(bh_metrics, started)
+            return
+
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), self._max_wait_duration)
+        except asyncio.TimeoutError:
+            pass
+        except asyncio.CancelledError:
+            with self._lock:
+                if waiter.granted:
+                    self._release(bh_metrics)
+                else:
+                    self._waiters.remove(waiter)
+                    self._update_gauges(bh_metrics)
+            raise
+
+        self._await_grant(bh_metrics, waiter)
+        self._permitted(bh_metrics, started)
+
+    def _await_grant(self, bh_metrics, waiter):
+        with self._lock:
+            if not waiter.granted:  # timed out
+                self._waiters.remove(waiter)
+                self._update_gauges(bh_metrics)
+                self._reject(bh_metrics)
+
+    def release(self, bh_metrics=None):
+        with self._lock:
+            self._release(bh_metrics)
+
+    def _release(self, bh_metrics):
+        if self._waiters:  # hand the permit over to the next waiter, the number of calls in flight stays the same
+            waiter = self._waiters.popleft()
+            waiter.granted = True
+            if waiter.future is None:
+                waiter.event.set()
+            else:
+                waiter.loop.call_soon_threadsafe(_wake, waiter.future)
+        else:
+            self._in_flight -= 1
+
+        self._update_gauges(bh_metrics)
+
+    # noinspection PyProtectedMember
+    def _update_gauges(self, bh_metrics):
+        if bh_metrics is not None:
+            bh_metrics._set_gauges(self._in_flight, len(self._waiters))
+
+    # noinspection PyProtectedMember
+    def _permitted(self, bh_metrics, started):
+        if bh_metrics is not None:
+            now = monotonic_ns()
+            bh_metrics._record_permitted_call(now - started, now)
+
+    # noinspection PyProtectedMember
+    def _reject(self, bh_metrics):
+        if bh_metrics is not None:
+            bh_metrics._increment_rejected_calls()
+        raise BulkheadFullError(self)
+
+
+class BulkheadFullError(Exception):
+    def __init__(self, bulkhead):
+        super().__init__(bulkhead.name)
+        self.bulkhead = bulkhead
+
+    def __str__(self):
+        return 'Bulkhead `{0}` is full and does not permit further calls'.format(self.bulkhead.name or '<unnamed>')
+
+    def __reduce__(self):
+        # the bulkhead, with its lock, stays in this process: only its name is pickled
+        return BulkheadFullError, (_PickledBulkhead(self.bulkhead.name),)
+
+
+_PickledBulkhead = collections.namedtuple('_PickledBulkhead', ['name'])
+
+
+__all__ = [
+    'Bulkhead',
+    'BulkheadFullError'
+]
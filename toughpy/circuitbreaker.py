@@ -0,0 +1,340 @@
+import threading
+import time
+from collections import namedtuple
+import toughpy.metrics as metrics
+from toughpy import predicates
+from toughpy.duration import seconds_of
+from toughpy.utils import UNDEFINED, get_command_name, decorate_with
+
+_msg_invalid_window_type = '`%s` is not a valid window type. It should be either COUNT_BASED or TIME_BASED.'
+
+CLOSED = 'CLOSED'
+OPEN = 'OPEN'
+HALF_OPEN = 'HALF_OPEN'
+
+COUNT_BASED = 'COUNT_BASED'
+TIME_BASED = 'TIME_BASED'
+
+DEFAULT_FAILURE_RATE_THRESHOLD = 50
+DEFAULT_WINDOW_SIZE = 100
+DEFAULT_MINIMUM_CALLS = 10
+DEFAULT_WAIT_IN_OPEN_STATE = 60  # seconds
+DEFAULT_PERMITTED_CALLS_IN_HALF_OPEN_STATE = 10
+
+
+class _CountBasedWindow:
+    """Outcomes of the last `size` calls in a ring buffer. Recording is O(1)."""
+
+    def __init__(self, size):
+        self._outcomes = bytearray(size)
+        self._index = 0
+        self.calls = 0
+        self.failures = 0
+
+    def record(self, failed, now):
+        size = len(self._outcomes)
+        if self.calls == size:
+            self.failures -= self._outcomes[self._index]
+        else:
+            self.calls += 1
+
+        self._outcomes[self._index] = failed
+        self.failures += failed
+        self._index = (self._index + 1) % size
+
+    def roll(self, now):
+        pass
+
+    def reset(self):
+        self.__init__(len(self._outcomes))
+
+
+class _TimeBasedWindow:
+    """Outcomes of the calls in the last `size` seconds, aggregated in a ring of per-second buckets."""
+
+    def __init__(self, size):
+        self._calls = [0] * size
+        self._failures = [0] * size
+        self._epoch = 0
+        self.calls = 0
+        self.failures = 0
+
+    def record(self, failed, now):
+        self.roll(now)
+        idx = self._epoch % len(self._calls)
+        self._calls[idx] += 1
+        self._failures[idx] += failed
+        self.calls += 1
+        self.failures += failed
+
+    def roll(self, now):
+        epoch = int(now)
+        if epoch <= self._epoch:
+            return
+
+        size = len(self._calls)
+        if epoch - self._epoch >= size:
+            self.reset()
+        else:
+            for e in range(self._epoch + 1, epoch + 1):
+                idx = e % size
+                self.calls -= self._calls[idx]
+                self.failures -= self._failures[idx]
+                self._calls[idx] = 0
+                self._failures[idx] = 0
+
+        self._epoch = epoch
+
+    def reset(self):
+        size = len(self._calls)
+        self._calls = [0] * size
+        self._failures = [0] * size
+        self.calls = 0
+        self.failures = 0
+
+
+class CircuitBreaker:
+    """
+    A circuit breaker with CLOSED, OPEN and HALF_OPEN states.
+
+    In the CLOSED state the outcomes of the calls are recorded in a sliding window, either over the last
+    `window_size` calls (COUNT_BASED) or over the last `window_size` seconds (TIME_BASED). Once the window holds at
+    least `minimum_calls` outcomes and the failure rate (in percent) reaches `failure_rate_threshold`, the breaker
+    opens and rejects every call with CallNotPermittedError, without invoking the protected function, until
+    `wait_in_open_state` (a Duration or seconds) elapses. Then it lets `permitted_calls_in_half_open_state` trial
+    calls through and either closes or opens again depending on their failure rate.
+
+    Errors matching `on_error` and results matching `on_result` are failures; both accept the same hints as Retry.
+    """
+
+    def __init__(self,
+                 name=None,
+                 on_error=None,
+                 on_result=UNDEFINED,
+                 failure_rate_threshold=DEFAULT_FAILURE_RATE_THRESHOLD,
+                 window_type=COUNT_BASED,
+                 window_size=DEFAULT_WINDOW_SIZE,
+                 minimum_calls=DEFAULT_MINIMUM_CALLS,
+                 wait_in_open_state=DEFAULT_WAIT_IN_OPEN_STATE,
+                 permitted_calls_in_half_open_state=DEFAULT_PERMITTED_CALLS_IN_HALF_OPEN_STATE,
+                 clock=time.monotonic):
+        if minimum_calls <= 0:
+            raise ValueError('`minimum_calls` should be greater than 0.')
+        if permitted_calls_in_half_open_state <= 0:
+            raise ValueError('`permitted_calls_in_half_open_state` should be greater than 0.')
+
+        self.name = name
+        self._error_predicate = predicates.create_error_predicate(on_error).compile()
+        self._result_predicate = predicates.create_result_predicate(on_result).compile()
+        self._failure_rate_threshold = failure_rate_threshold
+        self._window = CircuitBreaker._create_window(window_type, window_size)
+        self._minimum_calls = min(minimum_calls, window_size) if window_type == COUNT_BASED else minimum_calls
+        self._wait_in_open_state = seconds_of(wait_in_open_state)
+        self._permitted_calls_in_half_open_state = permitted_calls_in_half_open_state
+        self._clock = clock
+        self._lock = threading.RLock()  # re-entrant so that state change handlers may query the breaker
+        self._state = CLOSED
+        self._open_until = 0
+        self._half_open_permits = 0
+        self._half_open_window = _CountBasedWindow(permitted_calls_in_half_open_state)
+        self._state_change_handler = None
+
+    @staticmethod
+    def _create_window(window_type, window_size):
+        if window_size <= 0:
+            raise ValueError('`window_size` should be greater than 0.')
+
+        if window_type == COUNT_BASED:
+            return _CountBasedWindow(window_size)
+        elif window_type == TIME_BASED:
+            return _TimeBasedWindow(window_size)
+        else:
+            raise ValueError(_msg_invalid_window_type % window_type)
+
+    @property
+    def state(self):
+        if self._state == OPEN and self._clock() >= self._open_until:
+            return HALF_OPEN
+        return self._state
+
+    @property
+    def failure_rate(self):
+        """The failure rate in percent within the current window, or -1 if there are not enough calls yet."""
+        with self._lock:
+            window = self._window
+            window.roll(self._clock())
+            if window.calls < self._minimum_calls:
+                return -1
+            return 100.0 * window.failures / window.calls
+
+    def __call__(self, fn):
+        return decorate_with(fn, self.execute, self.execute_async)
+
+    def on_state_change(self, handler):
+        """Registers a handler which is called with (breaker, from_state, to_state) on every transition."""
+        self._state_change_handler = handler
+        return self
+
+    def execute(self, fn, *args, **kwargs):
+        cb_metrics = self._metrics_of(fn)
+        self.acquire_permission(cb_metrics)
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            self._on_error(e, cb_metrics)
+            raise
+        except BaseException:
+            self.release_permission()
+            raise
+
+        self._on_result(result, cb_metrics)
+        return result
+
+    async def execute_async(self, fn, *args, **kwargs):
+        cb_metrics = self._metrics_of(fn)
+        self.acquire_permission(cb_metrics)
+        try:
+            result = await fn(*args, **kwargs)
+        except Exception as e:
+            self._on_error(e, cb_metrics)
+            raise
+        except BaseException:  # e.g. cancellation, which tells nothing about the health of the dependency
+            self.release_permission()
+            raise
+
+        self._on_result(result, cb_metrics)
+        return result
+
+    def _metrics_of(self, fn):
+        return metrics.circuit_breaker_metrics[self.name or get_command_name(fn)]
+
+    # noinspection PyProtectedMember
+    def acquire_permission(self, cb_metrics=None):
+        """
+        Raises CallNotPermittedError if a call is not permitted in the current state. A permitted call must be
+        followed by `record_success`, `record_failure` or `release_permission`.
+        """
+        state = self._state
+        if state == CLOSED:
+            return
+
+        if state == OPEN:
+            remaining = self._open_until - self._clock()
+            if remaining > 0:
+                self._reject(cb_metrics, remaining)
+
+        with self._lock:
+            if self._state == OPEN:
+                remaining = self._open_until - self._clock()
+                if remaining > 0:
+                    self._reject(cb_metrics, remaining)
+                self._transition_to(HALF_OPEN)
+
+            if self._state == HALF_OPEN:
+                if self._half_open_permits >= self._permitted_calls_in_half_open_state:
+                    self._reject(cb_metrics, 0)
+                self._half_open_permits += 1
+
+    # noinspection PyProtectedMember
+    def _reject(self, cb_metrics, remaining):
+        if cb_metrics is not None:
+            cb_metrics._increment_not_permitted_calls()
+        raise CallNotPermittedError(self, remaining)
+
+    def release_permission(self):
+        if self._state != CLOSED:
+            with self._lock:
+                if self._state == HALF_OPEN and self._half_open_permits > 0:
+                    self._half_open_permits -= 1
+
+    def _on_error(self, error, cb_metrics):
+        if self._error_predicate(error):
+            self.record_failure(cb_metrics)
+        else:
+            self.record_success(cb_metrics)
+
+    def _on_result(self, result, cb_metrics):
+        if self._result_predicate(result):
+            self.record_failure(cb_metrics)
+        else:
+            self.record_success(cb_metrics)
+
+    # noinspection PyProtectedMember
+    def record_success(self, cb_metrics=None):
+        if cb_metrics is not None:
+            cb_metrics._increment_successful_calls()
+        self._record(0)
+
+    # noinspection PyProtectedMember
+    def record_failure(self, cb_metrics=None):
+        if cb_metrics is not None:
+            cb_metrics._increment_failed_calls()
+        self._record(1)
+
+    def _record(self, failed):
+        with self._lock:
+            state = self._state
+            if state == CLOSED:
+                window = self._window
+                window.record(failed, self._clock())
+                if window.calls >= self._minimum_calls and self._exceeds_threshold(window):
+                    self._transition_to(OPEN)
+            elif state == HALF_OPEN:
+                window = self._half_open_window
+                window.record(failed, None)
+                if window.calls >= self._permitted_calls_in_half_open_state:
+                    self._transition_to(OPEN if self._exceeds_threshold(window) else CLOSED)
+            # outcomes of the calls completing in the OPEN state are ignored
+
+    def _exceeds_threshold(self, window):
+        return 100.0 * window.failures / window.calls >= self._failure_rate_threshold
+
+    def _transition_to(self, state):
+        previous = self._state
+        if state == OPEN:
+            self._open_until = self._clock() + self._wait_in_open_state
+        elif state == CLOSED:
+            self._window.reset()
+
+        self._half_open_permits = 0
+        self._half_open_window.reset()
+        self._state = state
+
+        if callable(self._state_change_handler):
+            self._state_change_handler(self, previous, state)
+
+    def reset(self):
+        """Closes the breaker and forgets the recorded outcomes."""
+        with self._lock:
+            self._transition_to(CLOSED)
+
+
+class CallNotPermittedError(Exception):
+    """Raised by an open circuit breaker. Retry never retries it."""
+
+    def __init__(self, breaker, remaining):
+        super().__init__(breaker.name, remaining)
+        self.breaker = breaker
+        self.remaining = remaining
+
+    def __str__(self):
+        return 'Circuit breaker `{0}` is {1} and does not permit further calls'.format(
+            self.breaker.name or '<unnamed>', self.breaker.state)
+
+    def __reduce__(self):
+        # the breaker, with its lock, stays in this process: only its name and state are pickled
+        return CallNotPermittedError, (_PickledBreaker(self.breaker.name, self.breaker.state), self.remaining)
+
+
+_PickledBreaker = namedtuple('_PickledBreaker', ['name', 'state'])
+
+
+__all__ = [
+    'CircuitBreaker',
+    'CallNotPermittedError',
+    'CLOSED',
+    'OPEN',
+    'HALF_OPEN',
+    'COUNT_BASED',
+    'TIME_BASED'
+]
@@ -0,0 +1,49 @@
+import contextlib
+import contextvars
+from toughpy.duration import seconds_of
+from toughpy.utils import monotonic_ns
+
+# the deadline of the innermost call with a time budget, in monotonic_ns() nanoseconds
+_deadline = contextvars.ContextVar('toughpy_deadline', default=None)
+
+
+def get_deadline():
+    """Returns the deadline of the enclosing call in monotonic_ns() nanoseconds, or None if it has no deadline."""
+    return _deadline.get()
+
+
+def remaining_time():
+    """
+    Returns the seconds left until the deadline of the enclosing call, or None if it has no deadline. A function
+    called by a Retry with `max_duration` can use it to set its own (e.g. socket) timeouts.
+    """
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+
+    return max(0.0, (deadline - monotonic_ns()) / 1000000000.0)
+
+
+@contextlib.contextmanager
+def deadline_scope(duration):
+    """
+    Sets a deadline `duration` (a Duration or seconds) from now for the enclosed code and yields it. An enclosing
+    deadline which is earlier wins. The scope follows the context, so asyncio tasks have their own deadlines.
+    """
+    deadline = monotonic_ns() + int(seconds_of(duration) * 1000000000)
+    outer = _deadline.get()
+    if outer is not None and outer < deadline:
+        deadline = outer
+
+    token = _deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _deadline.reset(token)
+
+
+__all__ = [
+    'get_deadline',
+    'remaining_time',
+    'deadline_scope'
+]
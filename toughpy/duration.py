@@ -240,3 +240,15 @@ class days(TimeUnit):
     @staticmethod
     def to_days(value):
         return float(value)
+
+
+def seconds_of(value):
+    """
+    Converts a Duration, or a plain number which is taken as seconds, into seconds. None is passed through.
+    """
+    if value is None or isinstance(value, (int, float)):
+        return value
+    elif isinstance(value, Duration):
+        return value.to_seconds()
+    else:
+        raise ValueError('`%s` is not a valid duration. It should be a Duration or a number of seconds.' % value)
@@ -0,0 +1,302 @@
+import contextvars
+import heapq
+import inspect
+import itertools
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from toughpy.attempt import Success, Failure
+from toughpy.deadline import _deadline, get_deadline
+from toughpy.retry import _command_of
+from toughpy.timeout import AttemptTimeoutError
+from toughpy.utils import monotonic_ns
+
+
+class _Timer:
+    __slots__ = ('when', 'fn', 'cancelled')
+
+    def __init__(self, when, fn):
+        self.when = when
+        self.fn = fn
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class _Scheduler:
+    """
+    A single thread running callbacks after their delays, kept in a heap. Cancelled timers stay in the heap until
+    they are due and are skipped then. The callbacks must be short since they delay the ones after them.
+    """
+
+    def __init__(self, clock=time.monotonic):
+        self._clock = clock
+        self._heap = []
+        self._sequence = itertools.count()  # keeps the order of the timers due at the same time
+        self._condition = threading.Condition()
+        self._thread = None
+        self._stopped = False
+
+    def schedule(self, delay, fn):
+        timer = _Timer(self._clock() + delay, fn)
+        with self._condition:
+            if self._stopped:
+                raise RuntimeError('Cannot schedule after shutdown')
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='toughpy-retry-scheduler', daemon=True)
+                self._thread.start()
+
+            heapq.heappush(self._heap, (timer.when, next(self._sequence), timer))
+            if self._heap[0][2] is timer:
+                self._condition.notify()
+
+        return timer
+
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._stopped:
+                    if self._heap:
+                        timeout = self._heap[0][0] - self._clock()
+                        if timeout <= 0:
+                            break
+                    else:
+                        timeout = None
+                    self._condition.wait(timeout)
+
+                if self._stopped:
+                    return
+                timer = heapq.heappop(self._heap)[2]
+
+            if not timer.cancelled:
+                timer.fn()
+
+
+class _Call:
+    """The state of a submitted call, from its first attempt until its future is done."""
+
+    __slots__ = ('fn', 'args', 'kwargs', 'context', 'future', 'retry_metrics', 'started', 'deadline',
+                 'attempt_number', 'previous_delay', 'attempt_future', 'attempt_started', 'timer', 'lock')
+
+    def __init__(self, fn, args, kwargs, context, retry_metrics, deadline):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.context = context  # of the submitting code, None if it does not follow the attempts
+        self.future = Future()
+        self.retry_metrics = retry_metrics
+        self.started = monotonic_ns()
+        self.deadline = deadline
+        self.attempt_number = 0
+        self.previous_delay = None
+        self.attempt_future = None  # of the attempt running
+        self.attempt_started = None
+        self.timer = None  # of the backoff delay or of the attempt timeout
+        self.lock = threading.RLock()  # the future may complete, and call back, while it is held
+
+
+class RetryExecutor:
+    """
+    Runs retried calls on a concurrent.futures executor without keeping its workers busy while waiting to retry:
+    the workers only run the attempts, and the backoff delays are waited by a single scheduler thread which
+    submits the next attempt when its delay is over. `submit` returns a Future of the outcome of the whole call.
+
+    The calls follow the given Retry policy: its predicates, backoff, budget, `max_duration` (from the submission)
+    and `attempt_timeout`, after which an attempt is abandoned, or cancelled if it has not started yet. A
+    ProcessPoolExecutor works as well as long as the functions and their arguments can be pickled. Cancelling the
+    future cancels the waiting retry, or the attempt if it has not started yet. The attempts run in a copy of the
+    context of the submitting code, in which the deadline of the call is set, except in the other processes.
+
+    Without an `executor`, a ThreadPoolExecutor of `max_workers` threads is created and shut down with this one.
+    """
+
+    def __init__(self, retry, executor=None, max_workers=None):
+        self._retry = retry
+        self._owns_executor = executor is None
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix='toughpy-retry') \
+            if executor is None else executor
+        self._scheduler = _Scheduler()
+        self._calls = set()
+        self._lock = threading.Lock()
+        self._all_done = threading.Condition(self._lock)
+        self._shutdown = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown(wait=True)
+        return False
+
+    # noinspection PyProtectedMember
+    def submit(self, fn, *args, **kwargs):
+        if inspect.iscoroutinefunction(fn):
+            raise TypeError('Coroutine functions cannot run on a RetryExecutor, use Retry.execute_async instead.')
+
+        policy = self._retry
+        retry_metrics = _command_of(fn).metrics()
+        deadline = get_deadline()
+        if policy._max_duration is not None:
+            own_deadline = monotonic_ns() + int(policy._max_duration * 1000000000)
+            deadline = own_deadline if deadline is None else min(deadline, own_deadline)
+
+        context = None
+        if not isinstance(self._executor, ProcessPoolExecutor):  # the contexts do not cross the processes
+            context = contextvars.copy_context()
+            context.run(_deadline.set, deadline)  # for remaining_time() in the attempts
+
+        call = _Call(fn, args, kwargs, context, retry_metrics, deadline)
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError('Cannot submit after shutdown')
+            self._calls.add(call)
+
+        call.future.add_done_callback(lambda _: self._done(call))
+        if policy._retry_budget is not None:
+            policy._retry_budget.deposit(retry_metrics.name)
+        self._start_attempt(call)
+        return call.future
+
+    def shutdown(self, wait=True):
+        """
+        Stops accepting calls. With `wait`, waits for the calls submitted before, otherwise cancels them. Then stops
+        the scheduler and shuts the executor down if it was created here.
+        """
+        with self._lock:
+            self._shutdown = True
+            calls = list(self._calls)
+
+        if wait:
+            with self._all_done:
+                while self._calls:
+                    self._all_done.wait()
+        else:
+            for call in calls:
+                call.future.cancel()
+
+        self._scheduler.stop()
+        if self._owns_executor:
+            self._executor.shutdown(wait=wait)
+
+    def _done(self, call):
+        with call.lock:
+            if call.timer is not None:
+                call.timer.cancel()
+            if call.attempt_future is not None:
+                call.attempt_future.cancel()  # only if it has not started yet
+
+        with self._all_done:
+            self._calls.discard(call)
+            if not self._calls:
+                self._all_done.notify_all()
+
+    # noinspection PyProtectedMember
+    def _start_attempt(self, call):
+        policy = self._retry
+        with call.lock:
+            if call.future.done():  # cancelled while waiting
+                return
+
+            call.attempt_number += 1
+            call.attempt_started = monotonic_ns()
+            call.timer = None
+            try:
+                if call.context is None:
+                    attempt_future = self._executor.submit(call.fn, *call.args, **call.kwargs)
+                else:
+                    # a copy per attempt, as an abandoned attempt may still run in its own
+                    attempt_future = self._executor.submit(call.context.copy().run, call.fn, *call.args,
+                                                           **call.kwargs)
+            except BaseException as e:  # e.g. the executor is shut down
+                call.future.set_exception(e)
+                return
+
+            call.attempt_future = attempt_future
+            if policy._attempt_timeout is not None:
+                timeout = policy._timeout_of(call.deadline)
+                call.timer = self._scheduler.schedule(timeout, lambda: self._time_out(call, attempt_future, timeout))
+
+        attempt_future.add_done_callback(lambda f: self._attempt_done(call, f))
+
+    # noinspection PyProtectedMember
+    def _time_out(self, call, attempt_future, timeout):
+        with call.lock:
+            if call.attempt_future is not attempt_future or attempt_future.done():
+                return
+            call.attempt_future = None  # its outcome is ignored from now on
+
+        call.retry_metrics._increment_timed_out_attempts()
+        if not attempt_future.cancel():
+            call.retry_metrics._increment_abandoned_attempts()
+        error = AttemptTimeoutError(timeout)
+        self._next(call, Failure((AttemptTimeoutError, error, None), call.attempt_number))
+
+    def _attempt_done(self, call, attempt_future):
+        with call.lock:
+            if call.attempt_future is not attempt_future:  # timed out
+                return
+            call.attempt_future = None
+            if call.timer is not None:
+                call.timer.cancel()
+                call.timer = None
+
+        if attempt_future.cancelled():
+            call.future.cancel()
+            return
+
+        error = attempt_future.exception()
+        if error is None:
+            attempt = Success(attempt_future.result(), call.attempt_number)
+        else:
+            attempt = Failure((type(error), error, error.__traceback__), call.attempt_number)
+        self._next(call, attempt)
+
+    # noinspection PyProtectedMember
+    def _next(self, call, attempt):
+        """Schedules the next attempt of the call or completes its future."""
+        policy = self._retry
+        retry_metrics = call.retry_metrics
+        ended = monotonic_ns()
+        retry_metrics._record_attempt(ended - call.attempt_started, ended)
+        try:
+            policy._emit_after_attempt(attempt)
+            if policy._should_retry(attempt):
+                delay = policy._next_delay(attempt, call.previous_delay, call.deadline, retry_metrics)
+                if delay is not None and policy._retry_permitted(retry_metrics):
+                    retry_metrics._increment_retry_attempts()
+                    call.previous_delay = delay
+                    self._schedule_retry(call, delay)
+                    return
+
+            result = policy._complete(call.fn, attempt, retry_metrics, call.started)
+        except BaseException as e:
+            if call.future.set_running_or_notify_cancel():
+                call.future.set_exception(e)
+            return
+
+        if call.future.set_running_or_notify_cancel():
+            call.future.set_result(result)
+
+    # noinspection PyProtectedMember
+    def _schedule_retry(self, call, delay):
+        parked = monotonic_ns()
+
+        def retry():
+            resumed = monotonic_ns()
+            call.retry_metrics._record_backoff(resumed - parked, resumed)
+            self._start_attempt(call)
+
+        with call.lock:
+            if not call.future.done():
+                call.timer = self._scheduler.schedule(delay, retry)
+
+
+__all__ = [
+    'RetryExecutor'
+]
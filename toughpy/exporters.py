@@ -0,0 +1,271 @@
+import re
+import socket
+import threading
+import time
+import toughpy.metrics as metrics
+
+DEFAULT_QUANTILES = (0.5, 0.9, 0.99)
+DEFAULT_CACHE_TTL = 1  # second
+DEFAULT_STATSD_PORT = 8125
+DEFAULT_STATSD_INTERVAL = 10  # seconds
+DEFAULT_MAX_PACKET_SIZE = 1432  # fits in the payload of an Ethernet frame
+
+# (component, counter fields of the snapshots, gauge fields, latency histograms in nanoseconds)
+_COMPONENTS = {
+    'retry': (
+        ('successful_calls_without_retry', 'successful_calls_with_retry', 'failed_calls_without_retry',
+         'failed_calls_with_retry', 'total_retry_attempts', 'retries_denied_by_budget', 'retries_aborted_by_deadline',
+         'timed_out_attempts', 'abandoned_attempts'),
+        (),
+        ('call_latency', 'attempt_latency', 'backoff_time'),
+    ),
+    'circuit_breaker': (
+        ('successful_calls', 'failed_calls', 'not_permitted_calls'),
+        (),
+        (),
+    ),
+    'bulkhead': (
+        ('permitted_calls', 'rejected_calls'),
+        ('in_flight_calls', 'queued_calls'),
+        ('wait_time',),
+    ),
+    'hedge': (
+        ('total_calls', 'hedges', 'hedges_denied', 'hedge_wins'),
+        (),
+        ('attempt_latency',),
+    ),
+}
+
+
+def _default_registries():
+    return {
+        'retry': metrics.retry_metrics,
+        'circuit_breaker': metrics.circuit_breaker_metrics,
+        'bulkhead': metrics.bulkhead_metrics,
+        'hedge': metrics.hedge_metrics,
+    }
+
+
+# noinspection PyProtectedMember
+def _collect(registries, quantiles):
+    """
+    Takes the snapshots of all of the registries first, then the quantiles of the histograms, so that the counters
+    are as close to a single point in time as they can be. Returns a list of (component, snapshot, {histogram:
+    (count, [quantile values in seconds])}) tuples.
+    """
+    snapshots = []
+    for component, registry in registries.items():
+        registered = sorted(registry._registered(), key=lambda item: item[0])
+        snapshots.append((component, [(command_metrics, command_metrics.snapshot())
+                                      for _, command_metrics in registered]))
+
+    collected = []
+    for component, pairs in snapshots:
+        histogram_names = _COMPONENTS[component][2] if quantiles else ()
+        for command_metrics, snapshot in pairs:
+            histograms = {}
+            for histogram_name in histogram_names:
+                histogram = getattr(command_metrics, histogram_name).snapshot()
+                count = histogram.count
+                if count:
+                    histograms[histogram_name] = (count, [histogram.percentile(q * 100) / 1e9 for q in quantiles])
+            collected.append((component, snapshot, histograms))
+
+    return collected
+
+
+def _counter_name(field):
+    """The name of a counter without its `total`, which the OpenMetrics counters get as a suffix of their own."""
+    if field.startswith('total_'):
+        return field[len('total_'):]
+    if field.endswith('_total'):
+        return field[:-len('_total')]
+    return field
+
+
+def _escape_label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class OpenMetricsExporter:
+    """
+    Renders the metrics registries in the OpenMetrics text format, e.g. for a Prometheus scrape endpoint. Counters
+    become `toughpy_<component>_<counter>_total`, dropping a `total` of their own name, and the given `quantiles` of
+    the latency histograms become gauges in seconds labelled with their `quantile`; every sample is labelled with
+    its `command`. The quantiles are over the sliding window of the histograms, hence they are not exported as
+    summaries, whose count and sum never go down.
+
+    The text is rendered at most once per `cache_ttl` seconds, so that the cost of the scrapes stays bounded however
+    many there are; reading the histograms of thousands of commands is the expensive part and can be turned off by
+    passing no quantiles. Nothing is done on the paths of the calls themselves.
+    """
+
+    def __init__(self, registries=None, quantiles=DEFAULT_QUANTILES, cache_ttl=DEFAULT_CACHE_TTL,
+                 clock=time.monotonic):
+        self._registries = _default_registries() if registries is None else registries
+        self._quantiles = tuple(quantiles or ())
+        self._cache_ttl = cache_ttl
+        self._clock = clock
+        self._cached = None
+        self._expires = None
+        self._lock = threading.Lock()
+
+    def render(self):
+        with self._lock:
+            now = self._clock()
+            if self._cached is None or now >= self._expires:
+                self._cached = self._render()
+                self._expires = now + self._cache_ttl
+
+            return self._cached
+
+    def _render(self):
+        families = {}  # family name -> (type, [lines]), in the order of appearance
+        for component, snapshot, histograms in _collect(self._registries, self._quantiles):
+            counters, gauges, _ = _COMPONENTS[component]
+            label = 'command="%s"' % _escape_label(snapshot.name)
+
+            for field in counters:
+                family = 'toughpy_%s_%s' % (component, _counter_name(field))
+                families.setdefault(family, ('counter', []))[1].append(
+                    '%s_total{%s} %d' % (family, label, getattr(snapshot, field)))
+
+            for field in gauges:
+                family = 'toughpy_%s_%s' % (component, field)
+                families.setdefault(family, ('gauge', []))[1].append(
+                    '%s{%s} %d' % (family, label, getattr(snapshot, field)))
+
+            for histogram_name, (_, values) in histograms.items():
+                family = 'toughpy_%s_%s_seconds' % (component, histogram_name)
+                lines = families.setdefault(family, ('gauge', []))[1]
+                for q, value in zip(self._quantiles, values):
+                    lines.append('%s{%s,quantile="%s"} %r' % (family, label, q, value))
+
+        out = []
+        for family, (metric_type, lines) in families.items():
+            out.append('# TYPE %s %s' % (family, metric_type))
+            out.extend(lines)
+        out.append('# EOF')
+        return '\n'.join(out) + '\n'
+
+
+def render_openmetrics(registries=None, quantiles=DEFAULT_QUANTILES):
+    """Renders the metrics registries in the OpenMetrics text format once, see OpenMetricsExporter."""
+    return OpenMetricsExporter(registries, quantiles, cache_ttl=0).render()
+
+
+_statsd_unsafe = re.compile(r'[^A-Za-z0-9_.\-]')
+
+
+class StatsdExporter:
+    """
+    Pushes the metrics registries to a StatsD server over UDP every `interval` seconds from a background thread.
+    Counters are sent as the increments since the previous push, and only if they changed; gauges and the latency
+    quantiles (as `<histogram>.p<quantile>` in milliseconds) as gauges. The lines are batched into packets of at
+    most `max_packet_size` bytes. StatsD is best effort: a failing send is dropped.
+
+    The names are `<prefix>.<component>.<command>.<metric>`, where the characters StatsD cannot take are replaced
+    with underscores.
+    """
+
+    def __init__(self, host='127.0.0.1', port=DEFAULT_STATSD_PORT, prefix='toughpy',
+                 interval=DEFAULT_STATSD_INTERVAL, max_packet_size=DEFAULT_MAX_PACKET_SIZE,
+                 registries=None, quantiles=DEFAULT_QUANTILES):
+        self._address = (host, port)
+        self._prefix = prefix
+        self._interval = interval
+        self._max_packet_size = max_packet_size
+        self._registries = _default_registries() if registries is None else registries
+        self._quantiles = tuple(quantiles or ())
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._last_counts = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+        return False
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='toughpy-statsd', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        """Stops the background thread after a last push."""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._socket.close()
+
+    def _run(self):
+        while not self._stopped.wait(self._interval):
+            self.flush()
+        self.flush()
+
+    def flush(self):
+        """Pushes the metrics now and returns the number of packets sent."""
+        with self._lock:
+            packets = self._packets(self._lines())
+            for packet in packets:
+                try:
+                    self._socket.sendto(packet, self._address)
+                except OSError:
+                    pass
+
+            return len(packets)
+
+    def _lines(self):
+        last_counts = self._last_counts
+        for component, snapshot, histograms in _collect(self._registries, self._quantiles):
+            counters, gauges, _ = _COMPONENTS[component]
+            base = '%s.%s.%s.' % (self._prefix, component, _statsd_unsafe.sub('_', snapshot.name))
+
+            for field in counters:
+                value = getattr(snapshot, field)
+                key = (component, snapshot.name, field)
+                delta = value - last_counts.get(key, 0)
+                if delta < 0:  # the registry was cleared
+                    delta = value
+                last_counts[key] = value
+                if delta:
+                    yield '%s%s:%d|c' % (base, field, delta)
+
+            for field in gauges:
+                yield '%s%s:%d|g' % (base, field, getattr(snapshot, field))
+
+            for histogram_name, (_, values) in histograms.items():
+                for q, value in zip(self._quantiles, values):
+                    yield '%s%s.p%s:%.3f|g' % (base, histogram_name, ('%g' % (q * 100)).replace('.', '_'),
+                                                value * 1000)
+
+    def _packets(self, lines):
+        packets = []
+        current = bytearray()
+        for line in lines:
+            encoded = line.encode('utf-8')
+            if current and len(current) + 1 + len(encoded) > self._max_packet_size:
+                packets.append(bytes(current))
+                current = bytearray()
+            if current:
+                current += b'\n'
+            current += encoded
+
+        if current:
+            packets.append(bytes(current))
+
+        return packets
+
+
+__all__ = [
+    'OpenMetricsExporter',
+    'render_openmetrics',
+    'StatsdExporter'
+]
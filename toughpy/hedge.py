@@ -0,0 +1,194 @@
+import asyncio
+import contextvars
+import time
+from concurrent.futures import wait, FIRST_COMPLETED
+import toughpy.metrics as metrics
+from toughpy import predicates
+from toughpy.attempt import _try, _try_async
+from toughpy.budget import RetryBudget
+from toughpy.duration import seconds_of
+from toughpy.timeout import _get_executor
+from toughpy.utils import UNDEFINED, get_command_name, monotonic_ns, decorate_with
+
+DEFAULT_MAX_HEDGES = 1
+DEFAULT_HEDGE_PERCENTILE = 95
+DEFAULT_INITIAL_HEDGE_DELAY = 0.1  # seconds, until enough latencies are observed
+DEFAULT_MAX_HEDGE_PERCENT = 10
+
+_MIN_SAMPLES = 100
+_DELAY_REFRESH_INTERVAL = 1.0  # seconds
+
+
+class Hedge:
+    """
+    Hedged (speculative) execution: when an attempt has not answered within the hedge delay, another attempt is
+    started in parallel, up to `max_hedges` extra attempts. The first acceptable outcome wins and the other
+    attempts are cancelled (asyncio) or ignored (threads). An outcome is acceptable unless it matches `on_error`
+    or `on_result`, which accept the same hints as Retry; such an outcome starts the next hedge immediately.
+
+    The hedge delay is either fixed by `hedge_delay` (a Duration or seconds) or follows the
+    `hedge_percentile`th percentile of the observed attempt latencies of the command. In order not to double the
+    traffic of a slow backend, hedges are limited to `max_hedge_percent` percent of the calls over a sliding
+    window.
+
+    Synchronous attempts run on the thread pool of the attempt timeouts (see toughpy.timeout), asyncio attempts
+    run as tasks of the calling loop.
+    """
+
+    def __init__(self,
+                 on_error=None,
+                 on_result=UNDEFINED,
+                 max_hedges=DEFAULT_MAX_HEDGES,
+                 hedge_delay=None,
+                 hedge_percentile=DEFAULT_HEDGE_PERCENTILE,
+                 initial_hedge_delay=DEFAULT_INITIAL_HEDGE_DELAY,
+                 max_hedge_percent=DEFAULT_MAX_HEDGE_PERCENT,
+                 clock=time.monotonic):
+        if not isinstance(max_hedges, int) or max_hedges < 0:
+            raise ValueError('`max_hedges` should be a non-negative integer.')
+
+        self._error_predicate = predicates.create_error_predicate(on_error).compile()
+        self._result_predicate = predicates.create_result_predicate(on_result).compile()
+        self._max_hedges = max_hedges
+        self._hedge_delay = seconds_of(hedge_delay)
+        self._hedge_percentile = hedge_percentile
+        self._initial_hedge_delay = seconds_of(initial_hedge_delay)
+        self._clock = clock
+        self._budget = RetryBudget(percent_can_retry=max_hedge_percent, min_retries_per_second=0, clock=clock)
+        self._adaptive_delays = {}
+
+    def __call__(self, fn):
+        return decorate_with(fn, self.execute, self.execute_async)
+
+    def _delay_of(self, hedge_metrics):
+        if self._hedge_delay is not None:
+            return self._hedge_delay
+
+        now = self._clock()
+        cached = self._adaptive_delays.get(hedge_metrics.name)
+        if cached is not None and cached[1] > now:
+            return cached[0]
+
+        latencies = hedge_metrics.attempt_latency.snapshot()
+        if latencies.count >= _MIN_SAMPLES:
+            delay = latencies.percentile(self._hedge_percentile) / 1000000000.0
+        else:
+            delay = self._initial_hedge_delay
+
+        self._adaptive_delays[hedge_metrics.name] = (delay, now + _DELAY_REFRESH_INTERVAL)
+        return delay
+
+    def _is_acceptable(self, attempt):
+        if attempt.is_failure():
+            return not self._error_predicate(attempt.get_error())
+        else:
+            return not self._result_predicate(attempt.get())
+
+    # noinspection PyProtectedMember
+    def _may_hedge(self, launched, hedge_metrics):
+        if launched > self._max_hedges:
+            return False
+
+        if self._budget.try_withdraw(hedge_metrics.name):
+            hedge_metrics._increment_hedges()
+            return True
+
+        hedge_metrics._increment_hedges_denied()
+        return False
+
+    # noinspection PyProtectedMember
+    def _complete(self, attempt, hedge_metrics):
+        if attempt.attempt_number > 1 and self._is_acceptable(attempt):
+            hedge_metrics._increment_hedge_wins()
+
+        return attempt.get()
+
+    # noinspection PyProtectedMember
+    @staticmethod
+    def _run_attempt(attempt_number, hedge_metrics, fn, args, kwargs):
+        started = monotonic_ns()
+        attempt = _try(attempt_number, fn, args, kwargs)
+        ended = monotonic_ns()
+        hedge_metrics._record_attempt(ended - started, ended)
+        return attempt
+
+    # noinspection PyProtectedMember
+    def execute(self, fn, *args, **kwargs):
+        hedge_metrics = metrics.hedge_metrics[get_command_name(fn)]
+        hedge_metrics._increment_calls()
+        self._budget.deposit(hedge_metrics.name)
+        delay = self._delay_of(hedge_metrics)
+        executor = _get_executor()
+        context = contextvars.copy_context()
+
+        def launch(attempt_number):
+            return executor.submit(context.copy().run, Hedge._run_attempt,
+                                   attempt_number, hedge_metrics, fn, args, kwargs)
+
+        pending = {launch(1)}
+        launched = 1
+        hedging = self._max_hedges > 0
+        last_attempt = None
+
+        while True:
+            done, pending = wait(pending, timeout=delay if hedging else None, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                last_attempt = future.result()
+                if self._is_acceptable(last_attempt):
+                    for other in pending:
+                        other.cancel()
+                    return self._complete(last_attempt, hedge_metrics)
+
+            if hedging and self._may_hedge(launched, hedge_metrics):
+                launched += 1
+                pending.add(launch(launched))
+            else:
+                hedging = False
+                if not pending:
+                    return self._complete(last_attempt, hedge_metrics)
+
+    # noinspection PyProtectedMember
+    async def execute_async(self, fn, *args, **kwargs):
+        hedge_metrics = metrics.hedge_metrics[get_command_name(fn)]
+        hedge_metrics._increment_calls()
+        self._budget.deposit(hedge_metrics.name)
+        delay = self._delay_of(hedge_metrics)
+
+        async def run_attempt(attempt_number):
+            started = monotonic_ns()
+            attempt = await _try_async(attempt_number, fn, args, kwargs)
+            ended = monotonic_ns()
+            hedge_metrics._record_attempt(ended - started, ended)
+            return attempt
+
+        pending = {asyncio.ensure_future(run_attempt(1))}
+        launched = 1
+        hedging = self._max_hedges > 0
+        last_attempt = None
+
+        try:
+            while True:
+                done, pending = await asyncio.wait(pending, timeout=delay if hedging else None,
+                                                   return_when=asyncio.FIRST_COMPLETED)
+
+                for task in done:
+                    last_attempt = task.result()
+                    if self._is_acceptable(last_attempt):
+                        return self._complete(last_attempt, hedge_metrics)
+
+                if hedging and self._may_hedge(launched, hedge_metrics):
+                    launched += 1
+                    pending.add(asyncio.ensure_future(run_attempt(launched)))
+                else:
+                    hedging = False
+                    if not pending:
+                        return self._complete(last_attempt, hedge_metrics)
+        finally:
+            for task in pending:
+                task.cancel()
+
+
+__all__ = [
+    'Hedge'
+]
@@ -0,0 +1,199 @@
+from array import array
+from toughpy.duration import seconds_of
+from toughpy.utils import monotonic_ns
+
+_msg_invalid_percentile = '`%s` is not a valid percentile. It should be a number between 0 and 100.'
+
+DEFAULT_MAX_VALUE_BITS = 40  # about 18 minutes when the values are nanoseconds
+DEFAULT_PRECISION_BITS = 3  # 2^3 sub-buckets per power of two, i.e. at most 12.5% relative error
+DEFAULT_SLICES = 6
+DEFAULT_SLICE_DURATION = 10  # seconds
+
+
+class Histogram:
+    """
+    A fixed-memory, log-linear bucketed histogram of non-negative integers in the spirit of HdrHistogram.
+
+    Values below 2^(precision_bits + 1) are counted exactly. Above that, every power of two is split into
+    2^precision_bits equal sub-buckets, so a recorded value is known with a relative error of at most
+    1 / 2^precision_bits. Values of 2^max_value_bits or more are counted in the last bucket.
+
+    A histogram is not synchronized: concurrent writers racing on the very same bucket may rarely drop a sample,
+    which only affects the estimates and never raises.
+    """
+
+    def __init__(self, max_value_bits=DEFAULT_MAX_VALUE_BITS, precision_bits=DEFAULT_PRECISION_BITS):
+        if not 0 <= precision_bits < max_value_bits:
+            raise ValueError('`precision_bits` should be between 0 and `max_value_bits`.')
+
+        self._precision_bits = precision_bits
+        self._sub_buckets = 1 << precision_bits
+        self._max_value = (1 << max_value_bits) - 1
+        self._counts = array('I', bytes(4 * (max_value_bits - precision_bits + 1) * self._sub_buckets))
+
+    @property
+    def bucket_count(self):
+        return len(self._counts)
+
+    @property
+    def count(self):
+        return sum(self._counts)
+
+    def record(self, value):
+        self._counts[self._index_of(value)] += 1
+
+    def _index_of(self, value):
+        if value < self._sub_buckets:
+            return int(value) if value > 0 else 0
+
+        value = int(value)
+        if value > self._max_value:
+            value = self._max_value
+
+        shift = value.bit_length() - 1 - self._precision_bits
+        return ((shift + 1) << self._precision_bits) + (value >> shift) - self._sub_buckets
+
+    def _lowest_of(self, index):
+        group = index >> self._precision_bits
+        if group == 0:
+            return index
+
+        return (self._sub_buckets + (index & (self._sub_buckets - 1))) << (group - 1)
+
+    def _highest_of(self, index):
+        group = index >> self._precision_bits
+        if group == 0:
+            return index
+
+        return self._lowest_of(index) + (1 << (group - 1)) - 1
+
+    def percentile(self, q):
+        """
+        Returns the highest value equivalent to the `q`th percentile (0 <= q <= 100), or 0 if nothing is recorded.
+        """
+        if not 0 <= q <= 100:
+            raise ValueError(_msg_invalid_percentile % q)
+
+        counts = self._counts
+        total = sum(counts)
+        if total == 0:
+            return 0
+
+        rank = max(1, -(-total * q // 100))  # ceil without floats for large totals
+        seen = 0
+        for index, count in enumerate(counts):
+            seen += count
+            if seen >= rank:
+                return self._highest_of(index)
+
+        return self._highest_of(len(counts) - 1)
+
+    def count_at_least(self, value):
+        """Returns the number of recorded values in the buckets at or above the bucket of `value`."""
+        return sum(self._counts[self._index_of(value):])
+
+    def count_below(self, value):
+        """Returns the number of recorded values in the buckets below the bucket of `value`."""
+        return sum(self._counts[:self._index_of(value)])
+
+    def add(self, other):
+        if len(other._counts) != len(self._counts) or other._precision_bits != self._precision_bits:
+            raise ValueError('Only histograms with the same layout can be added.')
+
+        counts = self._counts
+        for index, count in enumerate(other._counts):
+            if count:
+                counts[index] += count
+
+    def clear(self):
+        self._counts = array('I', bytes(4 * len(self._counts)))
+
+
+class RollingHistogram:
+    """
+    A histogram over a sliding time window. The window is a ring of `slices` histograms, each covering
+    `slice_duration` (a Duration or seconds). A slice is allocated when it is first written to and is recycled
+    once it falls out of the window, so the memory is bounded by `slices` histograms.
+    """
+
+    def __init__(self, slices=DEFAULT_SLICES, slice_duration=DEFAULT_SLICE_DURATION,
+                 max_value_bits=DEFAULT_MAX_VALUE_BITS, precision_bits=DEFAULT_PRECISION_BITS, clock=monotonic_ns):
+        self._slice_ns = int(seconds_of(slice_duration) * 1000000000)
+        if self._slice_ns <= 0 or slices <= 0:
+            raise ValueError('`slices` and `slice_duration` should be greater than 0.')
+
+        self._max_value_bits = max_value_bits
+        self._precision_bits = precision_bits
+        self._clock = clock
+        self._epochs = [-1] * slices
+        self._slices = [None] * slices
+        self._current = (-1, None)  # the epoch and histogram of the last slice written to
+
+    @property
+    def window(self):
+        """The length of the full window in seconds."""
+        return len(self._slices) * self._slice_ns / 1000000000.0
+
+    def record(self, value, now_ns=None):
+        self.record_at(self._clock() if now_ns is None else now_ns, value)
+
+    def record_at(self, now_ns, value):
+        """Records `value` at `now_ns`, for the callers which have read the clock anyway. Cheap while in one slice."""
+        current_epoch, histogram = self._current  # a single read, consistent even when racing a roll
+        if current_epoch != now_ns // self._slice_ns:
+            histogram = self._slice_at(now_ns)
+        histogram._counts[histogram._index_of(value)] += 1
+
+    def _slice_at(self, now_ns):
+        """Returns the histogram of the slice covering `now_ns`, allocating or recycling it if needed."""
+        epoch = now_ns // self._slice_ns
+        current_epoch, histogram = self._current  # a single read, consistent even when racing a roll
+        if current_epoch == epoch:
+            return histogram
+
+        idx = epoch % len(self._slices)
+        if self._epochs[idx] != epoch:
+            self._recycle(idx, epoch)
+
+        histogram = self._slices[idx]
+        if epoch > current_epoch:  # a late value of an older slice does not move the current one back
+            self._current = (epoch, histogram)
+        return histogram
+
+    def _recycle(self, idx, epoch):
+        histogram = self._slices[idx]
+        if histogram is None:
+            self._slices[idx] = Histogram(self._max_value_bits, self._precision_bits)
+        else:
+            histogram.clear()
+        self._epochs[idx] = epoch
+
+    def snapshot(self, window=None):
+        """
+        Merges the slices covering the last `window` (a Duration or seconds, the full window if None) into a new
+        Histogram. The current slice is partial, hence the effective window is up to one slice shorter.
+        """
+        slice_count = len(self._slices)
+        if window is not None:
+            slice_count = min(slice_count, max(1, -(-int(seconds_of(window) * 1000000000) // self._slice_ns)))
+
+        current_epoch = self._clock() // self._slice_ns
+        result = Histogram(self._max_value_bits, self._precision_bits)
+        for idx, epoch in enumerate(self._epochs):
+            histogram = self._slices[idx]
+            if histogram is not None and current_epoch - slice_count < epoch <= current_epoch:
+                result.add(histogram)
+
+        return result
+
+    def percentile(self, q, window=None):
+        return self.snapshot(window).percentile(q)
+
+    def count(self, window=None):
+        return self.snapshot(window).count
+
+
+__all__ = [
+    'Histogram',
+    'RollingHistogram'
+]
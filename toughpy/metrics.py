@@ -1,16 +1,115 @@
-class RetryMetrics:
-    def __init__(self, name):
-        self.name = name
-        self.successful_calls_without_retry = 0
-        self.successful_calls_with_retry = 0
-        self.failed_calls_without_retry = 0
-        self.failed_calls_with_retry = 0
-        self.total_calls = 0
-        self.total_retry_attempts = 0
+import threading
+import weakref
+from collections import namedtuple
+from toughpy.histogram import RollingHistogram
+
+# Slots of the per-thread counter shards of RetryMetrics. The total number of calls is not stored but derived from
+# the four outcome counters, so a snapshot can never observe a call that is counted but has no outcome.
+_SUCCESSFUL_WITHOUT_RETRY = 0
+_SUCCESSFUL_WITH_RETRY = 1
+_FAILED_WITHOUT_RETRY = 2
+_FAILED_WITH_RETRY = 3
+_RETRY_ATTEMPTS = 4
+_RETRIES_DENIED_BY_BUDGET = 5
+_RETRIES_ABORTED_BY_DEADLINE = 6
+_TIMED_OUT_ATTEMPTS = 7
+_ABANDONED_ATTEMPTS = 8
+_NUM_RETRY_COUNTERS = 9
+
+# Slots of the per-thread counter shards of CircuitBreakerMetrics
+_CB_SUCCESSFUL_CALLS = 0
+_CB_FAILED_CALLS = 1
+_CB_NOT_PERMITTED_CALLS = 2
+_NUM_CB_COUNTERS = 3
+
+# Slots of the per-thread counter shards of BulkheadMetrics
+_BH_PERMITTED_CALLS = 0
+_BH_REJECTED_CALLS = 1
+_NUM_BH_COUNTERS = 2
+
+# Slots of the per-thread counter shards of HedgeMetrics
+_HG_CALLS = 0
+_HG_HEDGES = 1
+_HG_HEDGES_DENIED = 2
+_HG_HEDGE_WINS = 3
+_NUM_HG_COUNTERS = 4
+
+
+class ShardedCounters:
+    """
+    A fixed-size group of counters sharded per thread. Every thread increments the slots of its own shard, so the
+    hot path never takes a lock and no increment is lost. Readers merge the shards; shards of terminated threads
+    are folded into a retired total to keep the memory bounded.
+    """
+
+    def __init__(self, size):
+        self._size = size
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shards = []
+        self._retired = [0] * size
+
+    def shard(self):
+        """Returns the counter list owned by the current thread. Only the owner thread may write into it."""
+        try:
+            return self._local.counts
+        except AttributeError:
+            return self._new_shard()
+
+    def _new_shard(self):
+        counts = [0] * self._size
+        with self._lock:
+            self._retire_dead_shards()  # or threads coming and going would pile up shards until the next sum
+            self._shards.append((weakref.ref(threading.current_thread()), counts))
+        self._local.counts = counts
+        return counts
+
+    def _retire_dead_shards(self):
+        """Folds the shards of the terminated threads into the retired total. Called with the lock held."""
+        alive_shards = []
+        for thread_ref, counts in self._shards:
+            thread = thread_ref()
+            if thread is not None and thread.is_alive():
+                alive_shards.append((thread_ref, counts))
+            else:
+                # read after the thread is seen dead, so that its last increments are in
+                self._retired = [r + v for r, v in zip(self._retired, counts[:])]
+
+        self._shards = alive_shards
+
+    def sum(self):
+        with self._lock:
+            self._retire_dead_shards()
+            totals = list(self._retired)
+            for _, counts in self._shards:
+                values = counts[:]  # copying a list is atomic under the GIL
+                for i in range(self._size):
+                    totals[i] += values[i]
+
+        return totals
+
+
+class RetryMetricsSnapshot(namedtuple('RetryMetricsSnapshot', ['name',
+                                                               'successful_calls_without_retry',
+                                                               'successful_calls_with_retry',
+                                                               'failed_calls_without_retry',
+                                                               'failed_calls_with_retry',
+                                                               'total_retry_attempts',
+                                                               'retries_denied_by_budget',
+                                                               'retries_aborted_by_deadline',
+                                                               'timed_out_attempts',
+                                                               'abandoned_attempts'])):
+    """A consistent, immutable view of a RetryMetrics instance at a point in time."""
+    __slots__ = ()
+
+    @property
+    def total_calls(self):
+        return (self.successful_calls_without_retry + self.successful_calls_with_retry +
+                self.failed_calls_without_retry + self.failed_calls_with_retry)
 
     @property
     def retry_attempts_per_call(self):
-        return float(self.total_retry_attempts) / self.total_calls
+        return self._ratio_of(self.total_retry_attempts)
 
     @property
     def ratio_of_successful_calls_without_retry(self):
@@ -29,41 +128,415 @@ class RetryMetrics:
         return self._ratio_of(self.failed_calls_with_retry)
 
     def _ratio_of(self, value):
-        return float(value) / self.total_calls
+        total_calls = self.total_calls
+        return float(value) / total_calls if total_calls else 0.0
+
+
+class RetryMetrics:
+    counter_count = _NUM_RETRY_COUNTERS
+
+    def __init__(self, name, counters=None):
+        self.name = name
+        self._counters = ShardedCounters(_NUM_RETRY_COUNTERS) if counters is None else counters
+        # rolling histograms, latencies are in nanoseconds
+        self.call_latency = RollingHistogram()
+        self.attempt_latency = RollingHistogram()
+        self.backoff_time = RollingHistogram()
+        self.attempts_per_call = RollingHistogram(max_value_bits=16)
+
+    def snapshot(self):
+        return RetryMetricsSnapshot(self.name, *self._counters.sum())
+
+    @property
+    def successful_calls_without_retry(self):
+        return self.snapshot().successful_calls_without_retry
+
+    @property
+    def successful_calls_with_retry(self):
+        return self.snapshot().successful_calls_with_retry
+
+    @property
+    def failed_calls_without_retry(self):
+        return self.snapshot().failed_calls_without_retry
+
+    @property
+    def failed_calls_with_retry(self):
+        return self.snapshot().failed_calls_with_retry
+
+    @property
+    def total_calls(self):
+        return self.snapshot().total_calls
+
+    @property
+    def total_retry_attempts(self):
+        return self.snapshot().total_retry_attempts
+
+    @property
+    def retries_denied_by_budget(self):
+        return self.snapshot().retries_denied_by_budget
+
+    @property
+    def retries_aborted_by_deadline(self):
+        return self.snapshot().retries_aborted_by_deadline
+
+    @property
+    def timed_out_attempts(self):
+        return self.snapshot().timed_out_attempts
+
+    @property
+    def abandoned_attempts(self):
+        return self.snapshot().abandoned_attempts
+
+    @property
+    def retry_attempts_per_call(self):
+        return self.snapshot().retry_attempts_per_call
+
+    @property
+    def ratio_of_successful_calls_without_retry(self):
+        return self.snapshot().ratio_of_successful_calls_without_retry
+
+    @property
+    def ratio_of_successful_calls_with_retry(self):
+        return self.snapshot().ratio_of_successful_calls_with_retry
+
+    @property
+    def ratio_of_failed_calls_without_retry(self):
+        return self.snapshot().ratio_of_failed_calls_without_retry
+
+    @property
+    def ratio_of_failed_calls_with_retry(self):
+        return self.snapshot().ratio_of_failed_calls_with_retry
+
+    def _record_attempt(self, latency_ns, now_ns):
+        self.attempt_latency.record_at(now_ns, latency_ns)
+
+    def _record_backoff(self, slept_ns, now_ns):
+        self.backoff_time.record_at(now_ns, slept_ns)
+
+    def _record_call(self, attempt, latency_ns, now_ns):
+        self.call_latency.record_at(now_ns, latency_ns)
+        self.attempts_per_call.record_at(now_ns, attempt.attempt_number)
+
+    def _record_first_try_success(self, latency_ns, now_ns):
+        """Records a call succeeding at the first try, and its only attempt, without an Attempt (see Retry)."""
+        self.attempt_latency.record_at(now_ns, latency_ns)
+        self.call_latency.record_at(now_ns, latency_ns)
+        self.attempts_per_call.record_at(now_ns, 1)
+        self._counters.shard()[_SUCCESSFUL_WITHOUT_RETRY] += 1
+
+    def _increment_retry_attempts(self):
+        self._counters.shard()[_RETRY_ATTEMPTS] += 1
+
+    def _increment_retries_denied_by_budget(self):
+        self._counters.shard()[_RETRIES_DENIED_BY_BUDGET] += 1
+
+    def _increment_retries_aborted_by_deadline(self):
+        self._counters.shard()[_RETRIES_ABORTED_BY_DEADLINE] += 1
+
+    def _increment_timed_out_attempts(self):
+        self._counters.shard()[_TIMED_OUT_ATTEMPTS] += 1
+
+    def _increment_abandoned_attempts(self):
+        self._counters.shard()[_ABANDONED_ATTEMPTS] += 1
 
     def _increment_successful_calls(self, attempt):
         if attempt.attempt_number == 1:
-            self.successful_calls_without_retry += 1
+            self._counters.shard()[_SUCCESSFUL_WITHOUT_RETRY] += 1
         else:
-            self.successful_calls_with_retry += 1
+            self._counters.shard()[_SUCCESSFUL_WITH_RETRY] += 1
 
     def _increment_failed_calls(self, attempt):
         if attempt.attempt_number == 1:
-            self.failed_calls_without_retry += 1
+            self._counters.shard()[_FAILED_WITHOUT_RETRY] += 1
         else:
-            self.failed_calls_with_retry += 1
+            self._counters.shard()[_FAILED_WITH_RETRY] += 1
+
+
+class CircuitBreakerMetricsSnapshot(namedtuple('CircuitBreakerMetricsSnapshot', ['name',
+                                                                                 'successful_calls',
+                                                                                 'failed_calls',
+                                                                                 'not_permitted_calls'])):
+    __slots__ = ()
+
+
+class CircuitBreakerMetrics:
+    counter_count = _NUM_CB_COUNTERS
+
+    def __init__(self, name, counters=None):
+        self.name = name
+        self._counters = ShardedCounters(_NUM_CB_COUNTERS) if counters is None else counters
+
+    def snapshot(self):
+        return CircuitBreakerMetricsSnapshot(self.name, *self._counters.sum())
+
+    @property
+    def successful_calls(self):
+        return self.snapshot().successful_calls
+
+    @property
+    def failed_calls(self):
+        return self.snapshot().failed_calls
+
+    @property
+    def not_permitted_calls(self):
+        return self.snapshot().not_permitted_calls
+
+    def _increment_successful_calls(self):
+        self._counters.shard()[_CB_SUCCESSFUL_CALLS] += 1
+
+    def _increment_failed_calls(self):
+        self._counters.shard()[_CB_FAILED_CALLS] += 1
+
+    def _increment_not_permitted_calls(self):
+        self._counters.shard()[_CB_NOT_PERMITTED_CALLS] += 1
+
+
+class BulkheadMetricsSnapshot(namedtuple('BulkheadMetricsSnapshot', ['name',
+                                                                     'permitted_calls',
+                                                                     'rejected_calls',
+                                                                     'in_flight_calls',
+                                                                     'queued_calls'])):
+    __slots__ = ()
+
+
+class BulkheadMetrics:
+    counter_count = _NUM_BH_COUNTERS
+
+    def __init__(self, name, counters=None):
+        self.name = name
+        self._counters = ShardedCounters(_NUM_BH_COUNTERS) if counters is None else counters
+        self._gauges = (0, 0)  # (in flight, queued), replaced as a whole by the bulkhead
+        self.wait_time = RollingHistogram()  # nanoseconds
+
+    def snapshot(self):
+        return BulkheadMetricsSnapshot(self.name, *(self._counters.sum() + list(self._gauges)))
+
+    @property
+    def permitted_calls(self):
+        return self.snapshot().permitted_calls
+
+    @property
+    def rejected_calls(self):
+        return self.snapshot().rejected_calls
+
+    @property
+    def in_flight_calls(self):
+        return self._gauges[0]
+
+    @property
+    def queued_calls(self):
+        return self._gauges[1]
+
+    def _set_gauges(self, in_flight_calls, queued_calls):
+        self._gauges = (in_flight_calls, queued_calls)
+
+    def _record_permitted_call(self, waited_ns, now_ns):
+        self._counters.shard()[_BH_PERMITTED_CALLS] += 1
+        self.wait_time.record_at(now_ns, waited_ns)
+
+    def _increment_rejected_calls(self):
+        self._counters.shard()[_BH_REJECTED_CALLS] += 1
+
+
+class HedgeMetricsSnapshot(namedtuple('HedgeMetricsSnapshot', ['name',
+                                                               'total_calls',
+                                                               'hedges',
+                                                               'hedges_denied',
+                                                               'hedge_wins'])):
+    __slots__ = ()
+
+
+class HedgeMetrics:
+    counter_count = _NUM_HG_COUNTERS
+
+    def __init__(self, name, counters=None):
+        self.name = name
+        self._counters = ShardedCounters(_NUM_HG_COUNTERS) if counters is None else counters
+        self.attempt_latency = RollingHistogram()  # nanoseconds, including the attempts which lost
+
+    def snapshot(self):
+        return HedgeMetricsSnapshot(self.name, *self._counters.sum())
+
+    @property
+    def total_calls(self):
+        return self.snapshot().total_calls
+
+    @property
+    def hedges(self):
+        return self.snapshot().hedges
+
+    @property
+    def hedges_denied(self):
+        return self.snapshot().hedges_denied
+
+    @property
+    def hedge_wins(self):
+        return self.snapshot().hedge_wins
+
+    def _record_attempt(self, latency_ns, now_ns):
+        self.attempt_latency.record_at(now_ns, latency_ns)
+
+    def _increment_calls(self):
+        self._counters.shard()[_HG_CALLS] += 1
+
+    def _increment_hedges(self):
+        self._counters.shard()[_HG_HEDGES] += 1
+
+    def _increment_hedges_denied(self):
+        self._counters.shard()[_HG_HEDGES_DENIED] += 1
+
+    def _increment_hedge_wins(self):
+        self._counters.shard()[_HG_HEDGE_WINS] += 1
+
+
+def _ignore(*args):
+    pass
+
+
+class _DisabledMetrics:
+    """Stands in for the metrics of a command while its registry is disabled; all of the recordings are ignored."""
+
+    def __init__(self, name):
+        self.name = name
+
+    def __getattr__(self, attr):
+        if not attr.startswith('_'):
+            raise AttributeError('Metrics of `%s` are not recorded while disabled' % self.name)
+
+        setattr(self, attr, _ignore)  # found on the instance afterwards
+        return _ignore
 
 
 class MetricsRegistry:
     def __init__(self, metrics_type):
         self.__register = {}
+        self.__disabled = {}
+        self.__lock = threading.Lock()
         self.__metrics_type = metrics_type
+        self.__generation = 0
+        self.__enabled = True
+        self.__shared = None
+
+    @property
+    def generation(self):
+        """
+        Incremented by every `clear` and by enabling or disabling the registry, so that the holders of metrics
+        instances know when to look them up again.
+        """
+        return self.__generation
+
+    @property
+    def enabled(self):
+        """While disabled, the registry hands out metrics ignoring whatever is recorded, e.g. to measure overhead."""
+        return self.__enabled
+
+    @enabled.setter
+    def enabled(self, value):
+        with self.__lock:
+            self.__enabled = bool(value)
+            self.__generation += 1
 
     def __getitem__(self, key):
+        if not self.__enabled:
+            return self.__disabled_metrics(key)
+
         metrics = self.__register.get(key)
         if metrics is None:
-            metrics = self.__metrics_type(key)
-            self.__register[key] = metrics
+            with self.__lock:
+                metrics = self.__register.get(key)
+                if metrics is None:
+                    metrics = self.__new_metrics(key)
+                    self.__register[key] = metrics
 
         return metrics
 
+    def __new_metrics(self, key):
+        counters = None if self.__shared is None else self.__shared.counters(key)
+        return self.__metrics_type(key, counters)  # in this process only when the shared file is full
+
+    def __disabled_metrics(self, key):
+        metrics = self.__disabled.get(key)
+        if metrics is None:
+            metrics = self.__disabled.setdefault(key, _DisabledMetrics(key))
+
+        return metrics
+
+    def snapshot(self):
+        """Returns a dictionary of command names to the snapshots of their metrics."""
+        return {name: metrics.snapshot() for name, metrics in self._registered()}
+
+    def _registered(self):
+        """
+        Returns the (name, metrics) pairs registered, e.g. for the exporters. When shared, those of the commands
+        registered by the other processes are included.
+        """
+        shared = self.__shared
+        with self.__lock:
+            if shared is not None:
+                for name in shared.names():
+                    if name not in self.__register:
+                        self.__register[name] = self.__new_metrics(name)
+
+            return list(self.__register.items())
+
+    def share(self, path, max_commands=None, max_lanes=None):
+        """
+        Shares the counters with the other processes of the host which share the registry through the same file,
+        e.g. the workers of a pre-forking server: the counts and snapshots become the totals of all of them. Each
+        thread increments counters of its own in the file, without locking. Only the counters are shared; the
+        histograms and gauges stay per process.
+
+        Call it before forking or in every process. A forked child counts in its own counters, starting from zero.
+        The file is created with room for `max_commands` commands and `max_lanes` threads recording at the same
+        time over all of the processes (see toughpy.sharedmetrics for the defaults, sized from the CPUs), and every
+        process must give the same sizes. Beyond them, the counts stay in their process.
+        """
+        from toughpy import sharedmetrics
+
+        shared = sharedmetrics.SharedCounterFile(
+            path, self.__metrics_type.counter_count,
+            sharedmetrics.DEFAULT_MAX_COMMANDS if max_commands is None else max_commands,
+            sharedmetrics.DEFAULT_MAX_LANES if max_lanes is None else max_lanes)
+        self.__replace_counters(shared)
+
+    def unshare(self):
+        """Goes back to counting in this process only, from zero."""
+        self.__replace_counters(None)
+
+    def __replace_counters(self, shared):
+        with self.__lock:
+            self.__shared = shared
+            self.__register.clear()
+            self.__disabled.clear()
+            self.__generation += 1
+
     def clear(self):
-        self.__register.clear()
+        """Forgets all of the commands, and zeroes the shared counters if shared, e.g. between tests."""
+        with self.__lock:
+            if self.__shared is not None:
+                self.__shared.zero()
+            self.__register.clear()
+            self.__disabled.clear()
+            self.__generation += 1
 
 
 retry_metrics = MetricsRegistry(RetryMetrics)
+circuit_breaker_metrics = MetricsRegistry(CircuitBreakerMetrics)
+bulkhead_metrics = MetricsRegistry(BulkheadMetrics)
+hedge_metrics = MetricsRegistry(HedgeMetrics)
 
 __all__ = [
     'retry_metrics',
-    'RetryMetrics'
+    'circuit_breaker_metrics',
+    'bulkhead_metrics',
+    'hedge_metrics',
+    'HedgeMetrics',
+    'HedgeMetricsSnapshot',
+    'BulkheadMetrics',
+    'BulkheadMetricsSnapshot',
+    'CircuitBreakerMetrics',
+    'CircuitBreakerMetricsSnapshot',
+    'MetricsRegistry',
+    'RetryMetrics',
+    'RetryMetricsSnapshot'
 ]
@@ -1,3 +1,5 @@
+import errno
+import re
 from abc import abstractmethod
 from toughpy.utils import *
 
@@ -10,26 +12,101 @@ _msg_invalid_error_predicate = '''A value of `%s` is not valid for an error pred
  - A callable taking an argument and returning a boolean.
 '''
 
+TYPE_CACHE_SIZE = 256  # types remembered by a predicate deciding on the type of its argument only
+
+# the codes of the transient failures, by default of has_status and has_errno
+RETRYABLE_STATUS_CODES = frozenset([408, 425, 429, 500, 502, 503, 504])
+RETRYABLE_ERRNOS = frozenset(getattr(errno, name) for name in ['ECONNREFUSED', 'ECONNRESET', 'ECONNABORTED',
+                                                               'ETIMEDOUT', 'EHOSTUNREACH', 'ENETUNREACH',
+                                                               'ENETDOWN', 'EPIPE', 'EAGAIN']
+                             if hasattr(errno, name))
+
 
 class Predicate:
+    """
+    A test of the errors or of the results. Predicates combine with `&`, `|` and `~`, also with the error types and
+    the callables accepted for an error predicate, e.g.
+
+        is_instance_of(ConnectionError) | has_attribute('errno', errno.ECONNRESET) & ~is_instance_of(ssl.SSLError)
+
+    `compile` turns a predicate into a single plain function.
+    """
+
+    # whether the outcome depends on the type of the argument only, hence can be cached per type
+    _type_only = False
+
     def __call__(self, arg):
-        return self.test(arg)
+        return self.compile()(arg)
 
     @abstractmethod
     def test(self, arg): pass
 
+    def compile(self):
+        """
+        Returns a plain function testing the same as this predicate, computed once. The combinations are flattened
+        into a single function, and the decisions based on the type of the argument only are remembered per type,
+        for the last TYPE_CACHE_SIZE types, so that testing a known error type is a single dictionary lookup.
+        """
+        compiled = self.__dict__.get('_compiled')
+        if compiled is None:
+            compiled = _cached_by_type(self._function()) if self._type_only else self._function()
+            self._compiled = compiled
+        return compiled
+
+    def _function(self):
+        """Returns a plain function testing the same as this predicate, without caching the decisions."""
+        return self.test
+
+    def __and__(self, other):
+        other = _predicate_of(other)
+        return NotImplemented if other is None else _All([self, other])
+
+    def __rand__(self, other):
+        other = _predicate_of(other)
+        return NotImplemented if other is None else _All([other, self])
+
+    def __or__(self, other):
+        other = _predicate_of(other)
+        return NotImplemented if other is None else _Any([self, other])
+
+    def __ror__(self, other):
+        other = _predicate_of(other)
+        return NotImplemented if other is None else _Any([other, self])
+
+    def __invert__(self):
+        return _Not(self)
+
+
+def _true(arg):
+    return True
+
+
+def _false(arg):
+    return False
+
 
 class _Always(Predicate):
+    _type_only = True
+
     def test(self, arg):
         return True
 
+    def _function(self):
+        return _true
+
 
 class _Never(Predicate):
+    _type_only = True
+
     def test(self, arg):
         return False
 
+    def _function(self):
+        return _false
+
 
 class _IsInstanceOf(Predicate):
+    _type_only = True
 
     def __init__(self, expected_type):
         self.expected_type = expected_type
@@ -37,12 +114,20 @@ class _IsInstanceOf(Predicate):
     def test(self, arg):
         return isinstance(arg, self.expected_type)
 
+    def _function(self):
+        expected_type = self.expected_type
+        return lambda arg: isinstance(arg, expected_type)
+
     def __eq__(self, other):
         if isinstance(other, _IsInstanceOf):
             return self.expected_type == other.expected_type
         else:
             return False
 
+    @property
+    def _types(self):
+        return self.expected_type if isinstance(self.expected_type, tuple) else (self.expected_type,)
+
 
 class _EqualTo(Predicate):
     def __init__(self, expected_value):
@@ -54,6 +139,12 @@ class _EqualTo(Predicate):
         else:
             return self.expected_value == arg
 
+    def _function(self):
+        expected_value = self.expected_value
+        if expected_value is None:
+            return lambda arg: arg is None
+        return lambda arg: expected_value == arg
+
     def __eq__(self, other):
         if isinstance(other, _EqualTo):
             return self.expected_value == other.expected_value
@@ -68,6 +159,296 @@ class _CustomPredicate(Predicate):
     def test(self, arg):
         return self._func.__call__(arg)
 
+    def _function(self):
+        return self._func
+
+
+_MISSING = object()
+
+
+class _HasAttribute(Predicate):
+    def __init__(self, name, values):
+        self.name = name
+        self.values = values
+
+    def test(self, arg):
+        value = getattr(arg, self.name, _MISSING)
+        if not self.values:
+            return value is not _MISSING
+        return value is not _MISSING and value in self.values
+
+    def _function(self):
+        name, values = self.name, self.values
+        if not values:
+            return lambda arg: hasattr(arg, name)
+        return lambda arg: getattr(arg, name, _MISSING) in values
+
+    def __eq__(self, other):
+        if isinstance(other, _HasAttribute):
+            return (self.name, self.values) == (other.name, other.values)
+        else:
+            return False
+
+
+class _MessageMatches(Predicate):
+    def __init__(self, pattern):
+        self.pattern = pattern
+
+    def test(self, arg):
+        return self.pattern.search(str(arg)) is not None
+
+    def _function(self):
+        search = self.pattern.search
+        return lambda arg: search(str(arg)) is not None
+
+    def __eq__(self, other):
+        if isinstance(other, _MessageMatches):
+            return self.pattern == other.pattern
+        else:
+            return False
+
+
+class _HasCode(Predicate):
+    def __init__(self, extract, codes):
+        self.extract = extract
+        self.codes = codes
+
+    def test(self, arg):
+        code = self.extract(arg)
+        try:
+            return code in self.codes
+        except TypeError:  # unhashable, e.g. a status defining `__eq__` without `__hash__`, so not a code
+            return False
+
+    def _function(self):
+        extract, codes = self.extract, self.codes
+
+        def has_code(arg):
+            code = extract(arg)
+            try:
+                return code in codes
+            except TypeError:
+                return False
+
+        return has_code
+
+    def __eq__(self, other):
+        if isinstance(other, _HasCode):
+            return (self.extract, self.codes) == (other.extract, other.codes)
+        else:
+            return False
+
+
+def _status_of(arg):
+    """Returns the `status_code` or `status` of the argument, or of its `response`, e.g. of an HTTPError."""
+    status = getattr(arg, 'status_code', None)
+    if status is None:
+        status = getattr(arg, 'status', None)
+        if status is None:
+            response = getattr(arg, 'response', None)
+            if response is not None:
+                status = getattr(response, 'status_code', None)
+                if status is None:
+                    status = getattr(response, 'status', None)
+    return status
+
+
+def _errno_of(arg):
+    """Returns the `errno` of the argument, or of the error it was raised from, e.g. wrapping an OSError."""
+    code = getattr(arg, 'errno', None)
+    if code is None:
+        code = getattr(getattr(arg, '__cause__', None), 'errno', None)
+    return code
+
+
+def _codes_of(codes):
+    result = set()
+    for code in codes:
+        if isinstance(code, int):
+            result.add(code)
+        else:
+            result.update(code)  # e.g. a range
+
+    return frozenset(result)
+
+
+class _Not(Predicate):
+    def __init__(self, predicate):
+        self.predicate = predicate
+        self._type_only = predicate._type_only
+
+    def test(self, arg):
+        return not self.predicate.test(arg)
+
+    def _function(self):
+        function = self.predicate._function()
+        return lambda arg: not function(arg)
+
+    def __invert__(self):
+        return self.predicate
+
+    def __eq__(self, other):
+        if isinstance(other, _Not):
+            return self.predicate == other.predicate
+        else:
+            return False
+
+
+class _Combination(Predicate):
+    """A combination of predicates, flattened: the nested combinations of the same kind are merged into this one."""
+
+    def __init__(self, predicates):
+        flattened = []
+        for predicate in predicates:
+            if type(predicate) is type(self):
+                flattened.extend(predicate.predicates)
+            else:
+                flattened.append(predicate)
+
+        self.predicates = flattened
+        self._type_only = all(p._type_only for p in flattened)
+
+    def _function(self):
+        if self._type_only:
+            return self._combine([p._function() for p in self.predicates])
+
+        # the part deciding on the type only is cached and tested first, being the cheapest
+        typed = [p for p in self.predicates if p._type_only]
+        functions = [p._function() for p in self.predicates if not p._type_only]
+        if typed:
+            functions.insert(0, type(self)(typed).compile())
+        return self._combine(functions)
+
+    @staticmethod
+    @abstractmethod
+    def _combine(functions): pass
+
+    def __eq__(self, other):
+        if type(other) is type(self):
+            return self.predicates == other.predicates
+        else:
+            return False
+
+
+class _All(_Combination):
+    def test(self, arg):
+        return all(p.test(arg) for p in self.predicates)
+
+    @staticmethod
+    def _combine(functions):
+        if len(functions) == 1:
+            return functions[0]
+        if len(functions) == 2:
+            first, second = functions
+            return lambda arg: True if first(arg) and second(arg) else False
+
+        def test(arg):
+            for function in functions:
+                if not function(arg):
+                    return False
+            return True
+
+        return test
+
+
+class _Any(_Combination):
+    def __init__(self, predicates):
+        super().__init__(predicates)
+        # the type checks are merged into a single one
+        types = [t for p in self.predicates if isinstance(p, _IsInstanceOf) for t in p._types]
+        if len(types) > 1:
+            others = [p for p in self.predicates if not isinstance(p, _IsInstanceOf)]
+            self.predicates = [_IsInstanceOf(tuple(types))] + others
+
+    def test(self, arg):
+        return any(p.test(arg) for p in self.predicates)
+
+    @staticmethod
+    def _combine(functions):
+        if len(functions) == 1:
+            return functions[0]
+        if len(functions) == 2:
+            first, second = functions
+            return lambda arg: True if first(arg) or second(arg) else False
+
+        def test(arg):
+            for function in functions:
+                if function(arg):
+                    return True
+            return False
+
+        return test
+
+
+def _cached_by_type(function):
+    """Remembers the outcomes of a function deciding on the type of its argument only, per type."""
+    cache = {}
+
+    def test(arg):
+        arg_type = type(arg)
+        try:
+            return cache[arg_type]
+        except KeyError:
+            if len(cache) >= TYPE_CACHE_SIZE:
+                cache.clear()
+            outcome = cache[arg_type] = True if function(arg) else False
+            return outcome
+
+    return test
+
+
+def _predicate_of(hint):
+    """Returns the predicate of an operand of `&` or `|`, or None if it cannot be one."""
+    if isinstance(hint, Predicate):
+        return hint
+    elif is_exception_type(hint) or is_tuple_of_exception_types(hint):
+        return _IsInstanceOf(hint)
+    elif is_list_or_set_of_exception_types(hint):
+        return _IsInstanceOf(tuple(hint))
+    elif callable(hint):
+        return _CustomPredicate(hint)
+    else:
+        return None
+
+
+def is_instance_of(*types):
+    """Tests whether the argument is an instance of one of the types."""
+    return _IsInstanceOf(types[0] if len(types) == 1 else tuple(types))
+
+
+def has_attribute(name, *values):
+    """Tests whether the argument has the attribute, with one of the values if any is given, e.g. an `errno`."""
+    return _HasAttribute(name, values)
+
+
+def has_code(extract, *codes):
+    """
+    Tests whether the code returned by `extract` of the argument, e.g. an integer attribute, is one of the codes,
+    given as integers or ranges and looked up in a frozenset.
+    """
+    return _HasCode(extract, _codes_of(codes))
+
+
+def has_status(*codes):
+    """
+    Tests whether a result or an error has one of the status codes (the RETRYABLE_STATUS_CODES if none), found as
+    its `status_code` or `status`, or those of its `response`, e.g. `has_status(429, range(502, 505))`.
+    """
+    return _HasCode(_status_of, _codes_of(codes) if codes else RETRYABLE_STATUS_CODES)
+
+
+def has_errno(*codes):
+    """
+    Tests whether an error has one of the errno codes (the RETRYABLE_ERRNOS if none), found as its `errno` or that
+    of the error it was raised from, e.g. `has_errno(errno.ECONNREFUSED, errno.ETIMEDOUT)`.
+    """
+    return _HasCode(_errno_of, _codes_of(codes) if codes else RETRYABLE_ERRNOS)
+
+
+def message_matches(pattern, flags=0):
+    """Tests whether the regular expression is found in the message of the argument, i.e. in `str(arg)`."""
+    return _MessageMatches(re.compile(pattern, flags))
+
 
 __IS_ANY_ERROR = _IsInstanceOf(BaseException)
 __NEVER = _Never()
@@ -94,7 +475,9 @@ def create_error_predicate(hint):
 
 
 def create_result_predicate(hint):
-    if hint is UNDEFINED:
+    if isinstance(hint, Predicate):
+        result = hint
+    elif hint is UNDEFINED:
         result = __NEVER
     elif callable(hint):
         result = _CustomPredicate(hint)
@@ -102,3 +485,16 @@ def create_result_predicate(hint):
         result = _EqualTo(hint)
 
     return result
+
+
+__all__ = [
+    'Predicate',
+    'is_instance_of',
+    'has_attribute',
+    'has_code',
+    'has_status',
+    'has_errno',
+    'message_matches',
+    'RETRYABLE_STATUS_CODES',
+    'RETRYABLE_ERRNOS'
+]
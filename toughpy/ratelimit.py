@@ -0,0 +1,168 @@
+import asyncio
+import collections
+import threading
+import time
+from toughpy.duration import seconds_of
+from toughpy.utils import decorate_with
+
+DEFAULT_PERIOD = 1  # second
+DEFAULT_MAX_KEYS = 10000
+_EPSILON = 1e-9  # absorbs the rounding errors of the float timestamps
+
+
+class _Gcra:
+    """
+    The Generic Cell Rate Algorithm. Its whole state is the theoretical arrival time (TAT) of the next permit:
+    a request for `n` permits at `now` is conforming when max(tat, now) + n * T - burst * T <= now, where T is
+    the emission interval (period / limit).
+    """
+
+    def __init__(self, limit, period, burst):
+        period = seconds_of(period)
+        if limit <= 0 or period <= 0:
+            raise ValueError('`limit` and `period` should be greater than 0.')
+        if burst is not None and burst < 1:
+            raise ValueError('`burst` should be at least 1.')
+
+        self.burst = 1 if burst is None else burst
+        self.emission_interval = float(period) / limit
+        self.burst_tolerance = self.emission_interval * self.burst
+
+    def reserve(self, tat, now, permits):
+        """Returns the new TAT and the seconds to wait until the permits are conforming."""
+        if permits > self.burst:
+            raise ValueError('Cannot acquire %s permits at once with a burst of %s.' % (permits, self.burst))
+
+        new_tat = max(tat, now) + self.emission_interval * permits
+        wait = new_tat - self.burst_tolerance - now
+        return new_tat, wait if wait > _EPSILON else 0.0
+
+
+class RateLimiter:
+    """
+    Limits the calls to `limit` permits per `period` (a Duration or seconds), allowing bursts of up to `burst`
+    permits after idle periods. The limiter keeps a single timestamp and every decision takes O(1).
+
+    As a decorator, calls wait until a permit is available but no longer than `max_wait_duration` (a Duration
+    or seconds, None to wait as long as it takes, 0 to never wait) and raise RateLimitExceededError otherwise.
+    Asyncio callers wait in `asyncio.sleep`.
+    """
+
+    def __init__(self, limit, period=DEFAULT_PERIOD, burst=None, max_wait_duration=None, name=None,
+                 clock=time.monotonic):
+        self.name = name
+        self._gcra = _Gcra(limit, period, burst)
+        self._max_wait_duration = seconds_of(max_wait_duration)
+        self._clock = clock
+        self._tat = float('-inf')
+        self._lock = threading.Lock()
+
+    def __call__(self, fn):
+        return decorate_with(fn, self.execute, self.execute_async)
+
+    def execute(self, fn, *args, **kwargs):
+        self.acquire(timeout=self._max_wait_duration)
+        return fn(*args, **kwargs)
+
+    async def execute_async(self, fn, *args, **kwargs):
+        await self.acquire_async(timeout=self._max_wait_duration)
+        return await fn(*args, **kwargs)
+
+    def _reserve(self, permits, timeout):
+        """Reserves the permits and returns the seconds to wait for them, or raises if it would exceed `timeout`."""
+        with self._lock:
+            new_tat, wait = self._gcra.reserve(self._tat, self._clock(), permits)
+            if wait <= 0 or timeout is None or wait <= timeout:
+                self._tat = new_tat
+                return wait
+
+        raise RateLimitExceededError(self.name, wait)
+
+    def try_acquire(self, permits=1):
+        """Takes the permits if they are available right now and returns whether it did."""
+        try:
+            self._reserve(permits, 0)
+            return True
+        except RateLimitExceededError:
+            return False
+
+    def acquire(self, permits=1, timeout=None):
+        """Blocks until the permits are available, raises RateLimitExceededError if it takes more than `timeout`."""
+        wait = self._reserve(permits, seconds_of(timeout))
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self, permits=1, timeout=None):
+        wait = self._reserve(permits, seconds_of(timeout))
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class KeyedRateLimiter:
+    """
+    A RateLimiter per key (e.g. per tenant or per host) sharing the same limits. Only the timestamps of the
+    `max_keys` most recently used keys are kept; evicting the least recently used one rarely loses anything since
+    its TAT is most likely in the past already, which is the same as a fresh key.
+    """
+
+    def __init__(self, limit, period=DEFAULT_PERIOD, burst=None, max_keys=DEFAULT_MAX_KEYS, clock=time.monotonic):
+        if max_keys <= 0:
+            raise ValueError('`max_keys` should be greater than 0.')
+
+        self._gcra = _Gcra(limit, period, burst)
+        self._max_keys = max_keys
+        self._clock = clock
+        self._tats = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._tats)
+
+    def _reserve(self, key, permits, timeout):
+        with self._lock:
+            tats = self._tats
+            tat = tats.get(key, float('-inf'))
+            new_tat, wait = self._gcra.reserve(tat, self._clock(), permits)
+            if wait <= 0 or timeout is None or wait <= timeout:
+                tats[key] = new_tat
+                tats.move_to_end(key)
+                if len(tats) > self._max_keys:
+                    tats.popitem(last=False)
+                return wait
+
+        raise RateLimitExceededError(key, wait)
+
+    def try_acquire(self, key, permits=1):
+        try:
+            self._reserve(key, permits, 0)
+            return True
+        except RateLimitExceededError:
+            return False
+
+    def acquire(self, key, permits=1, timeout=None):
+        wait = self._reserve(key, permits, seconds_of(timeout))
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self, key, permits=1, timeout=None):
+        wait = self._reserve(key, permits, seconds_of(timeout))
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class RateLimitExceededError(Exception):
+    def __init__(self, name, retry_after):
+        super().__init__(name, retry_after)
+        self.name = name
+        self.retry_after = retry_after
+
+    def __str__(self):
+        return 'Rate limit of `{0}` exceeded, the next permit is available in {1:.3f}s'.format(
+            self.name or '<unnamed>', self.retry_after)
+
+
+__all__ = [
+    'RateLimiter',
+    'KeyedRateLimiter',
+    'RateLimitExceededError'
+]
@@ -1,14 +1,76 @@
+import asyncio
+import collections.abc
+import inspect
 import six
+import sys
 import time
+import types
+import weakref
 import toughpy.metrics as metrics
-from toughpy.utils import UNDEFINED, get_command_name
+from toughpy.utils import UNDEFINED, get_command_name, monotonic_ns
 from toughpy import predicates, backoffs
-from toughpy.attempt import Attempt
+from toughpy.attempt import Success, Failure, _try, TRACEBACK_FULL, TRACEBACK_POLICIES
+from toughpy.circuitbreaker import CallNotPermittedError
+from toughpy.deadline import get_deadline, deadline_scope
+from toughpy.duration import seconds_of
+from toughpy.timeout import call_with_timeout, call_with_timeout_async
 
 _msg_invalid_max_attempts = '`%s` is not a valid value for `max_attempts`. It should be an integer greater than 0.'
+_msg_coroutine_function = '`%s` is a coroutine function, it should be retried with `execute_async`.'
+_msg_not_awaitable = '`%s` did not return an awaitable, it should be retried with `execute` instead.'
+_msg_invalid_capture_traceback = '`%s` is not a valid value for `capture_traceback`. It should be one of %s.'
 
 DEFAULT_MAX_ATTEMPTS = 3
 
+_MAX_CACHED_COMMANDS = 256
+
+
+class _Command:
+    """
+    The command name of a function and its RetryMetrics, resolved once. The metrics are looked up again only when
+    the registry is cleared, enabled or disabled.
+    """
+    __slots__ = ('name', 'is_coroutine', '_metrics', '_generation')
+
+    def __init__(self, fn):
+        self.name = get_command_name(fn)
+        self.is_coroutine = inspect.iscoroutinefunction(fn)
+        self._metrics = None
+        self._generation = -1
+
+    def metrics(self):
+        registry = metrics.retry_metrics
+        generation = registry.generation
+        if self._generation != generation:
+            self._metrics = registry[self.name]
+            self._generation = generation
+
+        return self._metrics
+
+
+# the commands of the functions passed to `Retry.execute` by their ids, along with weak references telling a function
+# from a later one at the same address: the cache keeps neither the functions nor the instances of the methods alive
+_commands = {}
+
+
+def _command_of(fn):
+    # a bound method is created at every access and named after its function: it is cached as the function
+    target = fn.__func__ if isinstance(fn, types.MethodType) else fn
+    cached = _commands.get(id(target))
+    if cached is not None and cached[0]() is target:
+        return cached[1]
+
+    command = _Command(fn)
+    try:
+        ref = weakref.ref(target)
+    except TypeError:  # e.g. a builtin function
+        return command
+
+    if len(_commands) >= _MAX_CACHED_COMMANDS:
+        _commands.clear()
+    _commands[id(target)] = (ref, command)
+    return command
+
 
 class Retry:
 
@@ -19,14 +81,29 @@ class Retry:
                  backoff=None,
                  max_delay=None,
                  wrap_error=False,
-                 raise_if_bad_result=False):
+                 raise_if_bad_result=False,
+                 retry_budget=None,
+                 max_duration=None,
+                 attempt_timeout=None,
+                 capture_traceback=TRACEBACK_FULL,
+                 sleep=time.sleep):
         self._max_attempts = Retry._get_max_attempts(max_attempts)
-        self._error_predicate = predicates.create_error_predicate(on_error)
-        self._result_predicate = predicates.create_result_predicate(on_result)
+        self._error_predicate = predicates.create_error_predicate(on_error).compile()
+        self._result_predicate = predicates.create_result_predicate(on_result).compile()
         self._backoff = backoffs.create_backoff(backoff)
+        # the delays of a deterministic backoff are computed once and looked up by the attempt number, unless they
+        # come from a `get_delay` overridden in a subclass
+        self._delays = self._backoff.schedule(self._max_attempts) \
+            if self._backoff.deterministic and type(self._backoff).get_delay is backoffs.Backoff.get_delay else None
+        self._on_outcome = self._backoff.on_outcome
         self._max_delay = max_delay
         self._wrap_error = wrap_error
         self._raise_if_bad_result = raise_if_bad_result
+        self._retry_budget = retry_budget
+        self._max_duration = seconds_of(max_duration)
+        self._attempt_timeout = seconds_of(attempt_timeout)
+        self._capture_traceback = Retry._get_capture_traceback(capture_traceback)
+        self._sleep = sleep  # spends the synchronous backoff delays, asyncio executions use asyncio.sleep
         self._after_attempt_handler = None
 
     @staticmethod
@@ -40,10 +117,33 @@ class Retry:
 
         return result
 
+    @staticmethod
+    def _get_capture_traceback(given):
+        if given not in TRACEBACK_POLICIES:
+            raise ValueError(_msg_invalid_capture_traceback % (given, ', '.join(TRACEBACK_POLICIES)))
+
+        return given
+
     def __call__(self, fn):
+        """
+        Decorates `fn`. Its command name and metrics are resolved here, once, rather than on every call as with
+        `execute`.
+        """
+        command = _Command(fn)
+        run = self._run
+
+        if inspect.iscoroutinefunction(fn):
+            run_async = self._run_async
+
+            @six.wraps(fn)
+            async def async_decorator(*args, **kwargs):
+                return await run_async(fn, args, kwargs, command.metrics())
+
+            return async_decorator
+
         @six.wraps(fn)
         def decorator(*args, **kwargs):
-            return self.execute(fn, *args, **kwargs)
+            return run(fn, args, kwargs, command.metrics())
 
         return decorator
 
@@ -51,24 +151,317 @@ class Retry:
         self._after_attempt_handler = handler
         return self
 
-    # noinspection PyProtectedMember
     def execute(self, fn, *args, **kwargs):
-        command_name = get_command_name(fn)
-        retry_metrics = metrics.retry_metrics[command_name]
-        attempt = Attempt.try_first(fn, *args, **kwargs)
+        command = _command_of(fn)
+        if command.is_coroutine:
+            raise TypeError(_msg_coroutine_function % command.name)
+
+        if self._max_duration is None:  # saves a frame on the most common path
+            return self._execute(fn, args, kwargs, get_deadline(), command.metrics())
+
+        return self._run(fn, args, kwargs, command.metrics())
+
+    def _run(self, fn, args, kwargs, retry_metrics):
+        if self._max_duration is None:
+            return self._execute(fn, args, kwargs, get_deadline(), retry_metrics)
+
+        with deadline_scope(self._max_duration) as deadline:
+            return self._execute(fn, args, kwargs, deadline, retry_metrics)
+
+    # noinspection PyProtectedMember
+    def _execute(self, fn, args, kwargs, deadline, retry_metrics):
+        if self._retry_budget is not None:
+            self._retry_budget.deposit(retry_metrics.name)
+        target = fn if self._attempt_timeout is None else self._with_timeout(fn, deadline, retry_metrics)
+        started = monotonic_ns()
+        try:
+            result = target(*args, **kwargs)
+            attempt = None
+        except BaseException:
+            attempt = Failure(sys.exc_info(), 1)
+        attempt_ended = monotonic_ns()
+        if attempt is None:
+            if self._is_final_result(result):
+                retry_metrics._record_first_try_success(attempt_ended - started, attempt_ended)
+                return result
+            attempt = Success(result, 1)
+        retry_metrics._record_attempt(attempt_ended - started, attempt_ended)
         self._emit_after_attempt(attempt)
 
+        delay = None
         while self._should_retry(attempt):
-            retry_metrics.total_retry_attempts += 1
-            self._exec_backoff(attempt)
-            attempt = attempt.try_next(fn, *args, **kwargs)
+            delay = self._next_delay(attempt, delay, deadline, retry_metrics)
+            if delay is None or not self._retry_permitted(retry_metrics):
+                break
+
+            self._release_retried(attempt)
+            retry_metrics._increment_retry_attempts()
+            backoff_started = monotonic_ns()
+            if delay > 0:
+                self._sleep(delay)
+            attempt_started = monotonic_ns()
+            retry_metrics._record_backoff(attempt_started - backoff_started, attempt_started)
+            attempt = attempt.try_next(target, *args, **kwargs)
+            attempt_ended = monotonic_ns()
+            retry_metrics._record_attempt(attempt_ended - attempt_started, attempt_ended)
             self._emit_after_attempt(attempt)
 
-        retry_metrics.total_calls += 1
+        return self._complete(fn, attempt, retry_metrics, started)
+
+    async def execute_async(self, fn, *args, **kwargs):
+        """
+        The asyncio counterpart of `execute`. Attempts are awaited in the calling task and backoff
+        delays are spent in `asyncio.sleep`, so the event loop is never blocked.
+        """
+        return await self._run_async(fn, args, kwargs, _command_of(fn).metrics())
+
+    async def _run_async(self, fn, args, kwargs, retry_metrics):
+        if self._max_duration is None:
+            return await self._execute_async(fn, args, kwargs, get_deadline(), retry_metrics)
+
+        with deadline_scope(self._max_duration) as deadline:
+            return await self._execute_async(fn, args, kwargs, deadline, retry_metrics)
+
+    # noinspection PyProtectedMember
+    async def _execute_async(self, fn, args, kwargs, deadline, retry_metrics):
+        if self._retry_budget is not None:
+            self._retry_budget.deposit(retry_metrics.name)
+        target = fn if self._attempt_timeout is None else self._with_timeout_async(fn, deadline, retry_metrics)
+        started = monotonic_ns()
+        try:
+            first = fn(*args, **kwargs)
+        except BaseException:
+            attempt = Failure(sys.exc_info(), 1)
+        else:
+            # a sync function would fail every attempt, calling it as many times
+            if not inspect.isawaitable(first):
+                raise TypeError(_msg_not_awaitable % retry_metrics.name)
+            awaitable = first if self._attempt_timeout is None else \
+                call_with_timeout_async(lambda: first, (), {}, self._timeout_of(deadline), retry_metrics)
+            try:
+                result = await awaitable
+                attempt = None
+            except asyncio.CancelledError:
+                raise
+            except BaseException:
+                attempt = Failure(sys.exc_info(), 1)
+        attempt_ended = monotonic_ns()
+        if attempt is None:
+            if self._is_final_result(result):
+                retry_metrics._record_first_try_success(attempt_ended - started, attempt_ended)
+                return result
+            attempt = Success(result, 1)
+        retry_metrics._record_attempt(attempt_ended - started, attempt_ended)
+        self._emit_after_attempt(attempt)
+
+        delay = None
+        while self._should_retry(attempt):
+            delay = self._next_delay(attempt, delay, deadline, retry_metrics)
+            if delay is None or not self._retry_permitted(retry_metrics):
+                break
+
+            self._release_retried(attempt)
+            retry_metrics._increment_retry_attempts()
+            backoff_started = monotonic_ns()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            attempt_started = monotonic_ns()
+            retry_metrics._record_backoff(attempt_started - backoff_started, attempt_started)
+            attempt = await attempt.try_next_async(target, *args, **kwargs)
+            attempt_ended = monotonic_ns()
+            retry_metrics._record_attempt(attempt_ended - attempt_started, attempt_ended)
+            self._emit_after_attempt(attempt)
+
+        return self._complete(fn, attempt, retry_metrics, started)
+
+    def execute_batch(self, fn, items, key=None):
+        """
+        Calls `fn` with a sequence of items and, on the next attempts, with the items which failed only. `fn`
+        returns an outcome per item, either as a sequence in the order of the items it is given or as a mapping
+        from `key(item)` (the position of the item in the given sequence if there is no `key`) to the outcome. Every
+        item has its own attempts, which are tested against the predicates as with `execute`, whereas the backoff,
+        the budget and the metrics count the calls of `fn`. An outcome which is an exception is a failure, and if
+        `fn` raises, the whole batch has failed with that error. An empty batch returns [] without calling `fn`.
+
+        Returns the results in the order of `items`, or raises BatchRetryError if some of them failed after the
+        last attempt. The items to retry are passed as a view over `items`, without copying them.
+        """
+        if not isinstance(items, collections.abc.Sequence):
+            items = list(items)
+        if not items:
+            return []
+
+        retry_metrics = _command_of(fn).metrics()
+        if self._max_duration is None:
+            return self._execute_batch(fn, items, key, get_deadline(), retry_metrics)
+
+        with deadline_scope(self._max_duration) as deadline:
+            return self._execute_batch(fn, items, key, deadline, retry_metrics)
+
+    # noinspection PyProtectedMember
+    def _execute_batch(self, fn, items, key, deadline, retry_metrics):
+        if self._retry_budget is not None:
+            self._retry_budget.deposit(retry_metrics.name)
+        target = fn if self._attempt_timeout is None else self._with_timeout(fn, deadline, retry_metrics)
+        attempts = [None] * len(items)
+        pending = range(len(items))
+        batch = items
+        attempt_number = 1
+        delay = None
+        started = monotonic_ns()
+
+        while True:
+            attempt_started = monotonic_ns()
+            outcome = _try(attempt_number, target, (batch,), {})
+            attempt_ended = monotonic_ns()
+            retry_metrics._record_attempt(attempt_ended - attempt_started, attempt_ended)
+
+            to_retry = []
+            for position, idx in enumerate(pending):
+                attempt = _item_attempt(outcome, position, items[idx], key)
+                attempts[idx] = attempt
+                self._emit_to_handler(attempt)
+                if self._should_retry(attempt):
+                    to_retry.append(idx)
+            if self._on_outcome is not None:  # the backoff counts the calls of `fn`, which fail if any item does
+                self._on_outcome(any(self._failed(attempts[idx]) for idx in pending))
+
+            if not to_retry:
+                break
+
+            delay = self._next_delay(attempts[to_retry[0]], delay, deadline, retry_metrics)
+            if delay is None or not self._retry_permitted(retry_metrics):
+                break
+
+            for idx in to_retry:
+                self._release_retried(attempts[idx])
+            retry_metrics._increment_retry_attempts()
+            backoff_started = monotonic_ns()
+            if delay > 0:
+                self._sleep(delay)
+            backoff_ended = monotonic_ns()
+            retry_metrics._record_backoff(backoff_ended - backoff_started, backoff_ended)
+            pending = to_retry
+            batch = _ItemsView(items, to_retry)
+            attempt_number += 1
+
+        return self._complete_batch(fn, attempts, outcome, retry_metrics, started)
+
+    # noinspection PyProtectedMember
+    def _complete_batch(self, fn, attempts, last_outcome, retry_metrics, started):
+        ended = monotonic_ns()
+        retry_metrics._record_call(last_outcome, ended - started, ended)
+
+        results = []
+        failed = []
+        for attempt in attempts:
+            if attempt.is_failure() or (self._raise_if_bad_result and self._result_predicate(attempt.get())):
+                failed.append(attempt)
+            else:
+                results.append(attempt.get())
+
+        if failed:
+            retry_metrics._increment_failed_calls(last_outcome)
+            for attempt in failed:
+                if attempt.is_failure():
+                    attempt.compact_traceback(self._capture_traceback)
+            raise BatchRetryError(fn, attempts, failed)
+
+        retry_metrics._increment_successful_calls(last_outcome)
+        return results
+
+    # noinspection PyProtectedMember
+    def stream(self, factory, resume_from=None):
+        """
+        Yields the items of the iterable returned by `factory(position)` and, when it raises, re-opens it where it
+        left off instead of starting over. The position is the number of items yielded so far or, given
+        `resume_from`, a cursor computed from the last item yielded, e.g. `lambda row: row.id` (None at the start).
+
+        Every item counts as a call of its own with its own attempts, so `max_attempts` limits the failures in a
+        row and the metrics of the factory count the items. An item matching `on_result` is retried the same way.
+        `max_duration` limits the time to get an item; `attempt_timeout` does not apply. Nothing is buffered.
+        """
+        retry_metrics = _command_of(factory).metrics()
+        position = 0 if resume_from is None else None
+        iterator = None
+        try:
+            while True:
+                if self._retry_budget is not None:
+                    self._retry_budget.deposit(retry_metrics.name)
+                started = monotonic_ns()
+                deadline = get_deadline()
+                if self._max_duration is not None:
+                    own_deadline = started + int(self._max_duration * 1000000000)
+                    deadline = own_deadline if deadline is None else min(deadline, own_deadline)
+                attempt_number = 1
+                delay = None
+
+                while True:
+                    attempt_started = monotonic_ns()
+                    try:
+                        if iterator is None:
+                            iterator = iter(factory(position))
+                        attempt = Success(next(iterator), attempt_number)
+                    except StopIteration:
+                        return
+                    except BaseException:
+                        attempt = Failure(sys.exc_info(), attempt_number)
+                    attempt_ended = monotonic_ns()
+                    retry_metrics._record_attempt(attempt_ended - attempt_started, attempt_ended)
+                    self._emit_after_attempt(attempt)
+
+                    if not self._should_retry(attempt):
+                        break
+
+                    delay = self._next_delay(attempt, delay, deadline, retry_metrics)
+                    if delay is None or not self._retry_permitted(retry_metrics):
+                        break
+
+                    _close(iterator)  # re-opened at the last position
+                    iterator = None
+                    self._release_retried(attempt)
+                    retry_metrics._increment_retry_attempts()
+                    backoff_started = monotonic_ns()
+                    if delay > 0:
+                        self._sleep(delay)
+                    backoff_ended = monotonic_ns()
+                    retry_metrics._record_backoff(backoff_ended - backoff_started, backoff_ended)
+                    attempt_number += 1
+
+                item = self._complete(factory, attempt, retry_metrics, started)
+                position = position + 1 if resume_from is None else resume_from(item)
+                yield item
+        finally:
+            _close(iterator)
+
+    def _timeout_of(self, deadline):
+        """The attempt timeout, shortened to the time left if the call has a deadline."""
+        timeout = self._attempt_timeout
+        if deadline is not None:
+            timeout = min(timeout, max(0.0, (deadline - monotonic_ns()) / 1000000000.0))
+
+        return timeout
+
+    def _with_timeout(self, fn, deadline, retry_metrics):
+        def call(*args, **kwargs):
+            return call_with_timeout(fn, args, kwargs, self._timeout_of(deadline), retry_metrics)
+
+        return call
+
+    def _with_timeout_async(self, fn, deadline, retry_metrics):
+        async def call(*args, **kwargs):
+            return await call_with_timeout_async(fn, args, kwargs, self._timeout_of(deadline), retry_metrics)
+
+        return call
+
+    # noinspection PyProtectedMember
+    def _complete(self, fn, attempt, retry_metrics, started):
+        ended = monotonic_ns()
+        retry_metrics._record_call(attempt, ended - started, ended)
 
         if attempt.is_success():  # success
             result = attempt.get()
-            should_raise_error = self._raise_if_bad_result and self._result_predicate.test(result)
+            should_raise_error = self._raise_if_bad_result and self._result_predicate(result)
 
             if should_raise_error:
                 retry_metrics._increment_failed_calls(attempt)
@@ -83,13 +476,23 @@ class Retry:
             retry_metrics._increment_failed_calls(attempt)
 
             if self._wrap_error:
+                attempt.compact_traceback(self._capture_traceback)
                 raise RetryError(fn, attempt)
             else:
                 attempt.get()  # raises the underlying error
 
+    def _is_final_result(self, result):
+        """
+        Whether a first-try result can be returned right away, without even allocating an Attempt: it is neither
+        retried nor raised, and neither a handler nor the backoff is waiting for the attempt.
+        """
+        return self._after_attempt_handler is None and self._on_outcome is None and not self._result_predicate(result)
+
     def _should_retry(self, attempt):
         if attempt.is_failure():
-            should_retry = self._error_predicate(attempt.get_error())
+            error = attempt.get_error()
+            # an open circuit rejects every attempt without calling the dependency, retrying would be pointless
+            should_retry = not isinstance(error, CallNotPermittedError) and self._error_predicate(error)
         else:
             should_retry = self._result_predicate(attempt.get())
 
@@ -98,32 +501,136 @@ class Retry:
         else:
             return False
 
-    def _exec_backoff(self, attempt):
-        delay = self._backoff.get_delay(attempt)
-        max_delay = self._max_delay
+    # noinspection PyProtectedMember
+    def _retry_permitted(self, retry_metrics):
+        budget = self._retry_budget
+        if budget is None or budget.try_withdraw(retry_metrics.name):
+            return True
+
+        retry_metrics._increment_retries_denied_by_budget()
+        return False
+
+    @property
+    def worst_case_wait(self):
+        """The longest time, in seconds, a call can spend in the backoff delays, unless `max_duration` is shorter."""
+        wait = self._backoff.worst_case_wait(self._max_attempts)
+        if self._max_delay:
+            wait = min(wait, (self._max_attempts - 1) * self._max_delay)
+
+        return wait
+
+    def _get_delay(self, attempt, previous_delay):
+        delays = self._delays
+        if delays is None:
+            delay = self._backoff.next_delay(attempt, previous_delay)
+        else:
+            idx = attempt.attempt_number - 1
+            delay = delays[idx] if idx < len(delays) else None
 
-        if max_delay and delay > max_delay:
+        max_delay = self._max_delay
+        if max_delay and delay is not None and delay > max_delay:
             delay = max_delay
 
-        if delay > 0:
-            time.sleep(delay)
+        return delay
+
+    # noinspection PyProtectedMember
+    def _next_delay(self, attempt, previous_delay, deadline, retry_metrics):
+        """
+        Returns the delay before the next attempt, or None if the total budget of the backoff is spent or if the next
+        attempt could not even start before the deadline, in which case retrying is given up right away instead of
+        sleeping in vain.
+        """
+        delay = self._get_delay(attempt, previous_delay)
+        if delay is None:  # the total budget of the backoff is spent
+            return None
+        if deadline is not None and delay * 1000000000 >= deadline - monotonic_ns():
+            retry_metrics._increment_retries_aborted_by_deadline()
+            return None
+
+        return delay
 
     def _emit_after_attempt(self, attempt):
+        if self._on_outcome is not None:
+            self._on_outcome(self._failed(attempt))
+        self._emit_to_handler(attempt)
+
+    def _emit_to_handler(self, attempt):
         if callable(self._after_attempt_handler):
             self._after_attempt_handler(attempt)
 
+    def _failed(self, attempt):
+        return attempt.is_failure() or self._result_predicate(attempt.get())
+
+    def _release_retried(self, attempt):
+        """
+        Applies the capture policy to a failure which is about to be retried, which only the handler may still hold.
+        The failure the caller gets is left alone unless it is wrapped into a RetryError, see `_complete`.
+        """
+        # the failures which are only retried and dropped never pay for the capture policy
+        if self._after_attempt_handler is not None and attempt.is_failure():
+            attempt.compact_traceback(self._capture_traceback)
+
+
+class _ItemsView(collections.abc.Sequence):
+    """The items at the given indices of a sequence."""
+    __slots__ = ('_items', '_indices')
+
+    def __init__(self, items, indices):
+        self._items = items
+        self._indices = indices
+
+    def __len__(self):
+        return len(self._indices)
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [self._items[idx] for idx in self._indices[position]]
+
+        return self._items[self._indices[position]]
+
+    def __iter__(self):
+        items = self._items
+        for idx in self._indices:
+            yield items[idx]
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+def _item_attempt(outcome, position, item, key):
+    """The attempt of an item from the outcome of the batch, which is either a Failure or a Success of outcomes."""
+    if outcome.is_failure():
+        return outcome  # the attempts share the error of the batch
+
+    outcomes = outcome.get()
+    try:
+        if isinstance(outcomes, collections.abc.Mapping):
+            item_outcome = outcomes[key(item) if key is not None else position]
+        else:
+            item_outcome = outcomes[position]
+    except (KeyError, IndexError):
+        raise ValueError('The batch function did not return an outcome for the item `%r`.' % (item,))
+
+    if isinstance(item_outcome, BaseException):
+        return Failure((type(item_outcome), item_outcome, item_outcome.__traceback__), outcome.attempt_number)
+
+    return Success(item_outcome, outcome.attempt_number)
+
+
+def _close(iterator):
+    close = getattr(iterator, 'close', None)
+    if close is not None:
+        close()
+
 
 def retry(func=None, on_error=None, on_result=UNDEFINED, max_attempts=None,
-          backoff=None, max_delay=None, wrap_error=False, raise_if_bad_result=False):
+          backoff=None, max_delay=None, wrap_error=False, raise_if_bad_result=False, retry_budget=None,
+          max_duration=None, attempt_timeout=None, capture_traceback=TRACEBACK_FULL, sleep=time.sleep):
     def decorate(fn):
-        policy = Retry(on_error, on_result, max_attempts,
-                       backoff, max_delay, wrap_error, raise_if_bad_result)
+        policy = Retry(on_error, on_result, max_attempts, backoff, max_delay, wrap_error,
+                       raise_if_bad_result, retry_budget, max_duration, attempt_timeout, capture_traceback, sleep)
 
-        @six.wraps(fn)
-        def decorator(*args, **kwargs):
-            return policy.execute(fn, *args, **kwargs)
-
-        return decorator
+        return policy(fn)
 
     if callable(func):
         return decorate(func)
@@ -131,6 +638,11 @@ def retry(func=None, on_error=None, on_result=UNDEFINED, max_attempts=None,
     return decorate
 
 
+def retry_stream(factory, resume_from=None, **kwargs):
+    """A shorthand for `Retry(**kwargs).stream(factory, resume_from)`."""
+    return Retry(**kwargs).stream(factory, resume_from)
+
+
 class RetryError(Exception):
 
     def __init__(self, func, last_attempt):
@@ -153,9 +665,27 @@ class RetryError(Exception):
             )
 
 
+class BatchRetryError(RetryError):
+    """
+    Raised by `Retry.execute_batch` when some of the items failed. `attempts` has the last attempt of every item,
+    in the order of the items, and `failed_attempts` those of the failed items.
+    """
+
+    def __init__(self, func, attempts, failed_attempts):
+        super().__init__(func, failed_attempts[0])
+        self.attempts = attempts
+        self.failed_attempts = failed_attempts
+
+    def __str__(self):
+        return '{0} of {1} items failed, the first one:\n{2}'.format(
+            len(self.failed_attempts), len(self.attempts), super().__str__())
+
+
 __all__ = [
     'retry',
+    'retry_stream',
     'Retry',
     'RetryError',
+    'BatchRetryError',
     'DEFAULT_MAX_ATTEMPTS'
 ]
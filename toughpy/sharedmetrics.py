@@ -0,0 +1,299 @@
+"""
+Counters of a MetricsRegistry shared by the processes of a host through a memory mapped file, see
+`MetricsRegistry.share`.
+
+The file has a fixed layout: a header, a table of command names, a table of the owners (pids) of the lanes, and
+the counters, a block per lane holding a slot per counter of every command. Every thread of every process writes
+into a lane of its own, hence the increments take no lock at all, while the reads sum the lanes of every process.
+The rare structural changes (registering a command, claiming or retiring a lane) take a file lock.
+
+Lane 0 holds the counts of retired lanes: of the threads and processes which terminated, so that the totals never
+go down. After a fork, the child claims lanes of its own and starts counting from zero, while its parent's counts
+stay in the parent's lanes. A thread finding all of the lanes taken counts in its process only, which the sums of
+that process include, but not the ones of the others.
+"""
+import hashlib
+import mmap
+import os
+import struct
+import threading
+import weakref
+from toughpy.metrics import ShardedCounters
+
+try:
+    import fcntl
+except ImportError:  # not on Windows
+    fcntl = None
+
+DEFAULT_MAX_COMMANDS = 256
+# the processes sharing a file, e.g. the usual 2 * CPUs + 1 workers of a pre-forking server, and their threads
+# recording at the same time: a lane each
+DEFAULT_MAX_PROCESSES = 2 * (os.cpu_count() or 1) + 1
+DEFAULT_MAX_THREADS_PER_PROCESS = 32
+DEFAULT_MAX_LANES = DEFAULT_MAX_PROCESSES * DEFAULT_MAX_THREADS_PER_PROCESS
+
+_MAGIC = b'toughpy\x01'
+_HEADER = struct.Struct('<8sIII')  # magic, counters per command, max commands, max lanes
+_HEADER_SIZE = 64
+_NAME_SIZE = 128  # a 2 byte length and the utf-8 bytes of the name
+_MAX_NAME_BYTES = _NAME_SIZE - 2
+_NAME_LENGTH = struct.Struct('<H')
+_PID = struct.Struct('<q')
+_RETIRED_LANE = 0
+_RETIRED_PID = -1
+
+_msg_no_fcntl = 'Shared metrics need fcntl, which is not available on this platform'
+_msg_layout_mismatch = '%s has a different layout: %d counters per command, %d commands and %d lanes'
+
+
+def _encoded_name(name):
+    encoded = name.encode('utf-8')
+    if len(encoded) > _MAX_NAME_BYTES:  # keeps long names apart with a digest of the whole
+        digest = hashlib.blake2b(encoded, digest_size=8).hexdigest().encode('ascii')
+        prefix = encoded[:_MAX_NAME_BYTES - len(digest) - 1].decode('utf-8', 'ignore').encode('utf-8')
+        encoded = prefix + b'#' + digest
+    return encoded
+
+
+def _is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class SharedCounterFile:
+    """
+    The memory mapped file of the counters shared by the processes, created with its layout by the first one to
+    open it. All of the processes must open it with the same layout.
+    """
+
+    def __init__(self, path, counter_count, max_commands=DEFAULT_MAX_COMMANDS, max_lanes=DEFAULT_MAX_LANES):
+        if fcntl is None:
+            raise RuntimeError(_msg_no_fcntl)
+
+        self.path = path
+        self.counter_count = counter_count
+        self.max_commands = max_commands
+        self.max_lanes = max_lanes
+        self._names_offset = _HEADER_SIZE
+        self._pids_offset = self._names_offset + max_commands * _NAME_SIZE
+        self._counters_offset = self._pids_offset + (max_lanes + 1) * _PID.size
+        self._lane_size = max_commands * counter_count  # in counters
+        size = self._counters_offset + (max_lanes + 1) * self._lane_size * 8
+
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        self._lock = threading.Lock()
+        with self._exclusive():
+            if os.fstat(self._fd).st_size == 0:
+                os.ftruncate(self._fd, size)
+                os.pwrite(self._fd, _HEADER.pack(_MAGIC, counter_count, max_commands, max_lanes), 0)
+                os.pwrite(self._fd, _PID.pack(_RETIRED_PID), self._pids_offset)
+            else:
+                magic, counts, commands, lanes = _HEADER.unpack(os.pread(self._fd, _HEADER.size, 0))
+                if (magic, counts, commands, lanes) != (_MAGIC, counter_count, max_commands, max_lanes):
+                    raise ValueError(_msg_layout_mismatch % (path, counts, commands, lanes))
+
+        self._mmap = mmap.mmap(self._fd, size)
+        self._counters = memoryview(self._mmap)[self._counters_offset:].cast('Q')
+        self._indexes = {}  # command name -> index, of the commands seen by this process
+        self._counters_of_commands = weakref.WeakSet()
+        self._reset_process_state()
+        _open_files.add(self)
+
+    def _reset_process_state(self):
+        self._owned_lanes = []  # (thread ref, lane) claimed by this process
+        for counters in self._counters_of_commands:
+            counters._local = threading.local()
+            counters._unshared = ShardedCounters(counters._size)  # the parent's are counted by the parent
+
+    def _after_fork_in_child(self):
+        # the lock file description is shared with the parent, whose locks would be taken as ours
+        os.close(self._fd)
+        self._fd = os.open(self.path, os.O_RDWR)
+        self._lock = threading.Lock()
+        self._reset_process_state()
+
+    def _exclusive(self):
+        return _FileLock(self, fcntl.LOCK_EX)
+
+    def _shared(self):
+        return _FileLock(self, fcntl.LOCK_SH)
+
+    def counters(self, name):
+        """Returns the counters of the command, registering it in the file if it is new."""
+        index = self._indexes.get(name)
+        if index is None:
+            with self._exclusive():
+                index = self._index_of(name)
+                if index is None:
+                    return None  # the file is full
+                self._indexes[name] = index
+
+        counters = SharedCounters(self, index)
+        self._counters_of_commands.add(counters)
+        return counters
+
+    def _index_of(self, name):
+        encoded = _encoded_name(name)
+        free = None
+        for index, existing in enumerate(self._read_names()):
+            if existing is None:
+                if free is None:
+                    free = index
+            elif existing == encoded:
+                return index
+
+        if free is not None:
+            offset = self._names_offset + free * _NAME_SIZE
+            self._mmap[offset:offset + _NAME_SIZE] = (_NAME_LENGTH.pack(len(encoded)) + encoded).ljust(_NAME_SIZE,
+                                                                                                       b'\0')
+        return free
+
+    def _read_names(self):
+        """Yields the encoded name of every command slot, None for the free ones."""
+        buf = self._mmap
+        for index in range(self.max_commands):
+            offset = self._names_offset + index * _NAME_SIZE
+            length = _NAME_LENGTH.unpack_from(buf, offset)[0]
+            yield buf[offset + 2:offset + 2 + length] if length else None
+
+    def names(self):
+        """Returns the names of all of the commands registered by any process."""
+        with self._shared():
+            return [encoded.decode('utf-8') for encoded in self._read_names() if encoded is not None]
+
+    def _lane_counters(self, lane, index):
+        start = lane * self._lane_size + index * self.counter_count
+        return self._counters[start:start + self.counter_count]
+
+    def _claim_lane(self):
+        """Returns a lane for the current thread, or None if they are all taken."""
+        pid = os.getpid()
+        with self._exclusive():
+            self._retire_dead_threads()
+            for lane in range(1, self.max_lanes + 1):
+                offset = self._pids_offset + lane * _PID.size
+                owner = _PID.unpack_from(self._mmap, offset)[0]
+                if owner != 0 and owner != pid and not _is_alive(owner):
+                    self._retire(lane)
+                    owner = 0
+                if owner == 0:
+                    _PID.pack_into(self._mmap, offset, pid)
+                    self._owned_lanes.append((weakref.ref(threading.current_thread()), lane))
+                    return lane
+
+        return None
+
+    def _retire_dead_threads(self):
+        alive = []
+        for thread_ref, lane in self._owned_lanes:
+            thread = thread_ref()
+            if thread is not None and thread.is_alive():
+                alive.append((thread_ref, lane))
+            else:
+                self._retire(lane)
+        self._owned_lanes = alive
+
+    def _retire(self, lane):
+        """Folds the counters of a lane which nobody writes anymore into the retired lane and frees it."""
+        counters = self._counters
+        retired_start = _RETIRED_LANE * self._lane_size
+        start = lane * self._lane_size
+        for i in range(self._lane_size):
+            value = counters[start + i]
+            if value:
+                counters[retired_start + i] += value
+                counters[start + i] = 0
+        _PID.pack_into(self._mmap, self._pids_offset + lane * _PID.size, 0)
+
+    def sum(self, index):
+        """Returns the totals of the counters of the command over all of the lanes of all of the processes."""
+        counters = self._counters
+        stride = self._lane_size
+        start = index * self.counter_count
+        end = (self.max_lanes + 1) * stride
+        with self._shared():
+            return [sum(counters[start + i:end:stride]) for i in range(self.counter_count)]
+
+    def zero(self):
+        """Zeroes all of the counters, only meaningful while nothing is recorded."""
+        with self._exclusive():
+            self._mmap[self._counters_offset:] = bytes(len(self._mmap) - self._counters_offset)
+
+
+class _FileLock:
+    """Locks the file against the other processes, and the other threads of this one."""
+
+    __slots__ = ('file', 'operation')
+
+    def __init__(self, file, operation):
+        self.file = file
+        self.operation = operation
+
+    def __enter__(self):
+        self.file._lock.acquire()
+        try:
+            fcntl.flock(self.file._fd, self.operation)
+        except BaseException:
+            self.file._lock.release()
+            raise
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        try:
+            fcntl.flock(self.file._fd, fcntl.LOCK_UN)
+        finally:
+            self.file._lock.release()
+
+
+class SharedCounters:
+    """The counters of a command in a SharedCounterFile, with the same interface as ShardedCounters."""
+
+    def __init__(self, file, index):
+        self._file = file
+        self._index = index
+        self._local = threading.local()
+        self._size = file.counter_count
+        self._unshared = ShardedCounters(self._size)  # of the threads without a lane
+
+    def shard(self):
+        """Returns the counters of the current thread in its lane. Only the owner thread may write into them."""
+        try:
+            return self._local.counts
+        except AttributeError:
+            return self._new_shard()
+
+    def _new_shard(self):
+        file = self._file
+        local = _thread_lanes.__dict__
+        lane = local.get(file)
+        if lane is None or lane[0] != os.getpid():
+            lane = (os.getpid(), file._claim_lane())
+            local[file] = lane
+
+        if lane[1] is None:  # all of the lanes are taken: counted in this process only
+            counts = self._unshared.shard()
+        else:
+            counts = file._lane_counters(lane[1], self._index)
+        self._local.counts = counts
+        return counts
+
+    def sum(self):
+        return [shared + unshared for shared, unshared in zip(self._file.sum(self._index), self._unshared.sum())]
+
+
+# the lane of every thread in every file, by file
+_thread_lanes = threading.local()
+_open_files = weakref.WeakSet()
+
+
+def _after_fork_in_child():
+    for file in list(_open_files):
+        file._after_fork_in_child()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
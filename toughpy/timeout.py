@@ -0,0 +1,159 @@
+import asyncio
+import contextvars
+import queue
+import threading
+from concurrent.futures import Future, wait
+from toughpy.duration import seconds_of
+
+DEFAULT_MAX_WORKERS = 32
+
+
+class AttemptTimeoutError(TimeoutError):
+    """Raised when an attempt does not complete within its timeout. It is a TimeoutError for the error predicates."""
+
+    def __init__(self, timeout):
+        super().__init__(timeout)
+        self.timeout = timeout
+
+    def __str__(self):
+        return 'The attempt did not complete in {0:.3f}s'.format(self.timeout)
+
+
+class _AttemptExecutor:
+    """
+    A thread pool running the attempts which have a timeout. The number of threads never exceeds `max_workers`;
+    they are started on demand and are daemons, so that attempts abandoned after a timeout cannot keep the
+    interpreter from exiting. An attempt that is still queued when it times out is cancelled and never runs.
+    """
+
+    def __init__(self, max_workers):
+        if max_workers <= 0:
+            raise ValueError('`max_workers` should be greater than 0.')
+
+        self.max_workers = max_workers
+        self._queue = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._workers = 0
+        self._idle_workers = 0
+        self._shut_down = False
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        with self._lock:
+            shut_down = self._shut_down
+            if not shut_down:
+                self._queue.put((future, fn, args, kwargs))
+                if self._idle_workers < self._queue.qsize() and self._workers < self.max_workers:
+                    self._workers += 1
+                    threading.Thread(target=self._work, name='toughpy-attempt-%d' % self._workers,
+                                     daemon=True).start()
+
+        if shut_down:  # raced with configure_executor: the workers of this pool are leaving
+            return _get_executor().submit(fn, *args, **kwargs)
+        return future
+
+    def shutdown(self):
+        """Lets every worker exit once the attempts queued so far are done. Further attempts go to the new pool."""
+        with self._lock:
+            self._shut_down = True
+            for _ in range(self._workers):
+                self._queue.put(None)
+
+    def _work(self):
+        while True:
+            with self._lock:
+                self._idle_workers += 1
+            item = self._queue.get()
+            with self._lock:
+                self._idle_workers -= 1
+            if item is None:
+                return
+
+            future, fn, args, kwargs = item
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(fn(*args, **kwargs))
+                except BaseException as e:
+                    future.set_exception(e)
+
+            del item, future, fn, args, kwargs  # do not pin the last attempt while idle
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def configure_executor(max_workers=DEFAULT_MAX_WORKERS):
+    """
+    Replaces the thread pool running the attempts with a timeout. The threads of the previous pool finish their
+    current and queued attempts and exit afterwards.
+    """
+    global _executor
+    with _executor_lock:
+        previous, _executor = _executor, _AttemptExecutor(max_workers)
+
+    if previous is not None:
+        previous.shutdown()
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = _AttemptExecutor(DEFAULT_MAX_WORKERS)
+
+    return _executor
+
+
+# noinspection PyProtectedMember
+def call_with_timeout(fn, args, kwargs, timeout, retry_metrics=None):
+    """
+    Runs `fn` on the attempt executor and waits for at most `timeout` (a Duration or seconds). Raises
+    AttemptTimeoutError if it takes longer; the call is then abandoned, i.e. left running in the background
+    with its outcome ignored. The context, e.g. the deadline, is propagated to the executor thread.
+    """
+    timeout = seconds_of(timeout)
+    future = _get_executor().submit(contextvars.copy_context().run, fn, *args, **kwargs)
+    wait((future,), timeout)  # not future.result(timeout) which cannot tell a timeout from a TimeoutError of fn
+    if future.done():
+        return future.result()
+
+    if retry_metrics is not None:
+        retry_metrics._increment_timed_out_attempts()
+    if not future.cancel() and retry_metrics is not None:
+        retry_metrics._increment_abandoned_attempts()
+
+    raise AttemptTimeoutError(timeout)
+
+
+def _consume_outcome(task):
+    if not task.cancelled():
+        task.exception()  # a task ignoring the cancellation must not log an unretrieved exception
+
+
+# noinspection PyProtectedMember
+async def call_with_timeout_async(fn, args, kwargs, timeout, retry_metrics=None):
+    """Awaits `fn` for at most `timeout`, cancels it and raises AttemptTimeoutError if it takes longer."""
+    timeout = seconds_of(timeout)
+    task = asyncio.ensure_future(fn(*args, **kwargs))
+    try:
+        await asyncio.wait((task,), timeout=timeout)
+    except asyncio.CancelledError:
+        task.cancel()
+        raise
+
+    if task.done():
+        return task.result()
+
+    task.cancel()
+    task.add_done_callback(_consume_outcome)
+    if retry_metrics is not None:
+        retry_metrics._increment_timed_out_attempts()
+    raise AttemptTimeoutError(timeout)
+
+
+__all__ = [
+    'AttemptTimeoutError',
+    'configure_executor'
+]
@@ -1,9 +1,15 @@
+import inspect
+import time
+import six
+
 _list_or_set = (list, set)
 _list_or_tuple = (list, tuple)
 _numeric_types = (int, float)
 
 UNDEFINED = object()
 
+monotonic_ns = time.monotonic_ns
+
 
 def is_exception_type(obj):
     return isinstance(obj, type) and issubclass(obj, BaseException)
@@ -54,6 +60,25 @@ def get_command_name(fn):
     return cmd_name
 
 
+def decorate_with(fn, execute, execute_async):
+    """
+    Wraps `fn` so that its calls go through `execute(fn, *args, **kwargs)`, or through `await execute_async(fn,
+    *args, **kwargs)` for a coroutine function. Backs the `__call__` of the decorating classes.
+    """
+    if inspect.iscoroutinefunction(fn):
+        @six.wraps(fn)
+        async def async_decorator(*args, **kwargs):
+            return await execute_async(fn, *args, **kwargs)
+
+        return async_decorator
+
+    @six.wraps(fn)
+    def decorator(*args, **kwargs):
+        return execute(fn, *args, **kwargs)
+
+    return decorator
+
+
 def command(name):
     def decorate(func):
         func.__command_name__ = name
@@ -76,5 +101,6 @@ __all__ = [
     'is_number',
     'is_list_or_tuple_of_numbers',
     'qualified_name',
-    'get_command_name'
+    'get_command_name',
+    'monotonic_ns'
 ]